@@ -0,0 +1,434 @@
+# --- File: ./benchmark_pipeline.py ---
+"""
+Micro-benchmarks for the indexing pipeline.
+
+Each subcommand times one stage of processing in isolation so that changes to the
+pipeline can be compared against the previous behaviour on the same corpus.
+
+Usage:
+    python benchmark_pipeline.py nlp --pages 500 --batch-size 32
+    python benchmark_pipeline.py nlp --corpus ./sample_texts
+    python benchmark_pipeline.py entities --sizes 1000 10000 100000
+    python benchmark_pipeline.py relationships --entities 500 2000
+    python benchmark_pipeline.py embeddings --chunks 1024 --backends ollama sentence-transformers
+    python benchmark_pipeline.py pipeline --docs 50 --pages-per-doc 4 --latency-ms 20
+    python benchmark_pipeline.py search --docs 200 --queries 100
+    python benchmark_pipeline.py broker
+
+The pipeline and search benchmarks are hermetic: they index a synthetic corpus into a
+scratch database with the fake embedding backend and the canned LLM responder, so
+they need neither Ollama nor the real index and give the same numbers on any machine
+(they still need the spaCy model).
+"""
+import argparse
+import contextlib
+import io
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from itertools import combinations
+from pathlib import Path
+
+project_dir = Path(__file__).resolve().parent
+sys.path.append(str(project_dir))
+
+from project.config import (
+    NLP_BATCH_SIZE, EMBEDDING_BATCH_SIZE,
+    FAKE_EMBEDDING_LATENCY_MS, FAKE_EMBEDDING_PER_TEXT_MS, FAKE_EMBEDDING_MAX_BATCH, FAKE_EMBEDDING_PARALLEL
+)
+
+SYNTHETIC_NAMES = ["John Smith", "Maria Lopez", "Acme Corporation", "the Department of Justice", "Wei Chen",
+                   "Northwind Traders", "Sarah O'Connor", "the Federal Reserve", "Ahmed Hassan", "Globex Inc."]
+SYNTHETIC_PLACES = ["New York", "London", "Paris", "Chicago", "Berlin", "Tokyo", "Toronto", "Madrid"]
+SYNTHETIC_VERBS = ["met with", "wrote to", "paid", "called", "sued", "hired", "visited", "emailed"]
+
+
+# --- Corpus helpers ---
+def _synthetic_pages(page_count, words_per_page=300, seed=42):
+    """Builds a deterministic corpus of entity-dense pages so runs are comparable."""
+    rng = random.Random(seed)
+    pages = []
+    for _ in range(page_count):
+        sentences, word_count = [], 0
+        while word_count < words_per_page:
+            sentence = (f"On {rng.randint(1, 28)} March {rng.randint(1990, 2024)}, {rng.choice(SYNTHETIC_NAMES)} "
+                        f"{rng.choice(SYNTHETIC_VERBS)} {rng.choice(SYNTHETIC_NAMES)} in {rng.choice(SYNTHETIC_PLACES)} "
+                        f"about the ${rng.randint(1, 900)},000 transfer.")
+            sentences.append(sentence)
+            word_count += len(sentence.split())
+        pages.append(" ".join(sentences))
+    return pages
+
+def _corpus_pages(corpus_dir, page_limit):
+    """Loads .txt files from a directory and paginates them the same way the pipeline does."""
+    from processing_pipeline import _paginate_text
+    pages = []
+    for path in sorted(Path(corpus_dir).rglob("*.txt")):
+        text = path.read_text(encoding='utf-8', errors='ignore').strip()
+        if text: pages.extend(_paginate_text(text).values())
+        if page_limit and len(pages) >= page_limit: break
+    return pages[:page_limit] if page_limit else pages
+
+
+# --- Benchmarks ---
+def _time_it(label, func, unit_count, unit_name):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    rate = unit_count / elapsed if elapsed > 0 else float('inf')
+    print(f"  {label:<28} {elapsed:8.2f}s   {rate:10.1f} {unit_name}/sec")
+    return rate
+
+def benchmark_nlp(args):
+    from processing_pipeline import load_spacy_model
+    pages = _corpus_pages(args.corpus, args.pages) if args.corpus else _synthetic_pages(args.pages)
+    if not pages:
+        print("[ERROR] No pages to benchmark.")
+        return
+
+    print("[INFO] Loading spaCy model...")
+    nlp = load_spacy_model()
+    pages = [p for p in pages if len(p) <= nlp.max_length]
+    print(f"--- NLP Benchmark: {len(pages)} pages, batch size {args.batch_size} ---")
+
+    # Warm-up so model lazy-initialisation is not charged to the first run.
+    list(nlp.pipe(pages[:min(len(pages), 8)]))
+
+    def per_page():
+        for text in pages: _ = nlp(text).ents
+
+    def batched():
+        for doc_nlp in nlp.pipe(pages, batch_size=args.batch_size): _ = doc_nlp.ents
+
+    baseline = _time_it("per-page nlp()", per_page, len(pages), "pages")
+    piped = _time_it(f"nlp.pipe(batch_size={args.batch_size})", batched, len(pages), "pages")
+    print(f"  Speedup: {piped / baseline:.2f}x")
+
+
+def _entity_db(existing_entities):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE entities (id INTEGER PRIMARY KEY, text TEXT NOT NULL, label TEXT NOT NULL, UNIQUE(text, label))")
+    conn.execute("CREATE INDEX idx_entity_label ON entities (label)")
+    conn.executemany("INSERT INTO entities (text, label) VALUES (?, ?)", existing_entities)
+    conn.commit()
+    return conn
+
+def benchmark_entities(args):
+    from processing_pipeline import _resolve_entity_ids
+    labels = ["PERSON", "ORG", "GPE", "DATE", "LOC"]
+    print(f"--- Entity ID Resolution Benchmark ({args.overlap:.0%} of each document's entities already known) ---")
+    for size in args.sizes:
+        entities_list = [(f"Entity {i}", labels[i % len(labels)]) for i in range(size)]
+        existing = entities_list[:int(size * args.overlap)] + [(f"Other {i}", "ORG") for i in range(size)]
+        print(f" {size} entities:")
+
+        conn = _entity_db(existing)
+        def per_entity():
+            conn.executemany("INSERT OR IGNORE INTO entities (text, label) VALUES (?, ?)", entities_list)
+            entity_id_map = {}
+            for text, label in entities_list:
+                res = conn.execute("SELECT id FROM entities WHERE text = ? AND label = ?", (text, label)).fetchone()
+                if res: entity_id_map[(text, label)] = res[0]
+        baseline = _time_it("per-entity SELECT loop", per_entity, size, "entities")
+        conn.close()
+
+        conn = _entity_db(existing)
+        resolved = {}
+        def bulk():
+            resolved.update(_resolve_entity_ids(conn.cursor(), entities_list))
+        bulk_rate = _time_it("temp table join", bulk, size, "entities")
+        conn.close()
+
+        if len(resolved) != size:
+            print(f"  [ERROR] Bulk resolver returned {len(resolved)} IDs for {size} entities.")
+        print(f"  Speedup: {bulk_rate / baseline:.2f}x")
+
+
+# Stand-in for a spaCy Span: the relationship extractor only reads these attributes.
+FakeSpan = namedtuple("FakeSpan", ["text", "label_", "start_char", "end_char"])
+
+def _pathological_sentence(entity_count, seed=42):
+    """One run-on 'sentence' (as produced by bad OCR) packed with entities a few words apart."""
+    rng = random.Random(seed)
+    parts, ents, pos = [], [], 0
+    for _ in range(entity_count):
+        filler = " ".join(rng.choice(["and", "then", "the", "of", "to", "with"]) for _ in range(rng.randint(1, 12))) + " "
+        parts.append(filler); pos += len(filler)
+        name = rng.choice(SYNTHETIC_NAMES)
+        ents.append(FakeSpan(name, "PERSON", pos, pos + len(name)))
+        parts.append(name); pos += len(name)
+    return "".join(parts), ents
+
+def _legacy_relationships(ents, text):
+    """The previous all-pairs implementation, kept here as the benchmark baseline."""
+    found = []
+    for ent1, ent2 in combinations(list(dict.fromkeys(ents)), 2):
+        start, end = min(ent1.end_char, ent2.end_char), max(ent1.start_char, ent2.start_char)
+        if end > start and (end - start) < 75:
+            phrase = ' '.join(text[start:end].strip().split())
+            if phrase:
+                subj = (ent1.text.strip(), ent1.label_) if ent1.start_char < ent2.start_char else (ent2.text.strip(), ent2.label_)
+                obj = (ent2.text.strip(), ent2.label_) if ent1.start_char < ent2.start_char else (ent1.text.strip(), ent1.label_)
+                if subj[0] and obj[0]: found.append((subj, obj, phrase))
+    return found
+
+def benchmark_relationships(args):
+    from project.nlp_utils import extract_relationships
+    print("--- Relationship Extraction Benchmark (single run-on sentence) ---")
+    for entity_count in args.entities:
+        text, ents = _pathological_sentence(entity_count)
+        print(f" {entity_count} entities, {len(text)} chars:")
+        legacy, windowed = [], []
+        baseline = _time_it("itertools.combinations", lambda: legacy.extend(_legacy_relationships(ents, text)), entity_count, "entities")
+        linear = _time_it("two-pointer window", lambda: windowed.extend(r[:3] for r in extract_relationships(ents, text)), entity_count, "entities")
+        if legacy != windowed:
+            print(f"  [ERROR] Results differ: {len(legacy)} legacy vs {len(windowed)} windowed relationships.")
+        print(f"  {len(windowed)} relationships, speedup: {linear / baseline:.2f}x")
+
+
+def _embed_chunk_set(args):
+    """The chunk texts the pipeline would embed for the corpus (standard chunks only)."""
+    from processing_pipeline import _chunk_pages
+    pages = _corpus_pages(args.corpus, None) if args.corpus else _synthetic_pages(max(1, args.chunks // 2))
+    texts = [text for _, text in _chunk_pages(dict(enumerate(pages, start=1)))]
+    return texts[:args.chunks]
+
+def benchmark_embeddings(args):
+    import numpy as np
+    from project.embedding_backends import create_backend
+    texts = _embed_chunk_set(args)
+    if not texts:
+        print("[ERROR] No chunks to benchmark.")
+        return
+    batches = [texts[i:i + args.batch_size] for i in range(0, len(texts), args.batch_size)]
+    print(f"--- Embedding Backend Benchmark: {len(texts)} chunks, batch size {args.batch_size}, {args.threads} threads ---")
+
+    vectors_by_backend = {}
+    for name in args.backends:
+        print(f" {name}:")
+        try:
+            backend = create_backend(name)
+            backend.embed(texts[:min(len(texts), 8)])  # Warm-up: model load, server connection.
+        except Exception as e:
+            print(f"  [SKIP] {type(e).__name__}: {e}")
+            continue
+
+        vectors = []
+        _time_it("sequential batches", lambda: [vectors.extend(backend.embed(batch)) for batch in batches], len(texts), "chunks")
+
+        def threaded():
+            # Each thread sends its share of the batches, like concurrent workers or web requests would.
+            shares = [batches[i::args.threads] for i in range(args.threads)]
+            threads = [threading.Thread(target=lambda share=share: [backend.embed(batch) for batch in share]) for share in shares]
+            for thread in threads: thread.start()
+            for thread in threads: thread.join()
+        if args.threads > 1:
+            _time_it(f"{args.threads} threads", threaded, len(texts), "chunks")
+
+        matrix = np.asarray(vectors, dtype=np.float32)
+        print(f"  {matrix.shape[1]}-dim vectors")
+        vectors_by_backend[name] = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+    names = list(vectors_by_backend)
+    for other in names[1:]:
+        first, second = vectors_by_backend[names[0]], vectors_by_backend[other]
+        if first.shape != second.shape:
+            print(f"  [WARN] {names[0]} and {other} produce differently shaped vectors: {first.shape} vs {second.shape}.")
+            continue
+        similarity = np.sum(first * second, axis=1)
+        print(f" {names[0]} vs {other}: mean cosine similarity {similarity.mean():.4f} (min {similarity.min():.4f}) on the same chunks")
+
+
+# --- Hermetic index ---
+def _use_offline_stand_ins(args, scratch_dir):
+    """
+    Points everything the pipeline and search touch at `scratch_dir` and the offline
+    stand-ins: the fake embedding backend (with the latency from `args`), the canned
+    LLM, a scratch database and embedding cache, and no embedding broker.
+    """
+    import processing_pipeline
+    from project import embeddings, embedding_cache, llm
+    from project.embedding_backends import use_backend
+    backend = use_backend("fake", latency_ms=args.latency_ms, per_text_ms=args.per_text_ms,
+                          max_batch=args.max_batch, parallel=args.parallel)
+    llm.use_backend("canned")
+    embeddings.EMBEDDING_BROKER_ENABLED = False
+    embedding_cache.EMBEDDING_CACHE_FILE = scratch_dir / "embedding_cache.db"
+    processing_pipeline.DATABASE_FILE = scratch_dir / "benchmark.db"
+    return backend
+
+def _register_synthetic_documents(conn, docs_dir, doc_count, pages_per_doc):
+    """Writes `doc_count` synthetic TXT files and registers them as 'New'. Returns their IDs and the page count."""
+    from processing_pipeline import _paginate_text
+    docs_dir.mkdir()
+    doc_ids, page_total = [], 0
+    for i in range(doc_count):
+        path = docs_dir / f"doc_{i:05d}.txt"
+        text = "\n\n".join(_synthetic_pages(pages_per_doc, seed=i))
+        path.write_text(text, encoding='utf-8')
+        # An absolute relative_path resolves to itself, so the files need not live in DOCUMENTS_DIR.
+        cursor = conn.execute(
+            "INSERT INTO documents (relative_path, file_hash, file_type, status, status_message, file_size_bytes) VALUES (?, ?, 'TXT', 'New', 'Ready for processing', ?)",
+            (str(path), f"benchmark-{i}", path.stat().st_size))
+        doc_ids.append(cursor.lastrowid)
+        page_total += len(_paginate_text(text))
+    conn.commit()
+    return doc_ids, page_total
+
+def _build_hermetic_index(args, scratch_dir):
+    """Indexes a synthetic corpus into a scratch database. Returns the fake backend, document IDs and page count."""
+    import processing_pipeline
+    from storage_setup import create_unified_index
+    backend = _use_offline_stand_ins(args, scratch_dir)
+    with contextlib.redirect_stdout(io.StringIO()):
+        create_unified_index(processing_pipeline.DATABASE_FILE)
+        processing_pipeline.load_spacy_model()
+    conn = processing_pipeline.get_db_conn()
+    try:
+        doc_ids, page_total = _register_synthetic_documents(conn, scratch_dir / "documents", args.docs, args.pages_per_doc)
+    finally:
+        conn.close()
+    return backend, doc_ids, page_total
+
+def _process_quietly(doc_ids, text_only=False):
+    import processing_pipeline
+    with contextlib.redirect_stdout(io.StringIO()):
+        for doc_id in doc_ids:
+            processing_pipeline.process_document(doc_id, text_only=text_only)
+
+def benchmark_pipeline(args):
+    import processing_pipeline
+    with tempfile.TemporaryDirectory(prefix="redleaf-bench-") as scratch:
+        backend, doc_ids, page_total = _build_hermetic_index(args, Path(scratch))
+        print(f"--- Hermetic Pipeline Benchmark: {len(doc_ids)} TXT documents, {page_total} pages, fake embeddings "
+              f"({args.latency_ms} ms/call + {args.per_text_ms} ms/text, max batch {args.max_batch or 'unlimited'}) ---")
+
+        _time_it("text tier (text_only)", lambda: _process_quietly(doc_ids, text_only=True), page_total, "pages")
+        calls_before = backend.calls
+        _time_it("full process_document", lambda: _process_quietly(doc_ids), page_total, "pages")
+        # Unchanged pages are reused from the stored hashes, so this measures the no-op re-index path.
+        _time_it("re-index, nothing changed", lambda: _process_quietly(doc_ids), page_total, "pages")
+
+        conn = processing_pipeline.get_db_conn()
+        try:
+            statuses = dict(conn.execute("SELECT status, COUNT(*) FROM documents GROUP BY status").fetchall())
+            chunks = conn.execute("SELECT COUNT(*) FROM embedding_chunks").fetchone()[0]
+        finally:
+            conn.close()
+        print(f"  {chunks} chunks embedded in {backend.calls - calls_before} backend calls; document statuses: {statuses}")
+        if statuses.get('Indexed', 0) != len(doc_ids):
+            print(f"  [ERROR] Expected all {len(doc_ids)} documents to be 'Indexed'.")
+
+def _synthetic_queries(count, seed=7):
+    rng = random.Random(seed)
+    return [f"{rng.choice(SYNTHETIC_NAMES)} {rng.choice(SYNTHETIC_VERBS)} {rng.choice(SYNTHETIC_PLACES)}" for _ in range(count)]
+
+def benchmark_search(args):
+    import processing_pipeline
+    from project.assistant_core import BaseAssistant, _internal_fts_search, _internal_semantic_search
+    from project.config import REASONING_MODEL
+    from project.prompts import RECURSIVE_STUDY_PROMPT
+    with tempfile.TemporaryDirectory(prefix="redleaf-bench-") as scratch:
+        _, doc_ids, page_total = _build_hermetic_index(args, Path(scratch))
+        print(f"[INFO] Indexing {len(doc_ids)} synthetic documents ({page_total} pages) with fake embeddings...")
+        _process_quietly(doc_ids)
+
+        queries = _synthetic_queries(args.queries)
+        print(f"--- Hermetic Search Benchmark: {len(queries)} queries over {page_total} pages ---")
+        conn = processing_pipeline.get_db_conn()
+        try:
+            hits = []
+            _time_it("FTS (keyword)", lambda: [hits.append(len(_internal_fts_search(conn, q))) for q in queries], len(queries), "queries")
+            _time_it("sqlite-vec (semantic)", lambda: [hits.append(len(_internal_semantic_search(conn, q))) for q in queries], len(queries), "queries")
+            if not any(hits):
+                print("  [ERROR] No query returned any results.")
+
+            # One assistant reasoning step per query, answered by the canned LLM.
+            assistant = BaseAssistant(reasoning_model=REASONING_MODEL, available_tools={}, router_prompt="")
+            def decide():
+                for q in queries:
+                    prompt = RECURSIVE_STUDY_PROMPT.format(goal=q, current_notes="", system_stats="", persona=assistant.persona)
+                    assistant.get_assistant_response([{"role": "system", "content": prompt}], use_json=True)
+            _time_it("assistant decision (canned)", decide, len(queries), "steps")
+        finally:
+            conn.close()
+
+
+def benchmark_broker(args):
+    """Smoke test: a broker process on the fake backend must start and answer round trips. Exits 1 if not."""
+    import multiprocessing
+    from project.embedding_broker import smoke_test, scratch_address
+    with tempfile.TemporaryDirectory(prefix="redleaf-bench-") as scratch:
+        # A private address, so a broker the app is running is neither used nor disturbed.
+        address = scratch_address(scratch)
+        print(f"--- Embedding Broker Smoke Test ({args.backend} backend) ---")
+        start = time.perf_counter()
+        try:
+            stats = smoke_test(multiprocessing.get_context('spawn'), address, backend_name=args.backend)
+        except Exception as e:
+            print(f"  [FAIL] {type(e).__name__}: {e}")
+            sys.exit(1)
+    totals = stats['totals']
+    print(f"  [OK] Started and answered {totals['requests']} requests ({totals['texts']} texts in {totals['batches']} batches) "
+          f"in {time.perf_counter() - start:.2f}s")
+
+
+def _add_stand_in_arguments(parser):
+    parser.add_argument('--docs', type=int, default=50, help="Synthetic TXT documents to index.")
+    parser.add_argument('--pages-per-doc', type=int, default=4, help="Pages (of ~300 words) per document.")
+    parser.add_argument('--latency-ms', type=float, default=FAKE_EMBEDDING_LATENCY_MS, help="Simulated fixed cost of each embedding call.")
+    parser.add_argument('--per-text-ms', type=float, default=FAKE_EMBEDDING_PER_TEXT_MS, help="Simulated cost of each embedded text.")
+    parser.add_argument('--max-batch', type=int, default=FAKE_EMBEDDING_MAX_BATCH, help="Texts the simulated server embeds per batch (0 = unlimited).")
+    parser.add_argument('--parallel', type=int, default=FAKE_EMBEDDING_PARALLEL, help="Simulated concurrent embedding calls (0 = unlimited).")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark individual stages of the indexing pipeline.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    nlp_parser = subparsers.add_parser("nlp", help="Compare per-page spaCy calls against batched nlp.pipe().")
+    nlp_parser.add_argument('--corpus', type=str, default=None, help="Directory of .txt files to use instead of the synthetic corpus.")
+    nlp_parser.add_argument('--pages', type=int, default=500, help="Number of pages to process.")
+    nlp_parser.add_argument('--batch-size', type=int, default=NLP_BATCH_SIZE, help="nlp.pipe() batch size.")
+    nlp_parser.set_defaults(func=benchmark_nlp)
+
+    entities_parser = subparsers.add_parser("entities", help="Compare per-entity ID lookups against the bulk temp-table resolver.")
+    entities_parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help="Entity counts to benchmark.")
+    entities_parser.add_argument('--overlap', type=float, default=0.5, help="Fraction of entities that already exist in the table.")
+    entities_parser.set_defaults(func=benchmark_entities)
+
+    rel_parser = subparsers.add_parser("relationships", help="Compare all-pairs relationship extraction against the windowed scan.")
+    rel_parser.add_argument('--entities', type=int, nargs='+', default=[500, 1000, 2000], help="Entities per pathological sentence.")
+    rel_parser.set_defaults(func=benchmark_relationships)
+
+    embed_parser = subparsers.add_parser("embeddings", help="Compare embedding backends on the same chunk set.")
+    embed_parser.add_argument('--corpus', type=str, default=None, help="Directory of .txt files to chunk instead of the synthetic corpus.")
+    embed_parser.add_argument('--chunks', type=int, default=1024, help="Number of chunks to embed.")
+    embed_parser.add_argument('--batch-size', type=int, default=EMBEDDING_BATCH_SIZE, help="Chunks per embed() call.")
+    embed_parser.add_argument('--threads', type=int, default=4, help="Concurrent callers for the threaded run (1 to skip it).")
+    embed_parser.add_argument('--backends', nargs='+', default=['ollama', 'sentence-transformers'], help="Backends to compare.")
+    embed_parser.set_defaults(func=benchmark_embeddings)
+
+    pipeline_parser = subparsers.add_parser("pipeline", help="Index a synthetic corpus end to end with the fake embedding backend.")
+    _add_stand_in_arguments(pipeline_parser)
+    pipeline_parser.set_defaults(func=benchmark_pipeline)
+
+    search_parser = subparsers.add_parser("search", help="Time keyword, semantic and assistant queries against a synthetic index.")
+    _add_stand_in_arguments(search_parser)
+    search_parser.add_argument('--queries', type=int, default=100, help="Number of search queries.")
+    search_parser.set_defaults(func=benchmark_search)
+
+    broker_parser = subparsers.add_parser("broker", help="Smoke-test the embedding broker: start one and make round trips.")
+    broker_parser.add_argument('--backend', type=str, default="fake", help="Embedding backend the broker uses.")
+    broker_parser.set_defaults(func=benchmark_broker)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
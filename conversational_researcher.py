@@ -8,7 +8,6 @@ import html
 from datetime import datetime
 from pathlib import Path
 from collections import defaultdict
-import ollama
 
 # --- 1. Project Path Setup ---
 project_dir = Path(__file__).resolve().parent
@@ -18,6 +17,7 @@ sys.path.append(str(project_dir))
 from project import create_app
 from project.database import get_db
 from project.config import REASONING_MODEL, REDLEAF_BASE_URL
+from project import llm
 from project.assistant_core import (
     _internal_fts_search,
     _internal_semantic_search,
@@ -211,7 +211,7 @@ def main():
                     {"role": "user", "content": think_context}
                 ]
                 try:
-                    resp = ollama.chat(model=model_to_use, messages=think_msg, format='json')
+                    resp = llm.chat(model=model_to_use, messages=think_msg, format='json')
                     decision = json.loads(resp['message']['content'])
                 except:
                     decision = {"intent": "Clarify", "search": "None"}
@@ -235,7 +235,7 @@ def main():
                         {"role": "system", "content": "You are a Research Analyst. Update the Scratchpad with specific facts from the new evidence. PRESERVE [Doc ID] citations."},
                         {"role": "user", "content": f"OLD SCRATCHPAD:\n{scratchpad}\n\nNEW EVIDENCE:\n{new_knowledge}"}
                     ]
-                    learn_resp = ollama.chat(model=model_to_use, messages=learn_msg)
+                    learn_resp = llm.chat(model=model_to_use, messages=learn_msg)
                     scratchpad = learn_resp['message']['content']
 
                 # 4. RESPOND
@@ -247,7 +247,7 @@ def main():
                 respond_msg.append({"role": "user", "content": user_input})
 
                 print(f"{Style.GREEN}Curator > {Style.END}", end="", flush=True)
-                stream = ollama.chat(model=model_to_use, messages=respond_msg, stream=True)
+                stream = llm.chat(model=model_to_use, messages=respond_msg, stream=True)
                 
                 full_resp = ""
                 for chunk in stream:
@@ -6,7 +6,6 @@ from pathlib import Path
 import hashlib
 import datetime
 import os
-import fnmatch
 from lxml import etree as ET
 from email.utils import parsedate_to_datetime
 from typing import Union
@@ -19,6 +18,7 @@ project_dir = Path(__file__).resolve().parent
 sys.path.append(str(project_dir))
 
 from project.config import DOCUMENTS_DIR
+from project.file_scan import gather_files, gather_document_files, scan_file_hashes, format_scan_report, is_legacy_hash
 import curator_pipeline_v2 as pipeline
 
 # --- DuckDB Configuration ---
@@ -100,27 +100,7 @@ def setup_duckdb_schema():
     print("--- Schema setup complete. ---")
     conn.close()
 
-def _gather_files_recursively(base_dir: Path, target_dir: Path, supported_patterns: list, virtual_prefix: str = "") -> list:
-    """Helper to gather files, mapping them to a virtual prefix if using an .rlink alias."""
-    files = []
-    try:
-        for root, dirs, filenames in os.walk(target_dir):
-            for filename in filenames:
-                if any(fnmatch.fnmatch(filename.lower(), p.lower()) for p in supported_patterns):
-                    file_path = Path(root) / filename
-                    try:
-                        if virtual_prefix:
-                            rel_path_str = f"{virtual_prefix}/{file_path.relative_to(target_dir).as_posix()}"
-                        else:
-                            rel_path_str = file_path.relative_to(base_dir).as_posix()
-                        files.append((file_path, rel_path_str))
-                    except ValueError:
-                        continue
-    except Exception as e:
-        print(f"[WARN] Error scanning directory {target_dir}: {e}")
-    return files
-
-def discover_documents():
+def discover_documents(full_verify: bool = False):
     print(f"--- Scanning for documents in {DOCUMENTS_DIR} ---")
     db = get_db_conn()
     try:
@@ -140,43 +120,36 @@ def discover_documents():
         
     registered_count = 0
     restored_count = 0
-    supported_patterns = ["*.pdf", "*.txt", "*.html", "*.srt", "*.eml"]
+    migrated_count = 0
     
-    # Scan main directory
-    all_files_with_virtual_paths = _gather_files_recursively(DOCUMENTS_DIR, DOCUMENTS_DIR, supported_patterns)
-    
-    # Scan .rlink external directories
-    for rlink_file in DOCUMENTS_DIR.glob('*.rlink'):
-        if rlink_file.is_file():
-            try:
-                target_path_str = rlink_file.read_text(encoding='utf-8').strip()
-                target_dir = Path(target_path_str).resolve()
-                if target_dir.exists() and target_dir.is_dir():
-                    print(f"  [INFO] Following alias '{rlink_file.name}' to: {target_dir}")
-                    all_files_with_virtual_paths.extend(
-                        _gather_files_recursively(DOCUMENTS_DIR, target_dir, supported_patterns, virtual_prefix=rlink_file.name)
-                    )
-                else:
-                    print(f"  [WARN] Alias target does not exist or is not a directory: {target_dir}")
-            except Exception as e:
-                print(f"  [WARN] Failed to read alias file {rlink_file}: {e}")
+    # Scan main directory and .rlink external directories
+    all_files_with_virtual_paths = gather_document_files(DOCUMENTS_DIR)
 
     found_paths_exact = set()
-
+    candidates = []
     for file_path, rel_path_str in all_files_with_virtual_paths:
         lower_rel = rel_path_str.lower()
         if lower_rel in db_files_lower:
             rel_path_str = db_files_lower[lower_rel]
             
         found_paths_exact.add(rel_path_str)
+        candidates.append((file_path, rel_path_str))
+
+    # Files whose size, mtime and inode match the shared stat cache are not read again.
+    # Rows still holding pre-blake2b md5 hashes are re-read once so the hash can be migrated.
+    legacy_paths = {file_path for file_path, rel_path_str in candidates if rel_path_str in db_files and is_legacy_hash(db_files[rel_path_str])}
+    file_states, scan_report = scan_file_hashes([file_path for file_path, _ in candidates], full_verify=full_verify, legacy_md5_paths=legacy_paths)
+
+    for file_path, rel_path_str in candidates:
+        if file_path not in file_states: continue
         
-        stats = file_path.stat()
+        stats, current_hash_str, legacy_md5 = file_states[file_path]
         file_type = file_path.suffix[1:].upper()
 
-        hasher = hashlib.md5()
-        with open(file_path, 'rb') as f:
-            while chunk := f.read(65536): hasher.update(chunk)
-        current_hash_str = hasher.hexdigest()
+        if legacy_md5 is not None and db_files.get(rel_path_str) == legacy_md5:
+            db.execute("UPDATE documents SET file_hash = ? WHERE relative_path = ?", (current_hash_str, rel_path_str))
+            db_files[rel_path_str] = current_hash_str
+            migrated_count += 1
         
         if rel_path_str not in db_files or db_files.get(rel_path_str) != current_hash_str:
             print(f"Registering new/modified file: {rel_path_str}")
@@ -208,6 +181,8 @@ def discover_documents():
         db.execute("COMMIT;")
 
     db.close()
+    print(f"  [INFO] {format_scan_report(scan_report)}")
+    if migrated_count: print(f"  [INFO] Migrated {migrated_count} stored md5 hashes to blake2b.")
     print(f"\n--- Discovery complete. Registered {registered_count}. Restored {restored_count}. Trashed {missing_count}. ---")
 
 def reset_document_status(status_filter: str = None, file_type_filter: str = None):
@@ -282,13 +257,13 @@ def find_xml_matches_for_doc(doc_relative_path: str):
     target_srt_basename = Path(doc_relative_path).stem
     matches = []
     
-    all_xmls = _gather_files_recursively(DOCUMENTS_DIR, DOCUMENTS_DIR, ['*.xml'])
+    all_xmls = gather_files(DOCUMENTS_DIR, DOCUMENTS_DIR, {'.xml'})
     for rlink_file in DOCUMENTS_DIR.glob('*.rlink'):
         if rlink_file.is_file():
             try:
                 target_dir = Path(rlink_file.read_text(encoding='utf-8').strip())
                 if target_dir.exists() and target_dir.is_dir():
-                    all_xmls.extend(_gather_files_recursively(DOCUMENTS_DIR, target_dir, ['*.xml'], virtual_prefix=rlink_file.name))
+                    all_xmls.extend(gather_files(DOCUMENTS_DIR, target_dir, {'.xml'}, virtual_prefix=rlink_file.name))
             except Exception:
                 pass
                 
@@ -459,7 +434,8 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Redleaf Curator CLI with DuckDB.")
     subparsers = parser.add_subparsers(dest='command', required=True, help='Available commands')
     subparsers.add_parser('init-db', help="Initializes the DuckDB database and all tables.")
-    subparsers.add_parser('discover-docs', help="[Step 1] Scans for documents and registers them.")
+    discover_parser = subparsers.add_parser('discover-docs', help="[Step 1] Scans for documents and registers them.")
+    discover_parser.add_argument('--full-verify', action='store_true', help="Re-hash every file instead of skipping files whose size, mtime and inode are unchanged.")
     
     proc_parser = subparsers.add_parser('process-docs', help="[Step 2] Runs the high-throughput processing pipeline.")
     proc_subparsers = proc_parser.add_subparsers(dest='phase', required=True, help='Pipeline phase to run')
@@ -469,6 +445,7 @@ if __name__ == "__main__":
     run_all_parser.add_argument('--batch-size', type=int, default=128, help="Embedding batch size.")
     run_all_parser.add_argument('--gpu', action='store_true', help="Enable GPU acceleration.")
     run_all_parser.add_argument('--doc-limit', type=int, default=None, help="Process only N documents at a time to save RAM.")
+    run_all_parser.add_argument('--nlp-batch-size', type=int, default=pipeline.NLP_BATCH_SIZE, help="Number of pages per spaCy nlp.pipe() batch.")
     
     extract_parser = proc_subparsers.add_parser('extract', help='Phase 1: Extracts clean text from all new documents.')
     extract_parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 2, help="Number of parallel workers.")
@@ -476,6 +453,7 @@ if __name__ == "__main__":
     
     nlp_parser = proc_subparsers.add_parser('nlp', help='Phase 2: Performs spaCy NLP analysis on extracted text.')
     nlp_parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 2, help="Number of parallel workers.")
+    nlp_parser.add_argument('--nlp-batch-size', type=int, default=pipeline.NLP_BATCH_SIZE, help="Number of pages per spaCy nlp.pipe() batch.")
     
     # --- SWAPPED HELP TEXT AND DEFINITIONS ---
     proc_subparsers.add_parser('finalize', help='Phase 3: Commits all staged data to the final tables (Graph Data).')
@@ -509,14 +487,14 @@ if __name__ == "__main__":
     if args.command == 'init-db':
         setup_duckdb_schema()
     elif args.command == 'discover-docs': 
-        discover_documents()
+        discover_documents(full_verify=args.full_verify)
     elif args.command == 'process-docs':
         if args.phase == 'run-all':
-            pipeline.run_full_pipeline(workers=args.workers, batch_size=args.batch_size, use_gpu=args.gpu, doc_limit=args.doc_limit)
+            pipeline.run_full_pipeline(workers=args.workers, batch_size=args.batch_size, use_gpu=args.gpu, doc_limit=args.doc_limit, nlp_batch_size=args.nlp_batch_size)
         elif args.phase == 'extract':
             pipeline.phase_extract_text(workers=args.workers, doc_limit=args.doc_limit)
         elif args.phase == 'nlp':
-            pipeline.phase_nlp_analysis(workers=args.workers)
+            pipeline.phase_nlp_analysis(workers=args.workers, nlp_batch_size=args.nlp_batch_size)
         # Note: No logic change needed here, just the UI text changed
         elif args.phase == 'finalize':
             pipeline.phase_finalize_data()
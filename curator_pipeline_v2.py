@@ -1,8 +1,6 @@
 # --- File: ./curator_pipeline_v2.py ---
 import duckdb
 import spacy
-import ollama
-import numpy as np
 import fitz
 from bs4 import BeautifulSoup
 from concurrent.futures import ProcessPoolExecutor, as_completed
@@ -22,14 +20,18 @@ import multiprocessing
 import email
 from email.header import decode_header
 from email.utils import parsedate_to_datetime
-from itertools import combinations
 
 # Add project directory to allow imports from project config
 project_dir = Path(__file__).resolve().parent
 sys.path.append(str(project_dir))
 
 # --- FIXED IMPORT: Now pulling resolve_document_path from config ---
-from project.config import EMBEDDING_MODEL, DOCUMENTS_DIR, resolve_document_path
+from project.config import NLP_BATCH_SIZE, DOCUMENTS_DIR, EMBEDDING_BROKER_ENABLED, resolve_document_path
+from project.embeddings import embed_texts
+from project.embedding_broker import is_broker_running, start_broker
+from project.embedding_backends import embedding_model_id
+from project.nlp_utils import extract_relationships
+from project.embedding_cache import get_cache_stats
 
 DUCKDB_FILE = project_dir / "curator_workspace.duckdb"
 BATCH_STATE_FILE = project_dir / "curator_batch_state.json"
@@ -218,9 +220,29 @@ def phase_extract_text(workers, doc_limit=None):
     if ec > 0: print(f"[ACTION] Review '{LOG_FILE.name}'.")
 
 # --- PHASE 2: NLP ANALYSIS ---
-def _nlp_worker_process(pages_batch, temp_file_path):
+def _iter_nlp_pages(nlp, pages, batch_size):
+    """
+    Runs pages through nlp.pipe in batches, carrying (doc_id, page_number) as context.
+    If spaCy fails on a batch, that batch is retried one page at a time so a single
+    bad page does not lose its neighbours.
+    """
+    for start in range(0, len(pages), batch_size):
+        batch = pages[start:start + batch_size]
+        try:
+            analyzed = list(nlp.pipe(((text, (doc_id, page_number)) for doc_id, page_number, text in batch), batch_size=batch_size, as_tuples=True))
+        except Exception as e:
+            logging.error(f"NLP batch failed, retrying page by page: {e}", exc_info=True)
+            analyzed = []
+            for doc_id, page_number, text in batch:
+                try: analyzed.append((nlp(text), (doc_id, page_number)))
+                except Exception as page_e: logging.error(f"NLP FAILED for Doc ID {doc_id} Page {page_number}: {page_e}", exc_info=True)
+        for doc_nlp, (doc_id, page_number) in analyzed:
+            yield doc_id, page_number, doc_nlp
+
+def _nlp_worker_process(pages_batch, temp_file_path, nlp_batch_size=NLP_BATCH_SIZE):
     nlp = load_spacy_model()
     results = {'entities': [], 'chunks': [], 'relationships': [], 'standard_chunks': []}
+    pages_to_analyze = []
     for doc_id, page_number, page_text in pages_batch:
         if not page_text: continue
         
@@ -234,10 +256,12 @@ def _nlp_worker_process(pages_batch, temp_file_path):
                 results['standard_chunks'].append((doc_id, page_number, chunk_text))
 
         if len(page_text) > nlp.max_length: continue
+        pages_to_analyze.append((doc_id, page_number, page_text))
         
-        # --- GRAPH EXTRACTION (SUPER CHUNKS) ---
+    # --- GRAPH EXTRACTION (SUPER CHUNKS) ---
+    for doc_id, page_number, doc_nlp in _iter_nlp_pages(nlp, pages_to_analyze, max(1, nlp_batch_size)):
         try:
-            doc_nlp = nlp(page_text)
+            page_text = doc_nlp.text
             for ent in doc_nlp.ents:
                 if ent_text := ent.text.strip():
                     results['entities'].append((doc_id, page_number, ent_text, ent.label_))
@@ -248,23 +272,15 @@ def _nlp_worker_process(pages_batch, temp_file_path):
                             super_chunk_text = f"{ent.text} ({ent.label_}): {action_phrase}"
                             results['chunks'].append((doc_id, page_number, ent_text, ent.label_, super_chunk_text))
             for sent in doc_nlp.sents:
-                unique_ents = list(dict.fromkeys(sent.ents))
-                if len(unique_ents) < 2: continue
-                for ent1, ent2 in combinations(unique_ents, 2):
-                    start, end = min(ent1.end_char, ent2.end_char), max(ent1.start_char, ent2.start_char)
-                    if end > start and (end - start) < 75:
-                        phrase = ' '.join(page_text[start:end].strip().split())
-                        if phrase:
-                            subj = (ent1.text.strip(), ent1.label_) if ent1.start_char < ent2.start_char else (ent2.text.strip(), ent2.label_)
-                            obj = (ent2.text.strip(), ent2.label_) if ent1.start_char < ent2.start_char else (ent1.text.strip(), ent1.label_)
-                            if subj[0] and obj[0]: results['relationships'].append((doc_id, page_number, subj[0], subj[1], obj[0], obj[1], phrase))
+                for subj, obj, phrase, _ in extract_relationships(sent.ents, page_text):
+                    results['relationships'].append((doc_id, page_number, subj[0], subj[1], obj[0], obj[1], phrase))
         except Exception as e:
             logging.error(f"NLP FAILED for Doc ID {doc_id} Page {page_number}: {e}", exc_info=True)
             
     with open(temp_file_path, 'wb') as f:
         pickle.dump(results, f)
 
-def phase_nlp_analysis(workers):
+def phase_nlp_analysis(workers, nlp_batch_size=NLP_BATCH_SIZE):
     print("\n--- PHASE 2: Performing NLP Analysis ---")
     conn = get_db_conn()
     print("[INFO] Counting total pages for NLP analysis...")
@@ -283,7 +299,7 @@ def phase_nlp_analysis(workers):
 
     ctx = multiprocessing.get_context('spawn')
     with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as executor:
-        futures = [executor.submit(_nlp_worker_process, batch, TEMP_DIR / f"worker_{i}.pkl") for i, batch in enumerate(page_batches)]
+        futures = [executor.submit(_nlp_worker_process, batch, TEMP_DIR / f"worker_{i}.pkl", nlp_batch_size) for i, batch in enumerate(page_batches)]
         with tqdm(total=len(futures), desc="Processing Batches") as pbar:
             for future in as_completed(futures):
                 try: future.result()
@@ -387,16 +403,12 @@ def phase_finalize_data():
 def _batch_generator(items, batch_size):
     for i in range(0, len(items), batch_size): yield items[i:i + batch_size]
 
-def _embed_worker(batch):
-    results = []
+def _embed_worker(batch, batch_size):
     try:
-        for row in batch:
-            chunk_text = row[-1] # The text is always the last element in the input tuple
-            response = ollama.embeddings(model=EMBEDDING_MODEL, prompt=chunk_text)
-            embedding_bytes = np.array(response['embedding'], dtype=np.float32).tobytes()
-            # Append the binary blob to the existing row tuple
-            results.append(row + (embedding_bytes,))
-        return results
+        # The text is always the last element in the input tuple
+        blobs = embed_texts([row[-1] for row in batch], batch_size=batch_size)
+        # Append the binary blob to the existing row tuple
+        return [row + (blob,) for row, blob in zip(batch, blobs) if blob is not None]
     except Exception as e:
         tqdm.write(f"[WARN] An embedding generation failed: {e}")
         return []
@@ -433,13 +445,24 @@ def phase_generate_embeddings(workers, batch_size, use_gpu):
     sup_db_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM super_embedding_chunks").fetchone()[0] + 1
     
     ctx = multiprocessing.get_context('spawn')
+    # Share the web app's embedding broker when it is running, so both batch into the same Ollama calls.
+    broker_process = None
+    if EMBEDDING_BROKER_ENABLED:
+        if is_broker_running():
+            print("[INFO] Sending embeddings through the running embedding broker.")
+        else:
+            broker_process = start_broker(ctx)
+            if broker_process is not None:
+                print(f"[INFO] Started an embedding broker for this run (PID {broker_process.pid}).")
+            else:
+                print("[WARN] Could not start an embedding broker; workers will embed directly.")
     with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as executor:
         with tqdm(total=total_chunks, desc="Generating Embeddings") as pbar:
             
             # --- Process Standard Chunks ---
             if std_chunks_data:
                 batches = list(_batch_generator(std_chunks_data, batch_size))
-                futures = [executor.submit(_embed_worker, b) for b in batches]
+                futures = [executor.submit(_embed_worker, b, batch_size) for b in batches]
                 for future in as_completed(futures):
                     try:
                         result_rows = future.result()
@@ -460,7 +483,7 @@ def phase_generate_embeddings(workers, batch_size, use_gpu):
             # --- Process Super Chunks ---
             if sup_chunks_data:
                 batches = list(_batch_generator(sup_chunks_data, batch_size))
-                futures = [executor.submit(_embed_worker, b) for b in batches]
+                futures = [executor.submit(_embed_worker, b, batch_size) for b in batches]
                 for future in as_completed(futures):
                     try:
                         result_rows = future.result()
@@ -479,11 +502,24 @@ def phase_generate_embeddings(workers, batch_size, use_gpu):
                         tqdm.write(f"[FATAL] Super embedding database write failed: {e}")
                         raise e 
 
+    if broker_process is not None:
+        broker_process.terminate()
     conn.close()
+    _report_embedding_cache()
     print("[OK] Phase 4: Embedding Generation Complete.")
 
+def _report_embedding_cache():
+    try:
+        stats = get_cache_stats()['models'].get(embedding_model_id())
+    except Exception as e:
+        print(f"[WARN] Could not read embedding cache stats: {e}")
+        return
+    if stats:
+        hit_rate = f"{stats['hit_rate']:.1%}" if stats['hit_rate'] is not None else "n/a"
+        print(f"[INFO] Embedding cache: {stats['entries']} entries, {stats['hits']} hits, {stats['misses']} misses (hit rate {hit_rate}, all-time).")
+
 # --- FULL PIPELINE RUNNER ---
-def run_full_pipeline(workers, batch_size, use_gpu, doc_limit=None):
+def run_full_pipeline(workers, batch_size, use_gpu, doc_limit=None, nlp_batch_size=NLP_BATCH_SIZE):
     conn = get_db_conn()
     new_docs_count = conn.execute("SELECT COUNT(*) FROM documents WHERE status = 'New'").fetchone()[0]
     conn.close()
@@ -559,7 +595,7 @@ def run_full_pipeline(workers, batch_size, use_gpu, doc_limit=None):
     conn.close()
 
     if staged_text_count > 0:
-        phase_nlp_analysis(workers)
+        phase_nlp_analysis(workers, nlp_batch_size=nlp_batch_size)
         phase_finalize_data()
         phase_generate_embeddings(workers, batch_size, use_gpu)
         
@@ -601,5 +637,6 @@ if __name__ == "__main__":
     parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 4) - 1), help="Number of parallel workers")
     parser.add_argument("--batch-size", type=int, default=16, help="Embedding batch size")
     parser.add_argument("--use-gpu", action="store_true", help="Enable GPU for NLP/embedding generation (if supported)")
+    parser.add_argument("--nlp-batch-size", type=int, default=NLP_BATCH_SIZE, help="Number of pages per spaCy nlp.pipe() batch")
     args = parser.parse_args()
-    run_full_pipeline(workers=args.workers, batch_size=args.batch_size, use_gpu=args.use_gpu)
\ No newline at end of file
+    run_full_pipeline(workers=args.workers, batch_size=args.batch_size, use_gpu=args.use_gpu, nlp_batch_size=args.nlp_batch_size)
\ No newline at end of file
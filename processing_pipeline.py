@@ -3,27 +3,37 @@ import sqlite3
 import hashlib
 import traceback
 import os
+import time
 import datetime
 import re
 import email
 import json
-import fnmatch
+import pickle
+import shutil
 from email.header import decode_header
 from email.utils import parsedate_to_datetime
 from pathlib import Path
-from itertools import combinations
 from typing import Union, List
 
 import fitz
 import spacy
 from bs4 import BeautifulSoup
-import ollama
-import numpy as np
 import sqlite_vec
 
 # --- Configuration ---
 # FIXED: Importing absolute paths directly from config to prevent worker displacement
-from project.config import EMBEDDING_MODEL, resolve_document_path, DATABASE_FILE, DOCUMENTS_DIR
+from project.config import (
+    NLP_BATCH_SIZE, STREAMING_PAGE_THRESHOLD, STREAMING_WINDOW_PAGES, STAGING_DIR,
+    PARALLEL_SPLIT_PAGE_THRESHOLD, PARALLEL_MIN_RANGE_PAGES,
+    resolve_document_path, DATABASE_FILE, DOCUMENTS_DIR
+)
+from project.embeddings import embed_texts
+from project.embedding_backends import embedding_model_id
+from project.nlp_utils import extract_relationships, join_cues
+from project.memory import peak_rss_mb, reset_peak_rss
+from project.worker_pool import report_task_pages, task_outputs_accepted, send_task_output
+from project import browse_cache
+from project.file_scan import gather_document_files, scan_file_hashes, format_scan_report, is_legacy_hash
 
 SPACY_MODEL = "en_core_web_lg"
 CHUNK_SIZE = 400
@@ -202,6 +212,15 @@ def _extract_text_from_pdf_doc(doc: fitz.Document) -> dict:
         print(f"Error extracting text from PDF: {e}")
     return page_content_map
 
+def _pdf_page_count(file_path: Path) -> Union[int, None]:
+    """Reads a PDF's page count from its page tree without extracting anything; None if it cannot be opened."""
+    try:
+        with fitz.open(file_path) as pdf_doc:
+            return pdf_doc.page_count
+    except Exception as e:
+        print(f"  [WARN] Could not read the page count of {file_path.name}: {e}")
+        return None
+
 def _chunk_text(text: str, size: int, overlap: int) -> List[str]:
     if not text: return []
     words = text.split()
@@ -210,20 +229,68 @@ def _chunk_text(text: str, size: int, overlap: int) -> List[str]:
         chunks.append(" ".join(words[i:i + size]))
     return chunks
 
-def _generate_embeddings_for_page(page_text: str) -> list[tuple[str, bytes]]:
-    if not page_text.strip(): return []
-    chunks = _chunk_text(page_text, CHUNK_SIZE, CHUNK_OVERLAP)
-    embeddings_to_store = []
-    for chunk in chunks:
-        try:
-            response = ollama.embeddings(model=EMBEDDING_MODEL, prompt=chunk)
-            embedding_vector = response['embedding']
-            embedding_blob = np.array(embedding_vector, dtype=np.float32).tobytes()
-            embeddings_to_store.append((chunk, embedding_blob))
-        except Exception as e:
-            print(f"WORKER WARNING: Could not generate embedding for a chunk. Error: {e}")
-            continue
-    return embeddings_to_store
+def _chunk_pages(page_content_map: dict) -> list[tuple[int, str]]:
+    """Splits every page into standard embedding chunks, returning (page_number, chunk_text) pairs."""
+    chunks = []
+    for page_num, page_text in page_content_map.items():
+        if not page_text or not page_text.strip(): continue
+        chunks.extend((page_num, chunk) for chunk in _chunk_text(page_text, CHUNK_SIZE, CHUNK_OVERLAP))
+    return chunks
+
+def _embed_document_chunks(doc_id, standard_chunks: list, super_chunks: list) -> tuple[list, list]:
+    """
+    The embedding stage: sends every standard and super chunk of a document to
+    the embedding backend in batches. Chunks that fail to embed are dropped.
+    """
+    texts = [chunk_text for _, chunk_text in standard_chunks] + [c["chunk_text"] for c in super_chunks]
+    if not texts:
+        return [], []
+    blobs = embed_texts(texts)
+
+    embeddings = [
+        (doc_id, page_num, chunk_text, blob)
+        for (page_num, chunk_text), blob in zip(standard_chunks, blobs)
+        if blob is not None
+    ]
+    embedded_super_chunks = [
+        dict(chunk_data, embedding=blob)
+        for chunk_data, blob in zip(super_chunks, blobs[len(standard_chunks):])
+        if blob is not None
+    ]
+    return embeddings, embedded_super_chunks
+
+def _page_hash(page_text: str) -> str:
+    """
+    Content hash of one page. The embedding model and chunking parameters are
+    folded in so that changing either invalidates every stored page.
+    """
+    signature = f"{embedding_model_id()}|{CHUNK_SIZE}|{CHUNK_OVERLAP}|"
+    return hashlib.sha256((signature + (page_text or "")).encode('utf-8')).hexdigest()
+
+def _load_page_hashes(conn, doc_id) -> dict:
+    """Returns the {page_number: content_hash} recorded at the document's last successful index."""
+    return {row['page_number']: row['content_hash'] for row in conn.execute(
+        "SELECT page_number, content_hash FROM document_page_hashes WHERE doc_id = ?", (doc_id,)
+    ).fetchall()}
+
+def _plan_page_updates(stored: dict, page_content_map: dict) -> tuple[dict, dict, Union[list, None]]:
+    """
+    Diffs the current pages against the stored page hashes. Returns (page_hashes,
+    pages_to_process, changed_pages). changed_pages is None when there is no
+    usable history and every page must be rebuilt.
+    """
+    page_hashes = {page_num: _page_hash(text) for page_num, text in page_content_map.items()}
+    if not stored:
+        return page_hashes, page_content_map, None
+
+    changed = [page_num for page_num, page_hash in page_hashes.items() if stored.get(page_num) != page_hash]
+    return page_hashes, {page_num: page_content_map[page_num] for page_num in changed}, changed
+
+def _pages_to_replace(stored: dict, page_hashes: dict, changed: Union[list, None]) -> Union[list, None]:
+    """Changed pages plus pages that no longer exist, or None for a full rebuild."""
+    if changed is None:
+        return None
+    return sorted(changed + [page_num for page_num in stored if page_num not in page_hashes])
 
 def _decode_header_text(header_value):
     """Decodes email headers to handle different charsets."""
@@ -283,15 +350,19 @@ def _parse_eml_content(eml_bytes: bytes) -> dict:
         
     return {'metadata': metadata, 'body': final_body}
 
-def _extract_data_from_pages(page_content_map: dict) -> dict:
+def _extract_data_from_pages(page_content_map: dict, batch_size: int = None) -> dict:
     nlp = load_spacy_model()
     data_to_store = {"entities": set(), "appearances": set(), "relationships": [], "content": [], "super_chunks": []}
     
+    pages_to_analyze = []
     for page_num, page_text in page_content_map.items():
         data_to_store["content"].append((page_num, page_text))
         if not page_text or len(page_text) > nlp.max_length: continue
-        
-        doc_nlp = nlp(page_text)
+        pages_to_analyze.append((page_text, page_num))
+
+    # Pages are streamed through nlp.pipe so spaCy can batch its matrix operations.
+    for doc_nlp, page_num in nlp.pipe(pages_to_analyze, batch_size=batch_size or NLP_BATCH_SIZE, as_tuples=True):
+        page_text = doc_nlp.text
         
         for ent in doc_nlp.ents:
             entity_tuple = (ent.text.strip(), ent.label_)
@@ -300,17 +371,8 @@ def _extract_data_from_pages(page_content_map: dict) -> dict:
                 data_to_store["appearances"].add((entity_tuple, page_num))
         
         for sent in doc_nlp.sents:
-            unique_ents = list(dict.fromkeys(sent.ents))
-            if len(unique_ents) < 2: continue
-            for ent1, ent2 in combinations(unique_ents, 2):
-                start, end = min(ent1.end_char, ent2.end_char), max(ent1.start_char, ent2.start_char)
-                if end > start and (end - start) < 75:
-                    phrase = ' '.join(page_text[start:end].strip().split())
-                    if phrase:
-                        subj = (ent1.text.strip(), ent1.label_) if ent1.start_char < ent2.start_char else (ent2.text.strip(), ent2.label_)
-                        obj = (ent2.text.strip(), ent2.label_) if ent1.start_char < ent2.start_char else (ent1.text.strip(), ent1.label_)
-                        if subj[0] and obj[0]:
-                             data_to_store["relationships"].append((subj, obj, phrase, page_num))
+            for subj, obj, phrase, _ in extract_relationships(sent.ents, page_text):
+                data_to_store["relationships"].append((subj, obj, phrase, page_num))
 
         # New "Super Embedding" Chunk Logic
         for ent in doc_nlp.ents:
@@ -329,237 +391,715 @@ def _extract_data_from_pages(page_content_map: dict) -> dict:
 
     return data_to_store
 
-def process_document(doc_id):
-    """Worker function using the original, stable, self-contained transaction model."""
-    conn = None
-    try:
-        conn = get_db_conn()
-        cursor = conn.cursor()
+def _email_metadata_rows(doc_id, eml_meta: dict) -> tuple:
+    """Returns the email_metadata row and the CSL-JSON citation text for a parsed e-mail."""
+    csl_data = {
+        "id": f"doc-{doc_id}",
+        "type": "personal_communication",
+        "title": eml_meta.get('subject'),
+        "medium": "Email",
+        "author": [{"literal": eml_meta.get('from_address')}],
+        "recipient": [{"literal": eml_meta.get('to_addresses')}],
+        "issued": None
+    }
+    if eml_meta.get('sent_at'):
+        dt = eml_meta['sent_at']
+        csl_data['issued'] = {'date-parts': [[dt.year, dt.month, dt.day]]}
 
-        conn.execute("UPDATE documents SET status = ?, status_message = ? WHERE id = ?", ('Indexing', 'Worker process started...', doc_id))
-        conn.commit()
+    eml_meta_row = (doc_id, eml_meta['from_address'], eml_meta['to_addresses'], eml_meta['cc_addresses'], eml_meta['subject'], eml_meta['sent_at'])
+    return eml_meta_row, json.dumps(csl_data, indent=2)
 
-        doc_info = conn.execute("SELECT relative_path, file_type FROM documents WHERE id = ?", (doc_id,)).fetchone()
-        if not doc_info:
-            raise ValueError(f"No document found with ID: {doc_id}")
+def _read_text_pages(conn, file_type: str, full_path: Path) -> tuple[dict, int]:
+    """Reads a TXT or HTML document into {page_number: text}. Returns (page_content_map, page_count)."""
+    content = full_path.read_text(encoding='utf-8', errors='ignore')
+    if file_type == 'TXT':
+        page_content_map = _paginate_text(content.strip())
+        return page_content_map, len(page_content_map)
+    mode_row = conn.execute("SELECT value FROM app_settings WHERE key = 'html_parsing_mode'").fetchone()
+    extracted_text = _extract_text_from_pipermail(content) if mode_row and mode_row[0] == 'pipermail' else _extract_text_with_block_separation(content)
+    page_content_map = {1: extracted_text.strip()} if extracted_text.strip() else {1: ""}
+    return page_content_map, (1 if extracted_text.strip() else 0)
 
-        print(f"--- Worker {os.getpid()} processing Doc ID: {doc_id} (Type: {doc_info['file_type']}) ---")
-        
-        full_path = resolve_document_path(doc_info['relative_path'])
-        
-        page_content_map, page_count, duration_seconds = {}, 0, None
-        extracted_data = {"embeddings": [], "super_chunks": []}
-        csl_json_text = None
+def _build_text_payload(conn, doc_id, doc_info) -> dict:
+    """
+    Compute phase of tier 1 (see TIERED_INDEXING): only extracts the text, plus
+    subtitle cues and e-mail metadata, so the document can be written to
+    content_index and become keyword-searchable without waiting for NLP and embeddings.
+    """
+    compute_start = time.perf_counter()
+    full_path = resolve_document_path(doc_info['relative_path'])
+    cues, duration_seconds, eml_meta_to_insert, csl_json_text = [], None, None, None
 
-        eml_meta_to_insert = None 
+    if doc_info['file_type'] == 'SRT':
+        content = full_path.read_text(encoding='utf-8', errors='ignore')
+        cues = _parse_srt_for_db(content)
+        duration_seconds = _get_srt_duration(content)
+        page_content_map, page_count = {1: join_cues(cues)[0]}, len(cues)
+    elif doc_info['file_type'] == 'EML':
+        parsed_eml = _parse_eml_content(full_path.read_bytes())
+        page_content_map, page_count = {1: parsed_eml['body']}, 1
+        eml_meta_to_insert, csl_json_text = _email_metadata_rows(doc_id, parsed_eml['metadata'])
+    elif doc_info['file_type'] == 'PDF':
+        with fitz.open(full_path) as pdf_doc:
+            page_count = pdf_doc.page_count
+            report_task_pages(page_count)
+            page_content_map = _extract_text_from_pdf_doc(pdf_doc)
+    else:
+        page_content_map, page_count = _read_text_pages(conn, doc_info['file_type'], full_path)
 
-        if doc_info['file_type'] == 'SRT':
-            content = full_path.read_text(encoding='utf-8', errors='ignore')
-            parsed_cues = _parse_srt_for_db(content)
-            duration_seconds = _get_srt_duration(content)
-            page_count = len(parsed_cues)
-            
-            nlp = load_spacy_model()
-            extracted_data.update({"entities": set(), "appearances": set(), "relationships": [], "content": [], "cues": parsed_cues})
-            
-            SRT_CHUNK_SIZE_CUES, SRT_CHUNK_OVERLAP_CUES = 20, 5
-            for i in range(0, len(parsed_cues), SRT_CHUNK_SIZE_CUES - SRT_CHUNK_OVERLAP_CUES):
-                chunk_cues = parsed_cues[i:i + SRT_CHUNK_SIZE_CUES]
-                if not chunk_cues: continue
-                chunk_dialogue = " ".join(c['dialogue'] for c in chunk_cues)
-                try:
-                    response = ollama.embeddings(model=EMBEDDING_MODEL, prompt=chunk_dialogue)
-                    embedding_blob = np.array(response['embedding'], dtype=np.float32).tobytes()
-                    extracted_data["embeddings"].append((doc_id, chunk_cues[0]['sequence'], chunk_dialogue, embedding_blob))
-                except Exception as e:
-                    print(f"WORKER WARNING: Could not generate embedding for an SRT chunk. Error: {e}")
-            
-            full_dialogue_text = " ".join(c['dialogue'] for c in parsed_cues)
-            extracted_data["content"].append((1, full_dialogue_text))
-
-            if full_dialogue_text and len(full_dialogue_text) <= nlp.max_length:
-                cue_char_boundaries = []
-                current_pos = 0
-                for cue in parsed_cues:
-                    dialogue_len = len(cue['dialogue'])
-                    cue_char_boundaries.append((current_pos, current_pos + dialogue_len))
-                    current_pos += dialogue_len + 1
-                doc_nlp_full = nlp(full_dialogue_text)
-                for ent in doc_nlp_full.ents:
-                    ent_tuple = (ent.text.strip(), ent.label_)
-                    if ent_tuple[0]: extracted_data["entities"].add(ent_tuple)
-                    for i, (cue_start, cue_end) in enumerate(cue_char_boundaries):
-                        if ent.start_char >= cue_start and ent.start_char < cue_end:
-                            extracted_data["appearances"].add((ent_tuple, parsed_cues[i]['sequence']))
-                            break
-                for sent in doc_nlp_full.sents:
-                    unique_ents = list(dict.fromkeys(sent.ents))
-                    if len(unique_ents) < 2: continue
-                    for ent1, ent2 in combinations(unique_ents, 2):
-                        start, end = min(ent1.end_char, ent2.end_char), max(ent1.start_char, ent2.start_char)
-                        if end > start and (end - start) < 75:
-                            phrase = ' '.join(full_dialogue_text[start:end].strip().split())
-                            if phrase:
-                                subj = (ent1.text.strip(), ent1.label_) if ent1.start_char < ent2.start_char else (ent2.text.strip(), ent2.label_)
-                                obj = (ent2.text.strip(), ent2.label_) if ent1.start_char < ent2.start_char else (ent1.text.strip(), ent1.label_)
-                                if subj[0] and obj[0]:
-                                    rel_start_char = min(ent1.start_char, ent2.start_char)
-                                    for i, (cue_start, cue_end) in enumerate(cue_char_boundaries):
-                                        if rel_start_char >= cue_start and rel_start_char < cue_end:
-                                            extracted_data["relationships"].append((subj, obj, phrase, parsed_cues[i]['sequence']))
-                                            break
-        elif doc_info['file_type'] == 'EML':
-            eml_bytes = full_path.read_bytes()
-            parsed_eml = _parse_eml_content(eml_bytes)
-            page_content_map = {1: parsed_eml['body']}
-            page_count = 1
-            
-            for page_num, page_text in page_content_map.items():
-                for chunk_text, embedding_blob in _generate_embeddings_for_page(page_text):
-                    extracted_data["embeddings"].append((doc_id, page_num, chunk_text, embedding_blob))
-            extracted_data.update(_extract_data_from_pages(page_content_map))
-            
-            eml_meta = parsed_eml['metadata']
-
-            csl_data = {
-                "id": f"doc-{doc_id}",
-                "type": "personal_communication",
-                "title": eml_meta.get('subject'),
-                "medium": "Email",
-                "author": [{"literal": eml_meta.get('from_address')}],
-                "recipient": [{"literal": eml_meta.get('to_addresses')}],
-                "issued": None
-            }
-            if eml_meta.get('sent_at'):
-                dt = eml_meta['sent_at']
-                csl_data['issued'] = {'date-parts': [[dt.year, dt.month, dt.day]]}
-            
-            csl_json_text = json.dumps(csl_data, indent=2)
+    return {
+        "doc_id": doc_id,
+        "tier": "text",
+        "content": list(page_content_map.items()),
+        "cues": cues,
+        "page_count": page_count,
+        "duration_seconds": duration_seconds,
+        "email_metadata": eml_meta_to_insert,
+        "csl_json": csl_json_text,
+        "stats": {"compute_ms": (time.perf_counter() - compute_start) * 1000},
+    }
 
-            eml_meta_to_insert = (doc_id, eml_meta['from_address'], eml_meta['to_addresses'], eml_meta['cc_addresses'], eml_meta['subject'], eml_meta['sent_at'])
+def _build_document_payload(conn, doc_id, doc_info) -> dict:
+    """
+    Compute phase: extracts text, runs NLP and generates every embedding for a
+    document entirely in memory. Only reads from the database, so no write lock
+    is held while the expensive work runs.
+    """
+    compute_start = time.perf_counter()
+    full_path = resolve_document_path(doc_info['relative_path'])
+    
+    page_content_map, page_count, duration_seconds = {}, 0, None
+    extracted_data = {"embeddings": [], "super_chunks": []}
+    standard_chunks = []
+    csl_json_text = None
 
-        else:
-            if doc_info['file_type'] == 'PDF':
-                with fitz.open(full_path) as pdf_doc:
-                    page_count = pdf_doc.page_count
-                    page_content_map = _extract_text_from_pdf_doc(pdf_doc)
-            elif doc_info['file_type'] == 'TXT':
-                content = full_path.read_text(encoding='utf-8', errors='ignore')
-                page_content_map = _paginate_text(content.strip())
-                page_count = len(page_content_map)
-            elif doc_info['file_type'] == 'HTML':
-                mode_row = conn.execute("SELECT value FROM app_settings WHERE key = 'html_parsing_mode'").fetchone()
-                content = full_path.read_text(encoding='utf-8', errors='ignore')
-                extracted_text = _extract_text_from_pipermail(content) if mode_row and mode_row[0] == 'pipermail' else _extract_text_with_block_separation(content)
-                page_content_map = {1: extracted_text.strip()} if extracted_text.strip() else {1: ""}
-                page_count = 1 if extracted_text.strip() else 0
-            
-            for page_num, page_text in page_content_map.items():
-                for chunk_text, embedding_blob in _generate_embeddings_for_page(page_text):
-                    extracted_data["embeddings"].append((doc_id, page_num, chunk_text, embedding_blob))
-
-            extracted_data.update(_extract_data_from_pages(page_content_map))
-
-        # --- DATABASE WRITE PHASE (ALL IN ONE TRANSACTION) ---
-        cursor.execute("BEGIN TRANSACTION;")
-        cursor.execute("DELETE FROM srt_cues WHERE doc_id = ?", (doc_id,))
-        cursor.execute("DELETE FROM content_index WHERE doc_id = ?", (doc_id,))
-        cursor.execute("DELETE FROM entity_appearances WHERE doc_id = ?", (doc_id,))
-        cursor.execute("DELETE FROM entity_relationships WHERE doc_id = ?", (doc_id,))
+    eml_meta_to_insert = None 
+    page_hashes, pages_to_replace = None, None
+
+    if doc_info['file_type'] == 'SRT':
+        content = full_path.read_text(encoding='utf-8', errors='ignore')
+        parsed_cues = _parse_srt_for_db(content)
+        duration_seconds = _get_srt_duration(content)
+        page_count = len(parsed_cues)
+        
+        nlp = load_spacy_model()
+        extracted_data.update({"entities": set(), "appearances": set(), "relationships": [], "content": [], "cues": parsed_cues})
+        
+        SRT_CHUNK_SIZE_CUES, SRT_CHUNK_OVERLAP_CUES = 20, 5
+        for i in range(0, len(parsed_cues), SRT_CHUNK_SIZE_CUES - SRT_CHUNK_OVERLAP_CUES):
+            chunk_cues = parsed_cues[i:i + SRT_CHUNK_SIZE_CUES]
+            if not chunk_cues: continue
+            chunk_dialogue = " ".join(c['dialogue'] for c in chunk_cues)
+            standard_chunks.append((chunk_cues[0]['sequence'], chunk_dialogue))
+        
+        full_dialogue_text, cue_map = join_cues(parsed_cues)
+        extracted_data["content"].append((1, full_dialogue_text))
+
+        if full_dialogue_text and len(full_dialogue_text) <= nlp.max_length:
+            doc_nlp_full = nlp(full_dialogue_text)
+            for ent in doc_nlp_full.ents:
+                ent_tuple = (ent.text.strip(), ent.label_)
+                if ent_tuple[0]: extracted_data["entities"].add(ent_tuple)
+                cue_sequence = cue_map.lookup(ent.start_char)
+                if cue_sequence is not None:
+                    extracted_data["appearances"].add((ent_tuple, cue_sequence))
+            for sent in doc_nlp_full.sents:
+                for subj, obj, phrase, rel_start_char in extract_relationships(sent.ents, full_dialogue_text):
+                    cue_sequence = cue_map.lookup(rel_start_char)
+                    if cue_sequence is not None:
+                        extracted_data["relationships"].append((subj, obj, phrase, cue_sequence))
+    elif doc_info['file_type'] == 'EML':
+        eml_bytes = full_path.read_bytes()
+        parsed_eml = _parse_eml_content(eml_bytes)
+        page_content_map = {1: parsed_eml['body']}
+        page_count = 1
         
-        # This will trigger the cascading deletes in vec_embedding_chunks due to our SQLite triggers
-        cursor.execute("DELETE FROM embedding_chunks WHERE doc_id = ?", (doc_id,))
-        cursor.execute("DELETE FROM super_embedding_chunks WHERE doc_id = ?", (doc_id,))
+        stored_hashes = _load_page_hashes(conn, doc_id)
+        page_hashes, pages_to_process, changed_pages = _plan_page_updates(stored_hashes, page_content_map)
+        pages_to_replace = _pages_to_replace(stored_hashes, page_hashes, changed_pages)
+        standard_chunks = _chunk_pages(pages_to_process)
+        extracted_data.update(_extract_data_from_pages(pages_to_process))
         
+        eml_meta_to_insert, csl_json_text = _email_metadata_rows(doc_id, parsed_eml['metadata'])
+
+    else:
+        if doc_info['file_type'] == 'PDF':
+            with fitz.open(full_path) as pdf_doc:
+                page_count = pdf_doc.page_count
+                # Lets the task manager's watchdog scale this document's time budget.
+                report_task_pages(page_count)
+                if page_count > STREAMING_PAGE_THRESHOLD:
+                    return _build_streaming_payload(conn, doc_id, pdf_doc, compute_start)
+                page_content_map = _extract_text_from_pdf_doc(pdf_doc)
+        elif doc_info['file_type'] in ('TXT', 'HTML'):
+            page_content_map, page_count = _read_text_pages(conn, doc_info['file_type'], full_path)
+        
+        # Only pages whose text changed since the last index are re-analyzed and re-embedded.
+        stored_hashes = _load_page_hashes(conn, doc_id)
+        page_hashes, pages_to_process, changed_pages = _plan_page_updates(stored_hashes, page_content_map)
+        pages_to_replace = _pages_to_replace(stored_hashes, page_hashes, changed_pages)
+        standard_chunks = _chunk_pages(pages_to_process)
+        extracted_data.update(_extract_data_from_pages(pages_to_process))
+
+    # --- EMBEDDING STAGE (BATCHED, ONE PASS PER DOCUMENT) ---
+    embed_start = time.perf_counter()
+    extracted_data["embeddings"], extracted_data["super_chunks"] = _embed_document_chunks(
+        doc_id, standard_chunks, extracted_data.get("super_chunks", [])
+    )
+    embed_ms = (time.perf_counter() - embed_start) * 1000
+
+    extracted_data.update({
+        "doc_id": doc_id,
+        "page_count": page_count,
+        "embedding_model": embedding_model_id(),
+        "duration_seconds": duration_seconds,
+        "email_metadata": eml_meta_to_insert,
+        "csl_json": csl_json_text,
+        "page_hashes": page_hashes,
+        "pages_to_replace": pages_to_replace,
+        "stats": {
+            "worker_pid": os.getpid(),
+            "compute_ms": (time.perf_counter() - compute_start) * 1000,
+            "embed_ms": embed_ms,
+            "pages_reindexed": len(pages_to_replace) if pages_to_replace is not None else len(page_hashes or {}),
+            "pages_reused": len(page_hashes) - len(pages_to_process) if pages_to_replace is not None else 0,
+        },
+    })
+    return extracted_data
+
+def _staging_dir_for(doc_id) -> Path:
+    return STAGING_DIR / f"doc_{doc_id}"
+
+def _stage_page_windows(doc_id, pdf_doc, stored_hashes: dict, first_page: int, last_page: int, spill_prefix: str = "window") -> dict:
+    """
+    Reads, analyzes and embeds PDF pages first_page..last_page (1-based, inclusive)
+    one window of STREAMING_WINDOW_PAGES at a time, spilling each window's rows to
+    the document's staging area before the next window is read. Memory therefore
+    depends on the window size, not the page count. Returns a picklable summary.
+    """
+    staging_dir = _staging_dir_for(doc_id)
+    staging_dir.mkdir(parents=True, exist_ok=True)
+    page_hashes, changed_pages, spill_files = {}, [], []
+    pages_processed, embed_ms = 0, 0.0
+
+    for window_start in range(first_page, last_page + 1, STREAMING_WINDOW_PAGES):
+        window_end = min(window_start + STREAMING_WINDOW_PAGES - 1, last_page)
+        window_map = {}
+        for page_num in range(window_start, window_end + 1):
+            try:
+                text = pdf_doc.load_page(page_num - 1).get_text("text", sort=True)
+            except Exception as e:
+                # One damaged page should not cost the whole document, as in _extract_text_from_pdf_doc.
+                print(f"Error extracting text from PDF page {page_num}: {e}")
+                continue
+            if text: window_map[page_num] = text.strip()
+
+        window_hashes, pages_to_process, window_changed = _plan_page_updates(stored_hashes, window_map)
+        page_hashes.update(window_hashes)
+        if window_changed is not None: changed_pages.extend(window_changed)
+        pages_processed += len(pages_to_process)
+
+        part = _extract_data_from_pages(pages_to_process)
+        embed_start = time.perf_counter()
+        part["embeddings"], part["super_chunks"] = _embed_document_chunks(doc_id, _chunk_pages(pages_to_process), part["super_chunks"])
+        embed_ms += (time.perf_counter() - embed_start) * 1000
+
+        spill_path = staging_dir / f"{spill_prefix}_{window_start:06d}.pkl"
+        with open(spill_path, 'wb') as f:
+            pickle.dump(part, f, protocol=pickle.HIGHEST_PROTOCOL)
+        spill_files.append(str(spill_path))
+        del part, window_map, pages_to_process
+
+        print(f"  Worker {os.getpid()} Doc ID {doc_id}: staged pages {window_start}-{window_end} of {pdf_doc.page_count} (peak RSS {_format_mb(peak_rss_mb())})")
+
+    return {
+        "page_hashes": page_hashes,
+        "changed_pages": changed_pages,
+        "spill_files": spill_files,
+        "pages_processed": pages_processed,
+        "embed_ms": embed_ms,
+    }
+
+def _staged_payload(doc_id, page_count, stored_hashes: dict, staged: list, compute_ms: float) -> dict:
+    """Merges one or more staging summaries (in page order) into a payload for the write phase."""
+    page_hashes, changed_pages, spill_files = {}, [], []
+    for summary in staged:
+        page_hashes.update(summary["page_hashes"])
+        changed_pages.extend(summary["changed_pages"])
+        spill_files.extend(summary["spill_files"])
+    pages_processed = sum(summary["pages_processed"] for summary in staged)
+
+    pages_to_replace = _pages_to_replace(stored_hashes, page_hashes, changed_pages if stored_hashes else None)
+    peaks = [summary["peak_rss_mb"] for summary in staged if summary.get("peak_rss_mb") is not None]
+    return {
+        "doc_id": doc_id,
+        "page_count": page_count,
+        "embedding_model": embedding_model_id(),
+        "duration_seconds": None,
+        "email_metadata": None,
+        "csl_json": None,
+        "page_hashes": page_hashes,
+        "pages_to_replace": pages_to_replace,
+        "spill_files": spill_files,
+        "stats": {
+            "worker_pid": os.getpid(),
+            "compute_ms": compute_ms,
+            "embed_ms": sum(summary["embed_ms"] for summary in staged),
+            "pages_reindexed": len(pages_to_replace) if pages_to_replace is not None else len(page_hashes),
+            "pages_reused": len(page_hashes) - pages_processed if pages_to_replace is not None else 0,
+            "peak_rss_mb": max(peaks) if peaks else None,
+        },
+    }
+
+def _build_streaming_payload(conn, doc_id, pdf_doc, compute_start) -> dict:
+    """
+    Compute phase for very large PDFs: every page is staged through bounded
+    windows. The returned payload lists the spill files; the write phase commits
+    them to the staged_* tables one window at a time and then promotes them in
+    one short transaction, so the document still switches to 'Indexed' atomically.
+    """
+    shutil.rmtree(_staging_dir_for(doc_id), ignore_errors=True)
+    stored_hashes = _load_page_hashes(conn, doc_id)
+    staged = _stage_page_windows(doc_id, pdf_doc, stored_hashes, 1, pdf_doc.page_count)
+    return _staged_payload(doc_id, pdf_doc.page_count, stored_hashes, [staged], (time.perf_counter() - compute_start) * 1000)
+
+def _format_mb(value) -> str:
+    return f"{value:.0f} MB" if value is not None else "n/a"
+
+# Tables whose rows belong to a single page of a document (keyed by doc_id, page_number).
+_PAGE_SCOPED_TABLES = ("content_index", "entity_appearances", "entity_relationships", "embedding_chunks", "super_embedding_chunks")
+# Keeps each DELETE ... IN (...) well below SQLite's bound parameter limit.
+_PAGE_DELETE_CHUNK = 500
+
+def _delete_page_rows(cursor, table: str, doc_id, pages: Union[list, None]):
+    """Deletes a document's rows from a page-scoped table, either all of them (pages=None) or only the given pages."""
+    if pages is None:
+        cursor.execute(f"DELETE FROM {table} WHERE doc_id = ?", (doc_id,))
+        return
+    for start in range(0, len(pages), _PAGE_DELETE_CHUNK):
+        chunk = pages[start:start + _PAGE_DELETE_CHUNK]
+        cursor.execute(f"DELETE FROM {table} WHERE doc_id = ? AND page_number IN ({','.join('?' * len(chunk))})", (doc_id, *chunk))
+
+def _resolve_entity_ids(cursor, entities_list: list) -> dict:
+    """
+    Registers a document's (text, label) entities and returns {(text, label): id}.
+    The tuples are staged in a temp table so that both the insert of new entities
+    and the ID lookup are single set-based statements joined on UNIQUE(text, label),
+    rather than one point query per entity. Must be called inside the write transaction.
+    """
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS _doc_entities (text TEXT NOT NULL, label TEXT NOT NULL)")
+    cursor.execute("DELETE FROM _doc_entities")
+    cursor.executemany("INSERT INTO _doc_entities (text, label) VALUES (?, ?)", entities_list)
+    cursor.execute("INSERT OR IGNORE INTO entities (text, label) SELECT text, label FROM _doc_entities")
+    rows = cursor.execute("""
+        SELECT e.id, e.text, e.label
+        FROM _doc_entities d
+        JOIN entities e ON e.text = d.text AND e.label = d.label
+    """).fetchall()
+    cursor.execute("DELETE FROM _doc_entities")
+    return {(text, label): entity_id for entity_id, text, label in rows}
+
+def _insert_page_rows(cursor, doc_id, part: dict) -> tuple[int, int]:
+    """
+    Inserts one part's page-scoped rows (content, chunks, entities, relationships)
+    inside the caller's write transaction. Returns (chunk_count, super_chunk_count).
+    """
+    content_to_insert = [(doc_id, pn, pt) for pn, pt in part.get("content") or []]
+    embeddings = part.get("embeddings") or []
+    entities_list = list(part.get("entities") or [])
+    super_chunks = part.get("super_chunks") or []
+
+    if content_to_insert:
+        cursor.executemany("INSERT INTO content_index (doc_id, page_number, page_content) VALUES (?, ?, ?)", content_to_insert)
+    
+    # --- Write to sqlite-vec virtual tables ---
+    # Chunk IDs are assigned up front so metadata and vectors can both be bulk inserted.
+    # This is safe because BEGIN IMMEDIATE gives us the only writer.
+    if embeddings:
+        next_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM embedding_chunks").fetchone()[0] + 1
+        chunk_ids = range(next_id, next_id + len(embeddings))
+        cursor.executemany(
+            "INSERT INTO embedding_chunks (id, doc_id, page_number, chunk_text) VALUES (?, ?, ?, ?)",
+            [(chunk_id, d_id, page_num, chunk_text) for chunk_id, (d_id, page_num, chunk_text, _) in zip(chunk_ids, embeddings)]
+        )
+        cursor.executemany(
+            "INSERT INTO vec_embedding_chunks (chunk_id, embedding) VALUES (?, ?)",
+            [(chunk_id, embedding_blob) for chunk_id, (_, _, _, embedding_blob) in zip(chunk_ids, embeddings)]
+        )
+
+    if not entities_list:
+        return len(embeddings), 0
+
+    entity_id_map = _resolve_entity_ids(cursor, entities_list)
+
+    appearances_to_insert = [(doc_id, entity_id_map[ent_tuple], page_num) for ent_tuple, page_num in part["appearances"] if ent_tuple in entity_id_map]
+    if appearances_to_insert:
+        cursor.executemany("INSERT OR IGNORE INTO entity_appearances (doc_id, entity_id, page_number) VALUES (?, ?, ?)", appearances_to_insert)
+    
+    relationships_to_insert = [
+        (entity_id_map[subj], entity_id_map[obj], phrase, doc_id, page_num) 
+        for subj, obj, phrase, page_num in part.get("relationships", []) 
+        if subj in entity_id_map and obj in entity_id_map
+    ]
+    
+    if relationships_to_insert:
+        cursor.executemany(
+            "INSERT INTO entity_relationships (subject_entity_id, object_entity_id, relationship_phrase, doc_id, page_number) VALUES (?, ?, ?, ?, ?)", 
+            relationships_to_insert
+        )
+    
+    super_chunks = [c for c in super_chunks if c["entity"] in entity_id_map]
+    if super_chunks:
+        next_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM super_embedding_chunks").fetchone()[0] + 1
+        chunk_ids = range(next_id, next_id + len(super_chunks))
+        cursor.executemany(
+            "INSERT INTO super_embedding_chunks (id, doc_id, page_number, entity_id, chunk_text) VALUES (?, ?, ?, ?, ?)",
+            [(chunk_id, doc_id, c["page_number"], entity_id_map[c["entity"]], c["chunk_text"]) for chunk_id, c in zip(chunk_ids, super_chunks)]
+        )
+        cursor.executemany(
+            "INSERT INTO vec_super_embedding_chunks (chunk_id, embedding) VALUES (?, ?)",
+            [(chunk_id, c["embedding"]) for chunk_id, c in zip(chunk_ids, super_chunks)]
+        )
+    return len(embeddings), len(super_chunks)
+
+# Tables a streamed document's windows are committed to before _promote_staged_rows swaps them in.
+_STAGED_TABLES = ("staged_content", "staged_embedding_chunks", "staged_entity_appearances", "staged_entity_relationships", "staged_super_embedding_chunks")
+
+def _insert_staged_rows(cursor, doc_id, part: dict):
+    """Like _insert_page_rows, but into the staged_* tables, with each vector kept on its chunk row."""
+    embeddings = part.get("embeddings") or []
+    entities_list = list(part.get("entities") or [])
+
+    if part.get("content"):
+        cursor.executemany("INSERT INTO staged_content (doc_id, page_number, page_content) VALUES (?, ?, ?)",
+                           [(doc_id, pn, pt) for pn, pt in part["content"]])
+    if embeddings:
+        cursor.executemany("INSERT INTO staged_embedding_chunks (doc_id, page_number, chunk_text, embedding) VALUES (?, ?, ?, ?)", embeddings)
+    if not entities_list:
+        return
+
+    entity_id_map = _resolve_entity_ids(cursor, entities_list)
+    cursor.executemany("INSERT OR IGNORE INTO staged_entity_appearances (doc_id, entity_id, page_number) VALUES (?, ?, ?)",
+                       [(doc_id, entity_id_map[ent_tuple], page_num) for ent_tuple, page_num in part["appearances"] if ent_tuple in entity_id_map])
+    cursor.executemany(
+        "INSERT INTO staged_entity_relationships (subject_entity_id, object_entity_id, relationship_phrase, doc_id, page_number) VALUES (?, ?, ?, ?, ?)",
+        [(entity_id_map[subj], entity_id_map[obj], phrase, doc_id, page_num)
+         for subj, obj, phrase, page_num in part.get("relationships", []) if subj in entity_id_map and obj in entity_id_map]
+    )
+    cursor.executemany(
+        "INSERT INTO staged_super_embedding_chunks (doc_id, page_number, entity_id, chunk_text, embedding) VALUES (?, ?, ?, ?, ?)",
+        [(doc_id, c["page_number"], entity_id_map[c["entity"]], c["chunk_text"], c["embedding"])
+         for c in part.get("super_chunks") or [] if c["entity"] in entity_id_map]
+    )
+
+def _clear_staged_rows(cursor, doc_id):
+    for table in _STAGED_TABLES:
+        cursor.execute(f"DELETE FROM {table} WHERE doc_id = ?", (doc_id,))
+
+def _stage_spilled_windows(conn, payload: dict):
+    """
+    Copies a streamed document's spill files into the staged_* tables, committing
+    after every window, so the write lock is held for one window at a time rather
+    than for the whole document. Nothing here is visible to readers yet.
+    """
+    doc_id = payload["doc_id"]
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE;")
+        _clear_staged_rows(cursor, doc_id)
+        conn.commit()
+        for spill_path in payload["spill_files"]:
+            with open(spill_path, 'rb') as f:
+                part = pickle.load(f)
+            cursor.execute("BEGIN IMMEDIATE;")
+            _insert_staged_rows(cursor, doc_id, part)
+            conn.commit()
+            del part
+    except Exception:
+        conn.rollback()
+        raise
+
+def _promote_staged_rows(cursor, doc_id) -> tuple[int, int]:
+    """
+    Moves a document's staged rows into the live tables with set-based copies and
+    clears them. Runs inside the caller's write transaction, after the pages being
+    replaced have been deleted. Returns (chunk_count, super_chunk_count).
+    """
+    cursor.execute("INSERT INTO content_index (doc_id, page_number, page_content) SELECT doc_id, page_number, page_content FROM staged_content WHERE doc_id = ? ORDER BY rowid", (doc_id,))
+    cursor.execute("""
+        INSERT OR IGNORE INTO entity_appearances (doc_id, entity_id, page_number)
+        SELECT doc_id, entity_id, page_number FROM staged_entity_appearances WHERE doc_id = ?
+    """, (doc_id,))
+    cursor.execute("""
+        INSERT INTO entity_relationships (subject_entity_id, object_entity_id, relationship_phrase, doc_id, page_number)
+        SELECT subject_entity_id, object_entity_id, relationship_phrase, doc_id, page_number FROM staged_entity_relationships WHERE doc_id = ? ORDER BY id
+    """, (doc_id,))
+
+    counts = []
+    for live_table, columns in (("embedding_chunks", "doc_id, page_number, chunk_text"),
+                                ("super_embedding_chunks", "doc_id, page_number, entity_id, chunk_text")):
+        # Staged IDs are shifted past the live table's so the chunk rows and their vectors keep matching IDs.
+        first_staged = cursor.execute(f"SELECT MIN(id) FROM staged_{live_table} WHERE doc_id = ?", (doc_id,)).fetchone()[0]
+        if first_staged is None:
+            counts.append(0)
+            continue
+        offset = cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {live_table}").fetchone()[0] + 1 - first_staged
+        cursor.execute(f"INSERT INTO {live_table} (id, {columns}) SELECT id + ?, {columns} FROM staged_{live_table} WHERE doc_id = ?", (offset, doc_id))
+        counts.append(cursor.rowcount)
+        cursor.execute(f"INSERT INTO vec_{live_table} (chunk_id, embedding) SELECT id + ?, embedding FROM staged_{live_table} WHERE doc_id = ?", (offset, doc_id))
+
+    _clear_staged_rows(cursor, doc_id)
+    return counts[0], counts[1]
+
+def _apply_text_payload(cursor, payload: dict, lock_wait_ms: float) -> dict:
+    """
+    Write phase of tier 1: replaces the document's content_index rows (and its
+    subtitle cues and e-mail metadata) and marks it 'Searchable'. Entities,
+    relationships, embeddings and page hashes from an earlier full index are left
+    as they are until enrichment replaces them.
+    """
+    doc_id = payload["doc_id"]
+    apply_start = time.perf_counter()
+
+    cursor.execute("DELETE FROM content_index WHERE doc_id = ?", (doc_id,))
+    cursor.executemany("INSERT INTO content_index (doc_id, page_number, page_content) VALUES (?, ?, ?)",
+                       [(doc_id, page_num, page_text) for page_num, page_text in payload["content"]])
+    cursor.execute("DELETE FROM srt_cues WHERE doc_id = ?", (doc_id,))
+    if payload["cues"]:
+        cursor.executemany("INSERT INTO srt_cues (doc_id, sequence, timestamp, dialogue) VALUES (?, ?, ?, ?)",
+                           [(doc_id, c['sequence'], c['timestamp'], c['dialogue']) for c in payload["cues"]])
+    if payload.get("email_metadata"):
         cursor.execute("DELETE FROM email_metadata WHERE doc_id = ?", (doc_id,))
+        cursor.execute("""
+            INSERT INTO email_metadata (doc_id, from_address, to_addresses, cc_addresses, subject, sent_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, payload["email_metadata"])
+    if payload.get("csl_json"):
         cursor.execute("DELETE FROM document_metadata WHERE doc_id = ?", (doc_id,))
+        cursor.execute("INSERT INTO document_metadata (doc_id, csl_json, last_updated) VALUES (?, ?, CURRENT_TIMESTAMP)", (doc_id, payload["csl_json"]))
+
+    cursor.execute("UPDATE documents SET page_count = ?, duration_seconds = ?, status = ?, status_message = ?, processed_at = CURRENT_TIMESTAMP WHERE id = ?",
+                   (payload["page_count"], payload["duration_seconds"], 'Searchable', 'Text indexed. Enrichment pending.', doc_id))
+    stats = payload.get("stats") or {}
+    return {
+        "lock_wait_ms": lock_wait_ms,
+        "write_lock_ms": (time.perf_counter() - apply_start) * 1000,
+        "peak_rss_mb": stats.get("peak_rss_mb"),
+        "status": 'Searchable',
+    }
 
-        cursor.execute("UPDATE documents SET page_count = ?, duration_seconds = ? WHERE id = ?", (page_count, duration_seconds, doc_id))
+def _apply_document_payload(cursor, payload: dict, lock_wait_ms: float) -> dict:
+    """
+    Replaces the document's rows with the precomputed payload using only bulk
+    inserts. Must run inside a write transaction owned by the caller. Streamed
+    documents must already have been through _stage_spilled_windows; their
+    staged rows are promoted here. Returns the lock wait and how long this
+    document's writes took.
+    """
+    if payload.get("tier") == "text":
+        return _apply_text_payload(cursor, payload, lock_wait_ms)
+    doc_id = payload["doc_id"]
+    cues_to_insert = [(doc_id, c['sequence'], c['timestamp'], c['dialogue']) for c in payload.get("cues") or []]
+    pages_to_replace = payload.get("pages_to_replace")
+    page_hashes = [(doc_id, pn, ph) for pn, ph in (payload.get("page_hashes") or {}).items()]
+    apply_start = time.perf_counter()
 
-        if eml_meta_to_insert:
-            cursor.execute("""
-                INSERT INTO email_metadata (doc_id, from_address, to_addresses, cc_addresses, subject, sent_at)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, eml_meta_to_insert)
+    # Documents in the Recycle Bin do not count towards browse_cache, so they have nothing to subtract.
+    status_row = cursor.execute("SELECT status FROM documents WHERE id = ?", (doc_id,)).fetchone()
+    cache_before = browse_cache.document_contributions(cursor, [doc_id]) if status_row and status_row[0] != 'Missing' else {}
 
-        if extracted_data.get("cues"):
-            cues_to_insert = [(doc_id, c['sequence'], c['timestamp'], c['dialogue']) for c in extracted_data["cues"]]
-            cursor.executemany("INSERT INTO srt_cues (doc_id, sequence, timestamp, dialogue) VALUES (?, ?, ?, ?)", cues_to_insert)
+    cursor.execute("DELETE FROM srt_cues WHERE doc_id = ?", (doc_id,))
+    # Per-page rows are only replaced for changed pages, so unchanged pages keep their rows and vector IDs.
+    # Deleting embedding chunks triggers the cascading deletes in the vec tables via our SQLite triggers.
+    for table in _PAGE_SCOPED_TABLES:
+        _delete_page_rows(cursor, table, doc_id, pages_to_replace)
+    
+    cursor.execute("DELETE FROM email_metadata WHERE doc_id = ?", (doc_id,))
+    cursor.execute("DELETE FROM document_metadata WHERE doc_id = ?", (doc_id,))
 
-        if extracted_data.get("content"):
-            cursor.executemany("INSERT INTO content_index (doc_id, page_number, page_content) VALUES (?, ?, ?)", [(doc_id, pn, pt) for pn, pt in extracted_data["content"]])
-        
-        # --- NEW: Write to sqlite-vec virtual tables ---
-        if extracted_data.get("embeddings"):
-            for d_id, page_num, chunk_text, embedding_blob in extracted_data["embeddings"]:
-                cursor.execute(
-                    "INSERT INTO embedding_chunks (doc_id, page_number, chunk_text) VALUES (?, ?, ?)", 
-                    (d_id, page_num, chunk_text)
-                )
-                chunk_id = cursor.lastrowid
-                cursor.execute(
-                    "INSERT INTO vec_embedding_chunks (chunk_id, embedding) VALUES (?, ?)",
-                    (chunk_id, embedding_blob)
-                )
-        
-        if csl_json_text:
-            cursor.execute("""
-                INSERT INTO document_metadata (doc_id, csl_json, last_updated) VALUES (?, ?, CURRENT_TIMESTAMP)
-            """, (doc_id, csl_json_text))
-
-        if extracted_data.get("entities"):
-            entities_list = list(extracted_data["entities"])
-            cursor.executemany("INSERT OR IGNORE INTO entities (text, label) VALUES (?, ?)", entities_list)
-            
-            entity_id_map = {}
-            for text, label in entities_list:
-                res = conn.execute("SELECT id FROM entities WHERE text = ? AND label = ?", (text, label)).fetchone()
-                if res: entity_id_map[(text, label)] = res['id']
-
-            appearances_to_insert = [(doc_id, entity_id_map[ent_tuple], page_num) for ent_tuple, page_num in extracted_data["appearances"] if ent_tuple in entity_id_map]
-            if appearances_to_insert:
-                cursor.executemany("INSERT OR IGNORE INTO entity_appearances (doc_id, entity_id, page_number) VALUES (?, ?, ?)", appearances_to_insert)
-            
-            relationships_to_insert = [
-                (entity_id_map[subj], entity_id_map[obj], phrase, doc_id, page_num) 
-                for subj, obj, phrase, page_num in extracted_data.get("relationships", []) 
-                if subj in entity_id_map and obj in entity_id_map
-            ]
-            
-            if relationships_to_insert:
-                cursor.executemany(
-                    "INSERT INTO entity_relationships (subject_entity_id, object_entity_id, relationship_phrase, doc_id, page_number) VALUES (?, ?, ?, ?, ?)", 
-                    relationships_to_insert
-                )
-            
-            if extracted_data.get("super_chunks"):
-                for chunk_data in extracted_data["super_chunks"]:
-                    entity_tuple = chunk_data["entity"]
-                    if entity_tuple in entity_id_map:
-                        entity_id = entity_id_map[entity_tuple]
-                        chunk_text = chunk_data["chunk_text"]
-                        try:
-                            response = ollama.embeddings(model=EMBEDDING_MODEL, prompt=chunk_text)
-                            embedding_blob = np.array(response['embedding'], dtype=np.float32).tobytes()
-                            
-                            # Insert metadata and get ID
-                            cursor.execute(
-                                "INSERT INTO super_embedding_chunks (doc_id, page_number, entity_id, chunk_text) VALUES (?, ?, ?, ?)",
-                                (doc_id, chunk_data["page_number"], entity_id, chunk_text)
-                            )
-                            chunk_id = cursor.lastrowid
-                            # Insert vector into vec0
-                            cursor.execute(
-                                "INSERT INTO vec_super_embedding_chunks (chunk_id, embedding) VALUES (?, ?)",
-                                (chunk_id, embedding_blob)
-                            )
-                        except Exception as e:
-                            print(f"WORKER WARNING: Could not generate super embedding for chunk '{chunk_text[:50]}...'. Error: {e}")
-                            continue
-
-        cursor.execute("UPDATE documents SET status = ?, status_message = ?, processed_at = CURRENT_TIMESTAMP WHERE id = ?", ('Indexed', 'Processing complete.', doc_id))
+    cursor.execute("DELETE FROM document_page_hashes WHERE doc_id = ?", (doc_id,))
+    if page_hashes:
+        cursor.executemany("INSERT INTO document_page_hashes (doc_id, page_number, content_hash) VALUES (?, ?, ?)", page_hashes)
+
+    cursor.execute("UPDATE documents SET page_count = ?, duration_seconds = ?, embedding_model = ? WHERE id = ?",
+                   (payload["page_count"], payload["duration_seconds"], payload.get("embedding_model"), doc_id))
+
+    if payload.get("email_metadata"):
+        cursor.execute("""
+            INSERT INTO email_metadata (doc_id, from_address, to_addresses, cc_addresses, subject, sent_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, payload["email_metadata"])
+
+    if cues_to_insert:
+        cursor.executemany("INSERT INTO srt_cues (doc_id, sequence, timestamp, dialogue) VALUES (?, ?, ?, ?)", cues_to_insert)
+
+    if payload.get("csl_json"):
+        cursor.execute("""
+            INSERT INTO document_metadata (doc_id, csl_json, last_updated) VALUES (?, ?, CURRENT_TIMESTAMP)
+        """, (doc_id, payload["csl_json"]))
+
+    chunk_count, super_chunk_count = _insert_page_rows(cursor, doc_id, payload)
+    if payload.get("spill_files"):
+        staged_chunks, staged_super_chunks = _promote_staged_rows(cursor, doc_id)
+        chunk_count += staged_chunks
+        super_chunk_count += staged_super_chunks
+
+    cursor.execute("UPDATE documents SET status = ?, status_message = ?, processed_at = CURRENT_TIMESTAMP WHERE id = ?", ('Indexed', 'Processing complete.', doc_id))
+    browse_cache.apply_delta(cursor, cache_before, browse_cache.document_contributions(cursor, [doc_id]))
+
+    stats = dict(payload.get("stats") or {})
+    timings = {
+        "lock_wait_ms": lock_wait_ms,
+        "write_lock_ms": (time.perf_counter() - apply_start) * 1000,
+        # The payload carries the computing worker's peak; only fall back to this process when it is missing.
+        "peak_rss_mb": stats.get("peak_rss_mb") if stats.get("peak_rss_mb") is not None else peak_rss_mb(),
+        "status": 'Indexed',
+    }
+    stats.update(timings)
+    cursor.execute("""
+        INSERT OR REPLACE INTO document_index_stats
+            (doc_id, worker_pid, compute_ms, embed_ms, lock_wait_ms, write_lock_ms, chunk_count, super_chunk_count,
+             pages_reindexed, pages_reused, peak_rss_mb, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    """, (doc_id, stats.get("worker_pid") or os.getpid(), stats.get("compute_ms"), stats.get("embed_ms"), stats["lock_wait_ms"], stats["write_lock_ms"],
+          chunk_count, super_chunk_count, stats.get("pages_reindexed"), stats.get("pages_reused"), stats["peak_rss_mb"]))
+    return timings
+
+def _write_document_payload(conn, payload: dict) -> dict:
+    """
+    Write phase for a single document: one transaction, committed immediately
+    (after a streamed document's windows have been staged). Returns how long the
+    transaction waited for, and then held, the SQLite write lock.
+    """
+    if payload.get("spill_files"):
+        _stage_spilled_windows(conn, payload)
+    cursor = conn.cursor()
+    wait_start = time.perf_counter()
+    cursor.execute("BEGIN IMMEDIATE;")
+    lock_wait_ms = (time.perf_counter() - wait_start) * 1000
+    timings = _apply_document_payload(cursor, payload, lock_wait_ms)
+    conn.commit()
+    return timings
+
+def write_document_batch(conn, payloads: list) -> list:
+    """
+    Group commit used by the index writer: applies several documents in one
+    transaction, each inside its own savepoint so that one bad payload only
+    fails itself. Streamed documents stage their windows first, in transactions
+    of their own. Returns (doc_id, status, message) for every payload. Staged
+    spill files are removed once their document has been written or failed.
+    """
+    stage_failed, ready = [], []
+    for payload in payloads:
+        if payload.get("spill_files"):
+            try:
+                _stage_spilled_windows(conn, payload)
+            except Exception as e:
+                print(f"!!! WRITER ERROR staging Doc ID: {payload['doc_id']} !!!")
+                print(traceback.format_exc())
+                mark_document_error(payload["doc_id"], f"Writer Error: {type(e).__name__}: {e}")
+                stage_failed.append((payload["doc_id"], 'Error', str(e)))
+                continue
+        ready.append(payload)
+
+    results = list(stage_failed)
+    cursor = conn.cursor()
+    try:
+        wait_start = time.perf_counter()
+        cursor.execute("BEGIN IMMEDIATE;")
+        lock_wait_ms = (time.perf_counter() - wait_start) * 1000
+        batch_start = time.perf_counter()
+        failed = []
+        for payload in ready:
+            doc_id = payload["doc_id"]
+            cursor.execute("SAVEPOINT document_write;")
+            try:
+                timings = _apply_document_payload(cursor, payload, lock_wait_ms)
+                cursor.execute("RELEASE SAVEPOINT document_write;")
+                results.append((doc_id, timings["status"], f"write {timings['write_lock_ms']:.1f} ms"))
+            except Exception as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT document_write;")
+                cursor.execute("RELEASE SAVEPOINT document_write;")
+                print(f"!!! WRITER ERROR on Doc ID: {doc_id} !!!")
+                print(traceback.format_exc())
+                failed.append((doc_id, f"Writer Error: {type(e).__name__}: {e}"))
+        conn.commit()
+        print(f"--- Writer {os.getpid()} committed {len(ready) - len(failed)} documents in one transaction "
+              f"(lock wait {lock_wait_ms:.1f} ms, held {(time.perf_counter() - batch_start) * 1000:.1f} ms) ---")
+        for doc_id, message in failed:
+            mark_document_error(doc_id, message)
+            results.append((doc_id, 'Error', message))
+    except Exception as e:
+        # The transaction itself failed (e.g. the lock could not be acquired): nothing was written.
+        print(f"!!! WRITER {os.getpid()} BATCH FAILED: {type(e).__name__}: {e} !!!")
+        try: conn.rollback()
+        except Exception: pass
+        results = list(stage_failed)
+        for payload in ready:
+            mark_document_error(payload["doc_id"], f"Writer Error: {type(e).__name__}: {e}")
+            results.append((payload["doc_id"], 'Error', str(e)))
+    finally:
+        for payload in payloads:
+            shutil.rmtree(_staging_dir_for(payload["doc_id"]), ignore_errors=True)
+    return results
+
+def _hand_off_payload(payload: dict):
+    """Sends a payload over this worker's pool pipe to the task manager, which queues it for the index writer."""
+    send_task_output((payload["doc_id"], payload.get("tier", "full")), pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL))
+
+def _submit_payload(conn, payload: dict):
+    """
+    Hands a computed payload to the index writer when this worker's pool forwards
+    task outputs to one (the app's task manager does). Without a writer (CLI use)
+    the payload is written directly. Returns the write timings, or None if handed off.
+    """
+    if task_outputs_accepted():
+        _hand_off_payload(payload)
+        return None
+    return _write_document_payload(conn, payload)
+
+# Enrichment of a document that is already keyword-searchable keeps it 'Searchable' while it runs.
+_SET_INDEXING_STATUS = "status = CASE WHEN status = 'Searchable' THEN 'Searchable' ELSE 'Indexing' END, status_message = ?"
+
+def process_document(doc_id, text_only: bool = False):
+    """
+    Worker function using a strict two-phase model: every expensive step runs
+    in memory first, then the results are written in a single short transaction,
+    either by the index writer process or, when none is attached, directly.
+    With `text_only` it runs tier 1 only: the text goes to content_index and the
+    document becomes 'Searchable' until it is enriched.
+    """
+    conn = None
+    handed_off = False
+    try:
+        conn = get_db_conn()
+
+        conn.execute(f"UPDATE documents SET {_SET_INDEXING_STATUS} WHERE id = ?",
+                     ('Extracting text...' if text_only else 'Worker process started...', doc_id))
         conn.commit()
-        print(f"--- Worker {os.getpid()} finished Doc ID: {doc_id} ---")
+
+        doc_info = conn.execute("SELECT relative_path, file_type FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        if not doc_info:
+            raise ValueError(f"No document found with ID: {doc_id}")
+
+        print(f"--- Worker {os.getpid()} processing Doc ID: {doc_id} (Type: {doc_info['file_type']}) ---")
+        # Workers handle many documents, so the peak is reset to make it per-document (Linux only).
+        reset_peak_rss()
+        
+        # --- PHASE 1: COMPUTE (NO WRITE LOCK HELD) ---
+        payload = _build_text_payload(conn, doc_id, doc_info) if text_only else _build_document_payload(conn, doc_id, doc_info)
+
+        payload["stats"]["peak_rss_mb"] = peak_rss_mb()
+        reused = payload["stats"].get("pages_reused")
+        reuse_note = f", {reused} unchanged pages reused" if reused else ""
+
+        # --- PHASE 2: DATABASE WRITE (INDEX WRITER, OR ONE SHORT TRANSACTION) ---
+        timings = _submit_payload(conn, payload)
+        if timings is None:
+            handed_off = True
+            print(f"--- Worker {os.getpid()} computed Doc ID: {doc_id}, handed to writer (peak RSS {_format_mb(payload['stats']['peak_rss_mb'])}{reuse_note}) ---")
+            return "QUEUED"
+        print(f"--- Worker {os.getpid()} finished Doc ID: {doc_id} (write lock held {timings['write_lock_ms']:.1f} ms, peak RSS {_format_mb(timings['peak_rss_mb'])}{reuse_note}) ---")
         return "SUCCESS"
 
     except Exception as e:
@@ -577,36 +1117,233 @@ def process_document(doc_id):
     finally:
         if conn:
             conn.close()
+        # Once handed off, the staged windows belong to the writer, which removes them after writing.
+        if not handed_off:
+            shutil.rmtree(_staging_dir_for(doc_id), ignore_errors=True)
 
-def _gather_files_recursively(base_dir: Path, target_dir: Path, supported_patterns: list, virtual_prefix: str = "") -> list:
+# --- MICRO-BATCHES ---
+# Small documents (single-page HTML and EML, short TXT and SRT files) cost more in
+# per-task overhead than in compute, so the task manager hands them to a worker in
+# batches that share one connection, one status commit and one write transaction.
+
+def process_document_batch(doc_ids: list, text_only: bool = False) -> dict:
     """
-    Helper function to gather files, allowing for virtual prefix mapping if
-    scanning an external directory mapped by an .rlink file.
+    Worker task: indexes several small documents (tier 1 only with `text_only`).
+    A document that fails is marked 'Error' on its own and the rest of the batch
+    carries on. Returns counts of the documents handed to the writer, written
+    directly, and failed.
     """
-    files = []
+    conn = None
+    handed_off, written, failed = set(), 0, []
     try:
-        # Use os.walk instead of rglob to gracefully bypass Windows PermissionErrors
-        for root, dirs, filenames in os.walk(target_dir):
-            for filename in filenames:
-                if any(fnmatch.fnmatch(filename.lower(), p.lower()) for p in supported_patterns):
-                    file_path = Path(root) / filename
-                    
-                    try:
-                        if virtual_prefix:
-                            rel_path_str = f"{virtual_prefix}/{file_path.relative_to(target_dir).as_posix()}"
-                        else:
-                            rel_path_str = file_path.relative_to(base_dir).as_posix()
-                            
-                        files.append((file_path, rel_path_str))
-                    except ValueError:
-                        continue # Skip if relative_to fails
+        conn = get_db_conn()
+        placeholders = ','.join('?' * len(doc_ids))
+        conn.execute(f"UPDATE documents SET {_SET_INDEXING_STATUS} WHERE id IN ({placeholders})",
+                     (f'Worker process started (batch of {len(doc_ids)})...', *doc_ids))
+        conn.commit()
+        doc_infos = {row['id']: row for row in conn.execute(f"SELECT id, relative_path, file_type FROM documents WHERE id IN ({placeholders})", doc_ids)}
+
+        print(f"--- Worker {os.getpid()} processing a batch of {len(doc_ids)} small documents ---")
+        payloads = []
+        for doc_id in doc_ids:
+            doc_info = doc_infos.get(doc_id)
+            if not doc_info:
+                failed.append((doc_id, f"Worker Error: ValueError: No document found with ID: {doc_id}"))
+                continue
+            reset_peak_rss()
+            try:
+                payload = _build_text_payload(conn, doc_id, doc_info) if text_only else _build_document_payload(conn, doc_id, doc_info)
+            except Exception as e:
+                print(f"!!! WORKER {os.getpid()} ERROR on Doc ID: {doc_id} (batch) !!!")
+                print(traceback.format_exc())
+                failed.append((doc_id, f"Worker Error: {type(e).__name__}: {e}"))
+                continue
+            payload["stats"]["peak_rss_mb"] = peak_rss_mb()
+            payloads.append(payload)
+
+        if task_outputs_accepted():
+            for payload in payloads:
+                _hand_off_payload(payload)
+                handed_off.add(payload["doc_id"])
+        else:
+            # write_document_batch marks its own failures as 'Error'.
+            written = sum(1 for _, status, _ in write_document_batch(conn, payloads) if status != 'Error')
+
+        for doc_id, message in failed:
+            mark_document_error(doc_id, message)
+        print(f"--- Worker {os.getpid()} finished a batch of {len(doc_ids)}: {len(handed_off)} handed to writer, {written} written, {len(failed)} failed ---")
+        return {'documents': len(doc_ids), 'queued': len(handed_off), 'written': written, 'failed': len(failed)}
+    finally:
+        if conn:
+            conn.close()
+        for doc_id in doc_ids:
+            if doc_id not in handed_off:
+                shutil.rmtree(_staging_dir_for(doc_id), ignore_errors=True)
+
+# --- INTRA-DOCUMENT PARALLELISM ---
+# Giant PDFs are split into page ranges that run as separate tasks on the worker
+# pool. Each range stages its rows like a streamed document; one merge task then
+# hands every range to the write phase as a single streamed payload.
+
+def split_document_into_ranges(file_type: str, page_count: int, worker_count: int) -> Union[list, None]:
+    """
+    Called by the task manager before dispatching a document. Returns a list of
+    (first_page, last_page) ranges if the document is a PDF large enough to be
+    split across workers, otherwise None (process it as a single task). Works from
+    the page count recorded at discovery (or by the last index) alone, so the
+    manager thread never opens the file or writes to the database here.
+    """
+    if worker_count < 2 or file_type != 'PDF' or not page_count or page_count <= PARALLEL_SPLIT_PAGE_THRESHOLD:
+        return None
+    range_count = max(1, min(worker_count, page_count // PARALLEL_MIN_RANGE_PAGES))
+    if range_count < 2:
+        return None
+    range_size = -(-page_count // range_count)
+    return [(first, min(first + range_size - 1, page_count)) for first in range(1, page_count + 1, range_size)]
+
+def process_page_range(doc_id, first_page: int, last_page: int) -> dict:
+    """Worker task: stages one page range of a split document. Only its status message is written to the database."""
+    reset_peak_rss()
+    compute_start = time.perf_counter()
+    conn = get_db_conn()
+    try:
+        doc_info = conn.execute("SELECT relative_path FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        if not doc_info:
+            raise ValueError(f"No document found with ID: {doc_id}")
+        stored_hashes = _load_page_hashes(conn, doc_id)
+        if first_page == 1:
+            conn.execute(f"UPDATE documents SET {_SET_INDEXING_STATUS} WHERE id = ?", ('Split into page ranges across workers...', doc_id))
+            conn.commit()
+    finally:
+        conn.close()
+
+    print(f"--- Worker {os.getpid()} processing Doc ID: {doc_id} pages {first_page}-{last_page} ---")
+    with fitz.open(resolve_document_path(doc_info['relative_path'])) as pdf_doc:
+        page_count = pdf_doc.page_count
+        summary = _stage_page_windows(doc_id, pdf_doc, stored_hashes, first_page, min(last_page, page_count), spill_prefix=f"range_{first_page:06d}")
+    summary.update({
+        "first_page": first_page,
+        "last_page": last_page,
+        "page_count": page_count,
+        "compute_ms": (time.perf_counter() - compute_start) * 1000,
+        "peak_rss_mb": peak_rss_mb(),
+    })
+    return summary
+
+def merge_page_ranges(doc_id, range_results: list) -> str:
+    """Worker task: writes every staged range of a split document as one streamed payload and marks it 'Indexed'."""
+    conn = None
+    handed_off = False
+    try:
+        conn = get_db_conn()
+        staged = sorted(range_results, key=lambda summary: summary["first_page"])
+        if staged[-1]["last_page"] < staged[-1]["page_count"]:
+            # The ranges were planned from the page count recorded at discovery; the file has since grown.
+            raise ValueError(f"Planned {staged[-1]['last_page']} pages but the PDF now has {staged[-1]['page_count']}. Re-queue the document.")
+        payload = _staged_payload(doc_id, staged[0]["page_count"], _load_page_hashes(conn, doc_id), staged,
+                                  sum(summary["compute_ms"] for summary in staged))
+        timings = _submit_payload(conn, payload)
+        if timings is None:
+            handed_off = True
+            print(f"--- Worker {os.getpid()} handed {len(staged)} page ranges of Doc ID: {doc_id} to the writer ---")
+            return "QUEUED"
+        print(f"--- Worker {os.getpid()} merged {len(staged)} page ranges for Doc ID: {doc_id} (write lock held {timings['write_lock_ms']:.1f} ms) ---")
+        return "SUCCESS"
     except Exception as e:
-        print(f"[WARN] Error scanning directory {target_dir}: {e}")
-        
-    return files
+        print(f"!!! WORKER {os.getpid()} ERROR merging page ranges for Doc ID: {doc_id} !!!")
+        print(traceback.format_exc())
+        if conn:
+            conn.rollback()
+        mark_document_error(doc_id, f"Worker Error: {type(e).__name__}: {e}")
+        raise
+    finally:
+        if conn:
+            conn.close()
+        if not handed_off:
+            shutil.rmtree(_staging_dir_for(doc_id), ignore_errors=True)
 
-def discover_and_register_documents():
-    """Scans the source directory (and any .rlink aliases), registers new files, and moves missing ones to the Recycle Bin."""
+def mark_document_error(doc_id, message: str):
+    """Marks a document as failed and discards anything it had staged."""
+    shutil.rmtree(_staging_dir_for(doc_id), ignore_errors=True)
+    conn = None
+    try:
+        conn = get_db_conn()
+        _clear_staged_rows(conn, doc_id)
+        conn.execute("UPDATE documents SET status = ?, status_message = ? WHERE id = ?", ('Error', message[:1000], doc_id))
+        conn.commit()
+    except Exception as e:
+        print(f"CRITICAL: Failed to update error status for doc {doc_id}. Error: {e}")
+    finally:
+        if conn: conn.close()
+
+MISSING_FILE_MESSAGE = 'File removed from directory or alias disconnected. View in Settings > Recycle Bin.'
+
+def _register_discovered_file(conn, file_path, rel_path_str, file_state, stored_hash, stored_status) -> dict:
+    """
+    Reconciles one file found on disk with its documents row: migrates a legacy md5 hash, registers the file
+    as 'New' if it is new or its content changed, or restores it from the Recycle Bin to the tier it had reached.
+    Returns which of those happened; 'restored' holds the status it was restored to.
+    """
+    stats, current_hash_str, legacy_md5 = file_state
+    current_size = stats.st_size
+    current_mtime = datetime.datetime.fromtimestamp(stats.st_mtime)
+    file_type = file_path.suffix[1:].upper()
+    outcome = {'migrated': False, 'registered': False, 'restored': False}
+
+    if legacy_md5 is not None and stored_hash == legacy_md5:
+        # Content is unchanged since it was registered, so only the hash format changes.
+        conn.execute("UPDATE documents SET file_hash = ? WHERE relative_path = ?", (current_hash_str, rel_path_str))
+        stored_hash = current_hash_str
+        outcome['migrated'] = True
+
+    if stored_status == 'Missing':
+        # Leaving the Recycle Bin, whether restored or re-registered, makes its existing rows count again.
+        doc_id = conn.execute("SELECT id FROM documents WHERE relative_path = ?", (rel_path_str,)).fetchone()[0]
+        browse_cache.add_documents(conn, [doc_id])
+
+    if stored_hash != current_hash_str:
+        print(f"Registering new/modified file: {rel_path_str} (Type: {file_type})")
+        # Recorded now so the task manager can plan page-range splits without opening the PDF itself.
+        page_count = _pdf_page_count(file_path) if file_type == 'PDF' else None
+        conn.execute(
+            """
+            INSERT INTO documents (relative_path, file_hash, file_type, status, status_message, file_size_bytes, file_modified_at, processed_at, page_count) 
+            VALUES (?, ?, ?, 'New', 'Ready for processing', ?, ?, CURRENT_TIMESTAMP, ?)
+            ON CONFLICT(relative_path) 
+            DO UPDATE SET file_hash=excluded.file_hash, 
+                          file_type=excluded.file_type,
+                          status='New', 
+                          status_message='File modified, ready for re-processing', 
+                          file_size_bytes=excluded.file_size_bytes,
+                          file_modified_at=excluded.file_modified_at,
+                          processed_at=excluded.processed_at,
+                          page_count=COALESCE(excluded.page_count, documents.page_count);
+            """, 
+            (rel_path_str, current_hash_str, file_type, current_size, current_mtime, page_count)
+        )
+        outcome['registered'] = True
+    elif stored_status == 'Missing':
+        print(f"Restoring previously missing file: {rel_path_str}")
+        # Only a full index writes index stats (and page hashes); without either the document never got past tier 1.
+        if conn.execute("SELECT EXISTS(SELECT 1 FROM document_index_stats WHERE doc_id = ?) OR EXISTS(SELECT 1 FROM document_page_hashes WHERE doc_id = ?)",
+                        (doc_id, doc_id)).fetchone()[0]:
+            status, message = 'Indexed', 'Restored from Recycle Bin'
+        elif conn.execute("SELECT 1 FROM content_index WHERE doc_id = ? LIMIT 1", (doc_id,)).fetchone():
+            status, message = 'Searchable', 'Restored from Recycle Bin. Enrichment pending.'
+        else:
+            status, message = 'New', 'Restored from Recycle Bin, ready for processing'
+            outcome['registered'] = True
+        conn.execute("UPDATE documents SET status = ?, status_message = ? WHERE id = ?", (status, message, doc_id))
+        outcome['restored'] = status
+    return outcome
+
+def discover_and_register_documents(full_verify: bool = False) -> list:
+    """
+    Scans the source directory (and any .rlink aliases), registers new files, and moves missing ones to the Recycle Bin.
+    Unchanged files are recognised from the stat cache without being read; `full_verify` re-hashes every file.
+    Returns a list (it used to return "SUCCESS"): the IDs of documents restored as 'Searchable', whose enrichment
+    the caller should queue. Errors are logged and give an empty list, so the result is always safe to iterate.
+    """
     print(f"--- Scanning for documents in {DOCUMENTS_DIR} ---")
     conn = get_db_conn() 
     try:
@@ -621,27 +1358,12 @@ def discover_and_register_documents():
         
         registered_count = 0
         restored_count = 0
-        supported_patterns = ["*.pdf", "*.txt", "*.html", "*.srt", "*.eml"]
-        
-        all_files_with_virtual_paths = _gather_files_recursively(DOCUMENTS_DIR, DOCUMENTS_DIR, supported_patterns)
-        
-        for rlink_file in DOCUMENTS_DIR.glob('*.rlink'):
-            if rlink_file.is_file():
-                try:
-                    target_path_str = rlink_file.read_text(encoding='utf-8').strip()
-                    target_dir = Path(target_path_str).resolve() # Ensure path is normalized
-                    if target_dir.exists() and target_dir.is_dir():
-                        print(f"  [INFO] Following alias '{rlink_file.name}' to: {target_dir}")
-                        all_files_with_virtual_paths.extend(
-                            _gather_files_recursively(DOCUMENTS_DIR, target_dir, supported_patterns, virtual_prefix=rlink_file.name)
-                        )
-                    else:
-                        print(f"  [WARN] Alias target does not exist or is not a directory: {target_dir}")
-                except Exception as e:
-                    print(f"  [WARN] Failed to read alias file {rlink_file}: {e}")
+        migrated_count = 0
+        unenriched_ids = []
+        all_files_with_virtual_paths = gather_document_files(DOCUMENTS_DIR)
             
         found_paths_exact = set() 
-
+        candidates = []
         for file_path, rel_path_str in all_files_with_virtual_paths:
             
             # --- FIX: Align OS path casing with Database casing ---
@@ -650,74 +1372,149 @@ def discover_and_register_documents():
                 rel_path_str = db_files_lower[lower_rel]
                 
             found_paths_exact.add(rel_path_str) 
+            candidates.append((file_path, rel_path_str))
+
+        # Rows registered before the switch to blake2b still hold md5 hashes; those files also get an md5 digest for migration.
+        legacy_paths = {file_path for file_path, rel_path_str in candidates if rel_path_str in db_files and is_legacy_hash(db_files[rel_path_str])}
+        file_states, scan_report = scan_file_hashes([file_path for file_path, _ in candidates], full_verify=full_verify, legacy_md5_paths=legacy_paths)
+
+        for file_path, rel_path_str in candidates:
+            if file_path not in file_states:
+                continue # Unreadable right now; leave its row alone rather than trashing it
             
-            stats = file_path.stat()
-            current_size = stats.st_size
-            current_mtime = datetime.datetime.fromtimestamp(stats.st_mtime)
-            file_type = file_path.suffix[1:].upper()
-
-            hasher = hashlib.md5()
-            with open(file_path, 'rb') as f:
-                buf = f.read(65536)
-                while len(buf) > 0:
-                    hasher.update(buf)
-                    buf = f.read(65536)
-            current_hash_str = hasher.hexdigest()
-
-            if rel_path_str not in db_files or db_files.get(rel_path_str) != current_hash_str:
-                print(f"Registering new/modified file: {rel_path_str} (Type: {file_type})")
-                conn.execute(
-                    """
-                    INSERT INTO documents (relative_path, file_hash, file_type, status, status_message, file_size_bytes, file_modified_at, processed_at) 
-                    VALUES (?, ?, ?, 'New', 'Ready for processing', ?, ?, CURRENT_TIMESTAMP)
-                    ON CONFLICT(relative_path) 
-                    DO UPDATE SET file_hash=excluded.file_hash, 
-                                  file_type=excluded.file_type,
-                                  status='New', 
-                                  status_message='File modified, ready for re-processing', 
-                                  file_size_bytes=excluded.file_size_bytes,
-                                  file_modified_at=excluded.file_modified_at,
-                                  processed_at=excluded.processed_at;
-                    """, 
-                    (rel_path_str, current_hash_str, file_type, current_size, current_mtime)
-                )
-                registered_count += 1
-            else:
-                if db_statuses.get(rel_path_str) == 'Missing':
-                    print(f"Restoring previously missing file: {rel_path_str}")
-                    conn.execute("UPDATE documents SET status = 'Indexed', status_message = 'Restored from Recycle Bin' WHERE relative_path = ?", (rel_path_str,))
-                    restored_count += 1
+            outcome = _register_discovered_file(conn, file_path, rel_path_str, file_states[file_path], db_files.get(rel_path_str), db_statuses.get(rel_path_str))
+            migrated_count += outcome['migrated']
+            registered_count += outcome['registered']
+            restored_count += bool(outcome['restored'])
+            if outcome['restored'] == 'Searchable':
+                unenriched_ids.append(db_path_to_id[rel_path_str])
 
         # 2. IDENTIFY MISSING FILES (Soft Delete to Recycle Bin)
         missing_paths = set(db_files.keys()) - found_paths_exact
         missing_count = 0
 
         if missing_paths:
+            trashed_ids = []
             for path in missing_paths:
                 if db_statuses.get(path) != 'Missing':
                     doc_id = db_path_to_id[path]
                     print(f"  Moving document to Recycle Bin: {path}")
-                    conn.execute("UPDATE documents SET status = 'Missing', status_message = 'File removed from directory or alias disconnected. View in Settings > Recycle Bin.' WHERE id = ?", (doc_id,))
-                    missing_count += 1
+                    conn.execute("UPDATE documents SET status = 'Missing', status_message = ? WHERE id = ?", (MISSING_FILE_MESSAGE, doc_id))
+                    trashed_ids.append(doc_id)
+            browse_cache.remove_documents(conn, trashed_ids)
+            missing_count = len(trashed_ids)
 
         conn.commit()
+        print(f"  [INFO] {format_scan_report(scan_report)}")
+        if migrated_count:
+            print(f"  [INFO] Migrated {migrated_count} stored md5 hashes to blake2b.")
         print(f"--- Discovery complete. Registered {registered_count}. Restored {restored_count}. Trashed {missing_count}. ---")
-        return "SUCCESS"
+        return unenriched_ids
         
     except Exception as e:
         print(f"!!! ERROR during document discovery: {e} !!!")
         print(traceback.format_exc())
         try: conn.rollback()
         except sqlite3.Error: pass
+        return []
     finally:
         if conn: conn.close()
 
+def _align_path_casing(conn, changed_files: list) -> list:
+    """
+    Rewrites each relative path to the casing already stored in documents, as discovery does, so a file whose
+    casing differs on a case-insensitive filesystem is matched to its row instead of registered twice.
+    """
+    rel_paths = list(dict.fromkeys(rel_path_str for _, rel_path_str in changed_files))
+    known = set()
+    for i in range(0, len(rel_paths), 500):
+        chunk = rel_paths[i:i + 500]
+        known.update(row[0] for row in conn.execute(f"SELECT relative_path FROM documents WHERE relative_path IN ({','.join('?' * len(chunk))})", chunk))
+    if len(known) == len(rel_paths):
+        return changed_files
+    # Only paths without an exact match need the case-folded map, which covers the whole table.
+    db_files_lower = {row[0].lower(): row[0] for row in conn.execute("SELECT relative_path FROM documents")}
+    return [(file_path, rel_path_str if rel_path_str in known else db_files_lower.get(rel_path_str.lower(), rel_path_str))
+            for file_path, rel_path_str in changed_files]
+
+def register_changed_paths(changed_files: list, removed_prefixes: list = ()) -> tuple:
+    """
+    Targeted counterpart of discover_and_register_documents, used by the watch mode: only the given
+    (file_path, relative_path) pairs and removed directory prefixes are examined. Files that no longer
+    exist, and every document under a removed prefix, are moved to the Recycle Bin. Returns (IDs of documents
+    that were registered or modified, IDs of documents restored as 'Searchable'). The first are marked 'Queued'
+    here, as the caller queues them for processing; the second need their enrichment queued.
+    """
+    conn = get_db_conn()
+    try:
+        trashed_ids = []
+        for prefix in removed_prefixes:
+            # Range bounds instead of LIKE so the relative_path index is used ('0' sorts right after '/').
+            trashed_ids.extend(row['id'] for row in conn.execute("SELECT id FROM documents WHERE relative_path >= ? AND relative_path < ? AND status != 'Missing'",
+                                                                  (prefix + '/', prefix + '0')))
+
+        changed_files = _align_path_casing(conn, changed_files)
+        present = [(file_path, rel_path_str) for file_path, rel_path_str in changed_files if file_path.is_file()]
+        for file_path, rel_path_str in changed_files:
+            if not file_path.is_file():
+                row = conn.execute("SELECT id FROM documents WHERE relative_path = ? AND status != 'Missing'", (rel_path_str,)).fetchone()
+                if row: trashed_ids.append(row['id'])
+
+        trashed_ids = list(dict.fromkeys(trashed_ids))
+        conn.executemany("UPDATE documents SET status = 'Missing', status_message = ? WHERE id = ?", [(MISSING_FILE_MESSAGE, doc_id) for doc_id in trashed_ids])
+        browse_cache.remove_documents(conn, trashed_ids)
+        missing_count = len(trashed_ids)
+
+        rel_paths = [rel_path_str for _, rel_path_str in present]
+        db_rows = {}
+        for i in range(0, len(rel_paths), 500):
+            chunk = rel_paths[i:i + 500]
+            for row in conn.execute(f"SELECT relative_path, file_hash, status FROM documents WHERE relative_path IN ({','.join('?' * len(chunk))})", chunk):
+                db_rows[row['relative_path']] = row
+
+        legacy_paths = {file_path for file_path, rel_path_str in present if rel_path_str in db_rows and is_legacy_hash(db_rows[rel_path_str]['file_hash'])}
+        file_states, _ = scan_file_hashes([file_path for file_path, _ in present], legacy_md5_paths=legacy_paths, partial=True)
+
+        registered_paths, unenriched_ids = [], []
+        for file_path, rel_path_str in present:
+            if file_path not in file_states:
+                continue
+            row = db_rows.get(rel_path_str)
+            outcome = _register_discovered_file(conn, file_path, rel_path_str, file_states[file_path], row['file_hash'] if row else None, row['status'] if row else None)
+            if outcome['registered']:
+                registered_paths.append(rel_path_str)
+            elif outcome['restored'] == 'Searchable':
+                unenriched_ids.append(conn.execute("SELECT id FROM documents WHERE relative_path = ?", (rel_path_str,)).fetchone()['id'])
+
+        doc_ids = []
+        for i in range(0, len(registered_paths), 500):
+            chunk = registered_paths[i:i + 500]
+            doc_ids.extend(row['id'] for row in conn.execute(f"SELECT id FROM documents WHERE relative_path IN ({','.join('?' * len(chunk))})", chunk))
+        conn.executemany("UPDATE documents SET status = 'Queued', status_message = 'Pending assignment' WHERE id = ?", [(doc_id,) for doc_id in doc_ids])
+        conn.commit()
+        if doc_ids or missing_count:
+            print(f"--- Watch: Registered {len(doc_ids)}. Trashed {missing_count}. ---")
+        return doc_ids, unenriched_ids
+    except Exception as e:
+        print(f"!!! ERROR applying watched changes: {e} !!!")
+        print(traceback.format_exc())
+        try: conn.rollback()
+        except sqlite3.Error: pass
+        return [], []
+    finally:
+        conn.close()
+
 def update_browse_cache():
-    """Recomputes the aggregated entity data, IGNORING files in the recycle bin."""
-    print("--- Starting update of Aggregated View Cache ---")
+    """
+    Recomputes the aggregated entity data from scratch, IGNORING files in the recycle bin, and reconciles
+    browse_cache with it. The cache is maintained incrementally as documents are indexed, trashed and
+    restored, so this is a verification pass: it reports how many rows had drifted and rewrites only those.
+    """
+    print("--- Starting verification of Aggregated View Cache ---")
     conn = get_db_conn() 
     try:
-        conn.execute("BEGIN")
+        # IMMEDIATE so no incremental update can land between the aggregation and the repair.
+        conn.execute("BEGIN IMMEDIATE")
         print("Executing aggregation query...")
         query = """
             SELECT 
@@ -732,23 +1529,25 @@ def update_browse_cache():
             WHERE d.status != 'Missing'
             GROUP BY e.id, e.text, e.label
         """
-        aggregated_data = conn.execute(query).fetchall()
-        print(f"Found {len(aggregated_data)} unique entities with document counts.")
-        print("Updating browse_cache table...")
-        
-        conn.execute("DELETE FROM browse_cache")
-        if aggregated_data:
-            print(f"Inserting {len(aggregated_data)} rows into the new cache...")
-            insert_query = """
-                INSERT INTO browse_cache (entity_id, entity_text, entity_label, document_count, appearance_count) 
+        expected = {row['entity_id']: tuple(row) for row in conn.execute(query)}
+        print(f"Found {len(expected)} unique entities with document counts.")
+        cached = {row['entity_id']: tuple(row) for row in conn.execute("SELECT entity_id, entity_text, entity_label, document_count, appearance_count FROM browse_cache")}
+
+        drifted = [row for entity_id, row in expected.items() if cached.get(entity_id) != row]
+        stale = [(entity_id,) for entity_id in cached.keys() - expected.keys()]
+        if drifted:
+            conn.executemany("""
+                INSERT OR REPLACE INTO browse_cache (entity_id, entity_text, entity_label, document_count, appearance_count) 
                 VALUES (?, ?, ?, ?, ?)
-            """
-            conn.executemany(insert_query, [
-                (row['entity_id'], row['entity_text'], row['entity_label'], row['document_count'], row['appearance_count']) 
-                for row in aggregated_data
-            ])
+            """, drifted)
+        if stale:
+            conn.executemany("DELETE FROM browse_cache WHERE entity_id = ?", stale)
         conn.commit()
-        print("--- Aggregated View Cache update finished successfully. ---")
+        if drifted or stale:
+            print(f"[WARN] Browse cache had drifted: repaired {len(drifted)} rows and removed {len(stale)} stale rows.")
+        else:
+            print("[INFO] Browse cache matches the full aggregation.")
+        print("--- Aggregated View Cache verification finished successfully. ---")
     except Exception as e:
         print(f"!!! ERROR updating browse cache: {e} !!!")
         print(traceback.format_exc())
@@ -3,7 +3,6 @@ import sys
 import getpass
 import re
 import json
-import ollama
 import html
 import heapq  
 from datetime import datetime
@@ -11,7 +10,6 @@ from pathlib import Path
 from typing import Dict, Any, Union, List, Tuple, Set, Optional
 from collections import defaultdict
 import numpy as np
-import struct # Needed to pack numpy arrays for sqlite-vec
 
 # --- Add project to Python path to access its modules ---
 project_dir = Path(__file__).resolve().parent.parent
@@ -22,6 +20,9 @@ from project.database import get_db
 from werkzeug.security import check_password_hash
 from processing_pipeline import extract_text_for_copying
 from project.config import DOCUMENTS_DIR, REDLEAF_BASE_URL, EMBEDDING_MODEL, resolve_document_path
+from project.embeddings import embed_query, warn_if_mixed_models
+from project.embedding_broker import interactive_session
+from project import llm
 
 # --- Import prompts ---
 from project.prompts import (
@@ -65,19 +66,15 @@ def _internal_fts_search(db, query: str, limit: int = 50) -> List[Dict]:
     """
     return [dict(r) for r in db.execute(sql, [fts_query, limit]).fetchall()]
 
-def serialize_f32(vector: List[float]) -> bytes:
-    """Serializes a list of floats into a compact byte format for sqlite-vec."""
-    return struct.pack("%sf" % len(vector), *vector)
-
 def _internal_semantic_search(db, query: str, limit: int = 50) -> List[Dict]:
     # --- SQLITE-VEC OPTIMIZED SEARCH ---
     try:
-        query_embedding_response = ollama.embeddings(model=EMBEDDING_MODEL, prompt=query)
-        # Serialize the raw float list directly for sqlite-vec
-        query_blob = serialize_f32(query_embedding_response['embedding'])
+        # Goes through the embedding broker when it is running; the blob is ready for sqlite-vec.
+        query_blob = embed_query(query)
     except Exception as e:
         print(f"{Style.RED}[ERROR] Could not generate query embedding: {e}{Style.END}")
         return []
+    warn_if_mixed_models(db)
 
     top_k_heap = [] # Stores tuples of (distance, doc_id, page_number, snippet)
 
@@ -245,7 +242,9 @@ class BaseAssistant:
     
     def get_assistant_response(self, messages: List[Dict], use_json: bool = False) -> str:
         try:
-            response = ollama.chat(model=self.reasoning_model, messages=messages, format="json" if use_json else "")
+            # Background indexing embeddings are held back while the model answers.
+            with interactive_session():
+                response = llm.chat(model=self.reasoning_model, messages=messages, format="json" if use_json else "")
             return response['message']['content']
         except Exception as e:
             return f"Error contacting Ollama: {e}"
@@ -253,10 +252,11 @@ class BaseAssistant:
     def get_assistant_response_stream(self, messages: List[Dict]) -> str:
         full_response = ""
         try:
-            stream = ollama.chat(model=self.reasoning_model, messages=messages, stream=True)
-            for chunk in stream:
-                token = chunk['message']['content']
-                if token: print(token, end='', flush=True); full_response += token
+            with interactive_session():
+                stream = llm.chat(model=self.reasoning_model, messages=messages, stream=True)
+                for chunk in stream:
+                    token = chunk['message']['content']
+                    if token: print(token, end='', flush=True); full_response += token
         except Exception as e:
             error_message = f"Error contacting Ollama: {e}"; print(error_message); return error_message
         print()
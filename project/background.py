@@ -6,27 +6,85 @@ import time
 import threading
 import traceback
 import functools
+import collections
 import sqlite3
 import atexit
+import math
 import multiprocessing # <--- ADDED IMPORT
-from concurrent.futures import ProcessPoolExecutor, CancelledError
+from concurrent.futures import CancelledError
 from flask import current_app
 
-try:
-    from concurrent.futures import BrokenProcessPool
-except ImportError:
-    class BrokenProcessPool(Exception):
-        pass
-
 import processing_pipeline
 import spacy 
-from .config import REASONING_MODEL
+from .config import (
+    REASONING_MODEL, WRITER_QUEUE_MAX_DOCS, DOCUMENTS_DIR, DOCUMENT_WATCH_ENABLED,
+    WATCH_DEBOUNCE_SECONDS, WATCH_MAX_DELAY_SECONDS, WATCH_RECONCILE_INTERVAL_SECONDS,
+    SCHEDULER_PREFETCH_DEPTH, MANAGER_IDLE_WAIT_SECONDS, WORKER_START_METHOD,
+    WORKER_MAX_TASKS, WORKER_MAX_RSS_MB, WORKER_POOL_SIZING, MEMORY_RESERVE_MB,
+    WORKER_MEMORY_ESTIMATE_MB, POOL_SIZING_INTERVAL_SECONDS,
+    TASK_TIMEOUT_BASE_SECONDS, TASK_TIMEOUT_PER_PAGE_SECONDS, TASK_TIMEOUT_MAX_SECONDS,
+    MICRO_BATCH_SIZE, MICRO_BATCH_MAX_BYTES, MICRO_BATCH_FILE_TYPES,
+    HUGE_DOC_MIN_PAGES, HUGE_DOC_MIN_BYTES, HUGE_LANE_MAX_TASKS, TIERED_INDEXING,
+    EMBEDDING_BROKER_ENABLED, EMBEDDING_BROKER_RETRY_SECONDS
+)
+from . import index_writer, file_watcher, embedding_broker
+from .scheduler import TaskQueue, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, PRIORITY_ENRICH
+from .memory import memory_breakdown_mb, process_age_seconds, system_available_mb
+from .worker_pool import WorkerPool, WorkerLost, TaskTimeout, BrokenProcessPool
+from .embedding_backends import embedding_model_id
 
-task_queue = queue.Queue()
+# Set whenever the manager has something to do: a task was queued, a future or
+# thread task finished, or the app is shutting down.
+manager_wakeup = threading.Event()
+task_queue = TaskQueue(manager_wakeup)
+# Internal page-range and merge subtasks of split documents. They are dispatched
+# ahead of task_queue so a split document finishes before new documents start.
+subtask_queue = collections.deque()
+# doc_id -> {'pending': int, 'results': [...], 'error': str or None} for documents split into page ranges.
+split_jobs = {}
+# Tier 2 (enrichment) task types. Enrichment runs the full indexing pipeline; when
+# TIERED_INDEXING is off, 'process' does too and nothing is queued as 'enrich'.
+ENRICH_TASK_TYPES = ('enrich', 'enrich_batch')
+# Task types that occupy a worker process and count towards max_workers.
+PROCESS_TASK_TYPES = ('process', 'process_batch', 'process_range', 'process_merge') + ENRICH_TASK_TYPES
+# The queued task type that indexes a document completely.
+FULL_INDEX_TASK = 'enrich' if TIERED_INDEXING else 'process'
 active_tasks = {}
 active_tasks_lock = threading.Lock()
+# future -> page count known when the task was submitted, for the watchdog's time budget.
+task_page_estimates = {}
+# future -> size lane ('tiny', 'normal' or 'huge') of the document(s) it is working on.
+task_lanes = {}
+# (doc_id, page_count) of huge documents waiting for a free slot in the huge lane, in arrival order.
+huge_lane_waiting = collections.deque()
+# Documents from a micro-batch that failed as a whole; they are retried one at a time.
+unbatched_doc_ids = set()
 executor = None
+# The single index writer process and its queues. Only this process and the writer
+# use the queues: workers send their payloads over their own pool pipe (_accept_payload).
+writer_process = None
+write_queue = None
+writer_done_queue = None
+# doc_id -> task type that recomputes it, for payloads handed to the writer that it has not reported on yet.
+writer_pending = {}
+# Documents queued again because the writer died holding their payload; a second loss marks them 'Error'.
+writer_requeued = set()
+writer_lock = threading.Lock()
+# The writer's (doc_id, status, message) reports, relayed from writer_done_queue by _relay_writer_results.
+writer_results = queue.Queue()
+# The embedding broker process, when this app started it (None if another process, e.g. the curator, runs it).
+embedding_broker_process = None
+embedding_broker_checked_at = 0.0
+# Workers report their startup time and memory here once their initializer finishes.
+worker_report_queue = None
+worker_startup_stats = collections.deque(maxlen=64)
+worker_start_method = None
+# Last adaptive sizing decision, reported by /api/admin/worker-stats.
+pool_sizing = {'mode': WORKER_POOL_SIZING, 'checked_at': 0.0, 'available_mb': None, 'footprint_mb': None, 'throttled': False}
 restart_executor_event = threading.Event()
+# Set while enrichment is paused: queued 'enrich' tasks below interactive priority stay queued.
+enrichment_paused = threading.Event()
+document_watcher = None
 # --- ADDED: Event to signal graceful shutdown ---
 shutdown_event = threading.Event() 
 
@@ -36,7 +94,8 @@ def get_system_settings():
         'max_workers': 1, 
         'use_gpu': False, 
         'html_parsing_mode': 'generic',
-        'reasoning_model': REASONING_MODEL
+        'reasoning_model': REASONING_MODEL,
+        'enrichment_paused': False
     }
     settings = defaults.copy()
     conn = None
@@ -56,6 +115,8 @@ def get_system_settings():
             
         if db_settings.get('reasoning_model'):
             settings['reasoning_model'] = db_settings.get('reasoning_model')
+
+        settings['enrichment_paused'] = db_settings.get('enrichment_paused') == 'true'
             
     except Exception as e:
         print(f"Could not read app_settings from DB, using defaults. Error: {e}")
@@ -63,9 +124,11 @@ def get_system_settings():
         if conn: conn.close()
     return settings
 
-def init_worker(use_gpu=False):
-    """Initializes a worker process when it's spawned by the ProcessPoolExecutor."""
-    print(f"Initializing worker process: {os.getpid()}...")
+def init_worker(use_gpu=False, report_queue=None, start_method='spawn'):
+    """Initializes a worker process when it's spawned (or forked from the forkserver) by the worker pool."""
+    init_start = time.perf_counter()
+    preloaded = processing_pipeline.NLP_MODEL is not None
+    print(f"Initializing worker process: {os.getpid()} via {start_method}{' (spaCy model preloaded)' if preloaded else ''}...")
     if use_gpu:
         try:
             spacy.require_gpu()
@@ -79,28 +142,620 @@ def init_worker(use_gpu=False):
         print(f"FATAL ERROR initializing spaCy in worker {os.getpid()}: {e}")
         raise
 
+    init_seconds = time.perf_counter() - init_start
+    age = process_age_seconds()
+    report = {
+        'pid': os.getpid(),
+        'start_method': start_method,
+        'model_preloaded': preloaded,
+        'init_seconds': round(init_seconds, 3),
+        # From process creation to ready; covers interpreter start-up and imports under spawn.
+        'startup_seconds': round(age if age is not None else init_seconds, 3),
+        'recorded_at': time.time(),
+    }
+    report.update({k: round(v, 1) if v is not None else None for k, v in memory_breakdown_mb().items()})
+    print(f"Worker {os.getpid()} ready in {report['startup_seconds']:.2f}s via {start_method} "
+          f"(RSS {report['rss_mb']} MB, PSS {report['pss_mb']} MB, private {report['private_mb']} MB).")
+    if report_queue is not None:
+        report_queue.put(report)
+
+def get_worker_context(use_gpu=False):
+    """Returns the multiprocessing context for the worker pool, falling back to 'spawn' where forkserver cannot be used."""
+    method = WORKER_START_METHOD
+    if method == 'forkserver' and 'forkserver' not in multiprocessing.get_all_start_methods():
+        print("--- Forkserver is not available on this platform; starting workers with 'spawn'. ---")
+        method = 'spawn'
+    elif method == 'forkserver' and use_gpu:
+        print("--- GPU mode is on; starting workers with 'spawn' so each one initializes CUDA itself. ---")
+        method = 'spawn'
+    ctx = multiprocessing.get_context(method)
+    if method == 'forkserver':
+        # Only takes effect when the forkserver first starts; it then stays up, so later pool restarts reuse the loaded model.
+        ctx.set_forkserver_preload(['project.worker_preload'])
+    return ctx
+
+def _drain_worker_reports():
+    while worker_report_queue is not None:
+        try:
+            worker_startup_stats.append(worker_report_queue.get_nowait())
+        except queue.Empty:
+            break
+
+def _worker_footprint_mb() -> float:
+    """The largest per-worker footprint measured recently, or the configured estimate before any measurement."""
+    footprints = list(executor.recent_footprints_mb) if executor is not None else []
+    return max(footprints) if footprints else WORKER_MEMORY_ESTIMATE_MB
+
+def _initial_pool_size(max_workers: int) -> int:
+    """The pool size to start with: max_workers, or in adaptive mode as many workers as available memory allows."""
+    available = system_available_mb() if WORKER_POOL_SIZING == 'adaptive' else None
+    if available is None:
+        return max_workers
+    fits = int((available - MEMORY_RESERVE_MB) // _worker_footprint_mb())
+    size = max(1, min(max_workers, fits))
+    if size < max_workers:
+        print(f"Manager: Starting {size} of {max_workers} workers; {available:.0f} MB available with {MEMORY_RESERVE_MB} MB reserved.")
+    return size
+
+def _update_pool_sizing(max_workers: int):
+    """
+    Adaptive sizing: every POOL_SIZING_INTERVAL_SECONDS, grows the pool by one worker if
+    another measured footprint fits above MEMORY_RESERVE_MB, shrinks it by as many as needed
+    when available memory has dropped below the reserve, and pauses dispatch until it recovers.
+    """
+    now = time.monotonic()
+    if WORKER_POOL_SIZING != 'adaptive' or executor is None or now - pool_sizing['checked_at'] < POOL_SIZING_INTERVAL_SECONDS:
+        return
+    pool_sizing['checked_at'] = now
+    available = system_available_mb()
+    if available is None:
+        return
+    footprint = _worker_footprint_mb()
+    spare = available - MEMORY_RESERVE_MB
+    size = executor.size
+    snapshot = executor.snapshot()
+    starting = any(not w['ready'] for w in snapshot['workers'])
+    if spare >= footprint and not starting:
+        target = size + 1
+    elif spare < 0:
+        target = size - math.ceil(-spare / footprint)
+    else:
+        target = size
+    target = max(1, min(max_workers, target))
+    throttled = spare < 0
+
+    if target != size:
+        print(f"Manager: Resizing worker pool {size} -> {target} ({available:.0f} MB available, ~{footprint:.0f} MB per worker).")
+        executor.resize(target)
+    if throttled != pool_sizing['throttled']:
+        if throttled:
+            print(f"!!! Manager: Only {available:.0f} MB available (reserve {MEMORY_RESERVE_MB} MB). Holding back new documents until memory recovers. !!!")
+        else:
+            print("Manager: Memory has recovered, resuming dispatch.")
+        executor.set_paused(throttled)
+    pool_sizing.update(available_mb=round(available, 1), footprint_mb=round(footprint, 1), throttled=throttled)
+
+def ensure_writer_process(ctx):
+    """
+    Starts the index writer process if it is not running. If it died, it may have
+    done so mid-read, so it gets new queues, and every document whose payload it had
+    not reported on is recovered (see _recover_lost_payloads).
+    """
+    global writer_process, write_queue, writer_done_queue, worker_report_queue
+    if worker_report_queue is None:
+        worker_report_queue = ctx.Queue()
+    if writer_process is not None and writer_process.is_alive():
+        return
+    lost = {}
+    if writer_process is not None:
+        print(f"!!! Manager: Index writer exited with code {writer_process.exitcode}. Restarting it with new queues. !!!")
+        _drain_writer_results()  # Reports it sent before it died.
+    with writer_lock:
+        if writer_process is not None:
+            lost = dict(writer_pending)
+            writer_pending.clear()
+        # Unbounded: backpressure comes from _dispatch_tasks, which holds new documents while the writer is behind.
+        write_queue = ctx.Queue()
+        writer_done_queue = ctx.Queue()
+    threading.Thread(target=_relay_writer_results, args=(writer_done_queue,), name="writer-results", daemon=True).start()
+    writer_process = ctx.Process(target=index_writer.writer_main, args=(write_queue, writer_done_queue), daemon=True)
+    writer_process.start()
+    _recover_lost_payloads(lost)
+
+def _recover_lost_payloads(lost: dict):
+    """
+    Queues again, ahead of other work, the documents whose payloads died with the
+    writer ({doc_id: task type}). A document lost a second time in a row may be what
+    crashes the writer, so it is marked 'Error' instead.
+    """
+    for doc_id, task_type in lost.items():
+        if doc_id in writer_requeued:
+            writer_requeued.discard(doc_id)
+            print(f"!!! Manager: Index writer died twice holding Doc ID {doc_id}. Marking it as failed. !!!")
+            processing_pipeline.mark_document_error(doc_id, "Writer Error: the index writer exited while writing this document, twice.")
+            continue
+        writer_requeued.add(doc_id)
+        print(f"Manager: Index writer died before writing Doc ID {doc_id}. Queuing it again.")
+        task_queue.put((task_type, doc_id), priority=PRIORITY_ENRICH if task_type == 'enrich' else PRIORITY_NORMAL, front=True)
+
+def _relay_writer_results(done_queue):
+    """
+    Moves the writer's reports to writer_results and wakes the manager, so freed
+    writer capacity is used at once. Exits once the writer has been given new queues.
+    """
+    while not shutdown_event.is_set() and done_queue is writer_done_queue:
+        try:
+            result = done_queue.get(timeout=1.0)
+        except queue.Empty:
+            continue
+        except (EOFError, OSError, ValueError):
+            return
+        writer_results.put(result)
+        manager_wakeup.set()
+
+def _accept_payload(future, key, data):
+    """
+    WorkerPool on_output callback, on the pool thread: a worker has computed a
+    document. Its pickled payload is queued for the writer and tracked until the
+    writer reports on it.
+    """
+    doc_id, tier = key
+    with writer_lock:
+        writer_pending[doc_id] = 'process' if tier == 'text' else FULL_INDEX_TASK
+        write_queue.put((doc_id, data))
+
+def _writer_backlogged() -> bool:
+    with writer_lock:
+        return len(writer_pending) >= WRITER_QUEUE_MAX_DOCS
+
+def ensure_embedding_broker(ctx):
+    """
+    Starts the embedding broker if it is enabled and nothing is serving its address;
+    restarts it if it died. Attempts are at least EMBEDDING_BROKER_RETRY_SECONDS apart,
+    so a broker that crashes on startup is not respawned on every manager loop.
+    """
+    global embedding_broker_process, embedding_broker_checked_at
+    if not EMBEDDING_BROKER_ENABLED or (embedding_broker_process is not None and embedding_broker_process.is_alive()):
+        return
+    if embedding_broker_process is not None:
+        print(f"!!! Manager: Embedding broker exited with code {embedding_broker_process.exitcode}. "
+              f"Restarting it within {EMBEDDING_BROKER_RETRY_SECONDS}s. !!!")
+        embedding_broker_process = None
+    if time.monotonic() - embedding_broker_checked_at < EMBEDDING_BROKER_RETRY_SECONDS:
+        return
+    embedding_broker_checked_at = time.monotonic()
+    if embedding_broker.is_broker_running():
+        return
+    embedding_broker_process = embedding_broker.start_broker(ctx)
+
+def _drain_writer_results() -> int:
+    """
+    Logs documents the writer has finished with and queues enrichment for those that
+    have just become searchable. Returns how many were indexed (either tier).
+    """
+    indexed = 0
+    while True:
+        try:
+            doc_id, status, message = writer_results.get_nowait()
+        except queue.Empty:
+            break
+        with writer_lock:
+            writer_pending.pop(doc_id, None)
+        writer_requeued.discard(doc_id)
+        if status == 'Indexed':
+            indexed += 1
+            print(f"Manager: Writer indexed Doc ID {doc_id} ({message}).")
+        elif status == 'Searchable':
+            indexed += 1
+            print(f"Manager: Writer made Doc ID {doc_id} searchable ({message}). Queuing enrichment.")
+            task_queue.put(('enrich', doc_id), priority=PRIORITY_ENRICH)
+        else:
+            print(f"!!! MANAGER: Writer failed Doc ID {doc_id}: {message} !!!")
+    return indexed
+
+def _queue_pending_enrichment():
+    """
+    Queues enrichment for every document left 'Searchable' by an earlier run, including
+    one made while TIERED_INDEXING was on (it is then fully processed instead).
+    """
+    conn = sqlite3.connect(current_app.config['DATABASE_FILE'])
+    try:
+        doc_ids = [row[0] for row in conn.execute("SELECT id FROM documents WHERE status = 'Searchable' ORDER BY id")]
+    finally:
+        conn.close()
+    if doc_ids:
+        print(f"Manager: Queuing enrichment for {len(doc_ids)} searchable documents.")
+    for doc_id in doc_ids:
+        task_queue.put((FULL_INDEX_TASK, doc_id), priority=PRIORITY_ENRICH)
+
+def _queue_stale_embeddings():
+    """
+    Queues a full re-index of every document whose vectors came from another embedding
+    model than the configured one, so switching the backend or model does not leave
+    old vectors mixed in with new ones. Their page hashes already fold in the model, so
+    every page is re-embedded. 'Searchable' documents are re-embedded by their enrichment.
+    """
+    model_id = embedding_model_id()
+    conn = sqlite3.connect(current_app.config['DATABASE_FILE'])
+    try:
+        doc_ids = [row[0] for row in conn.execute(
+            "SELECT id FROM documents WHERE embedding_model != ? AND status NOT IN ('Missing', 'Searchable') ORDER BY id", (model_id,))]
+    finally:
+        conn.close()
+    if doc_ids:
+        print(f"!!! Manager: {len(doc_ids)} documents have vectors from another embedding model than '{model_id}'. "
+              f"Queuing them for re-embedding; semantic search mixes both models until they finish. !!!")
+    for doc_id in doc_ids:
+        task_queue.put((FULL_INDEX_TASK, doc_id), priority=PRIORITY_ENRICH)
+
+def set_enrichment_paused(paused: bool):
+    """Pauses or resumes tier 2 enrichment; the dashboard persists the choice in app_settings."""
+    if paused:
+        enrichment_paused.set()
+    else:
+        enrichment_paused.clear()
+    manager_wakeup.set()
+
+def _queue_rescan():
+    """Queues a full discovery unless one is already queued or running."""
+    with active_tasks_lock:
+        pending = any(info[0] == 'discover' for info in active_tasks.values()) or any(item[0] == 'discover' for item in list(task_queue.queue))
+    if not pending:
+        task_queue.put(('discover', None))
+
+def _queue_restored_enrichment(doc_ids):
+    """Queues the full index of documents restored from the Recycle Bin while still only 'Searchable'."""
+    for doc_id in doc_ids:
+        print(f"Manager: Queuing enrichment for restored Doc ID {doc_id}.")
+        task_queue.put((FULL_INDEX_TASK, doc_id), priority=PRIORITY_ENRICH)
+
+def _discover_documents(full_verify=False):
+    _queue_restored_enrichment(processing_pipeline.discover_and_register_documents(full_verify=full_verify))
+
+def _apply_watched_changes(changed_files, removed_prefixes):
+    """Called by the document watcher with a debounced batch of changed paths."""
+    doc_ids, unenriched_ids = processing_pipeline.register_changed_paths(changed_files, removed_prefixes)
+    for doc_id in doc_ids:
+        print(f"Manager: Watcher queued Doc ID {doc_id} for processing.")
+        task_queue.put(('process', doc_id))
+    _queue_restored_enrichment(unenriched_ids)
+
+def start_document_watcher():
+    """Starts the inotify watcher if watch mode is enabled and supported on this platform."""
+    global document_watcher
+    if not DOCUMENT_WATCH_ENABLED or document_watcher is not None:
+        return
+    if not file_watcher.is_supported():
+        print("--- Watch mode requires Linux inotify; relying on manual discovery instead. ---")
+        return
+    document_watcher = file_watcher.DocumentWatcher(
+        DOCUMENTS_DIR, _apply_watched_changes, _queue_rescan,
+        debounce=WATCH_DEBOUNCE_SECONDS, max_delay=WATCH_MAX_DELAY_SECONDS, reconcile_interval=WATCH_RECONCILE_INTERVAL_SECONDS
+    )
+    document_watcher.start()
+
 # --- ADDED: Graceful shutdown handler ---
 def cleanup_executor():
-    global executor
+    global executor, writer_process, document_watcher, embedding_broker_process
     shutdown_event.set()
+    manager_wakeup.set()
+    if document_watcher is not None:
+        document_watcher.stop()
+        document_watcher = None
     if executor is not None:
         print("\n--- Shutting down background workers gracefully... ---")
         executor.shutdown(wait=False, cancel_futures=True)
         executor = None
         print("--- Background workers terminated. ---")
+    if writer_process is not None and writer_process.is_alive():
+        # Let the writer commit what is already queued before it exits.
+        write_queue.put(index_writer.STOP)
+        writer_process.join(timeout=30)
+        if writer_process.is_alive():
+            writer_process.terminate()
+        writer_process = None
+    if embedding_broker_process is not None and embedding_broker_process.is_alive():
+        embedding_broker_process.terminate()
+        embedding_broker_process = None
 
 # Register the cleanup function to run when Flask exits
 atexit.register(cleanup_executor)
 
+def _wake_manager(_future=None):
+    manager_wakeup.set()
+
+def _track_future(future, task_type, item_id, pages=0, lane='normal'):
+    with active_tasks_lock:
+        active_tasks[future] = (task_type, item_id)
+    task_page_estimates[future] = pages or 0
+    task_lanes[future] = lane
+    future.add_done_callback(_wake_manager)
+
+def _classify_documents(doc_ids) -> dict:
+    """
+    Returns {doc_id: (lane, page_count, file_type)}. The lane is 'tiny' (processed in
+    micro-batches), 'huge' (capped concurrency) or 'normal'; page_count is from discovery
+    or the previous index, or 0.
+    """
+    doc_ids = list(doc_ids)
+    classified = {doc_id: ('normal', 0, None) for doc_id in doc_ids}
+    conn = sqlite3.connect(current_app.config['DATABASE_FILE'])
+    try:
+        rows = conn.execute(f"SELECT id, file_type, file_size_bytes, page_count FROM documents WHERE id IN ({','.join('?' * len(doc_ids))})", doc_ids).fetchall()
+    finally:
+        conn.close()
+    for doc_id, file_type, size, pages in rows:
+        size, pages = size or 0, pages or 0
+        if file_type == 'PDF' and (pages >= HUGE_DOC_MIN_PAGES or size >= HUGE_DOC_MIN_BYTES):
+            lane = 'huge'
+        elif file_type in MICRO_BATCH_FILE_TYPES and 0 < size <= MICRO_BATCH_MAX_BYTES and doc_id not in unbatched_doc_ids:
+            lane = 'tiny'
+        else:
+            lane = 'normal'
+        classified[doc_id] = (lane, pages, file_type)
+    return classified
+
+def _huge_lane_capacity(pool_size: int) -> int:
+    """How many pool tasks huge documents may occupy; one worker is always left for everything else."""
+    return max(1, min(HUGE_LANE_MAX_TASKS, pool_size - 1))
+
+def _lane_in_flight(lane: str) -> int:
+    with active_tasks_lock:
+        return sum(1 for task in active_tasks if task_lanes.get(task) == lane)
+
+def _task_budget_seconds(pages: int) -> float:
+    budget = TASK_TIMEOUT_BASE_SECONDS + TASK_TIMEOUT_PER_PAGE_SECONDS * pages
+    return min(budget, TASK_TIMEOUT_MAX_SECONDS) if TASK_TIMEOUT_MAX_SECONDS else budget
+
+def _enforce_task_deadlines():
+    """
+    The per-document watchdog. A task that has run longer than its budget (scaled by
+    the page count its worker reported, or the estimate from submission) is failed with
+    TaskTimeout and only its worker is killed; the pool starts a replacement.
+    """
+    if not TASK_TIMEOUT_BASE_SECONDS or executor is None:
+        return
+    now = time.monotonic()
+    for future, started_at, reported_pages in executor.running_tasks():
+        pages = reported_pages if reported_pages is not None else task_page_estimates.get(future, 0)
+        budget = _task_budget_seconds(pages)
+        elapsed = now - started_at
+        if elapsed <= budget:
+            continue
+        with active_tasks_lock:
+            task_info = active_tasks.get(future, ('task', None))
+        print(f"!!! Manager: Task '{task_info[0]}' for item '{task_info[1]}' exceeded its {budget:.0f}s budget ({pages} pages). Killing its worker. !!!")
+        executor.kill_task(future, TaskTimeout(f"Timed out after {elapsed:.0f}s (budget {budget:.0f}s for {pages} pages)."))
+
+def _run_thread_task(target_func, kwargs):
+    try:
+        target_func(**kwargs)
+    finally:
+        manager_wakeup.set()
+
+def _submit_subtask(task_type, item_id):
+    """Submits a page-range or merge subtask of a split document to the pool."""
+    if task_type == 'process_range':
+        doc_id, first_page, last_page = item_id
+        print(f"Manager: Queuing Doc ID {doc_id} pages {first_page}-{last_page} for processing.")
+        future = executor.submit(processing_pipeline.process_page_range, doc_id, first_page, last_page)
+        pages = last_page - first_page + 1
+        lane = split_jobs[doc_id]['lane']
+    else:
+        job = split_jobs.pop(item_id)
+        print(f"Manager: Merging {len(job['results'])} page ranges of Doc ID {item_id}.")
+        future = executor.submit(processing_pipeline.merge_page_ranges, item_id, job['results'])
+        pages = max((result['page_count'] for result in job['results']), default=0)
+        lane = job['lane']
+    _track_future(future, task_type, item_id, pages, lane)
+
+def _record_range_result(doc_id, result=None, error=None):
+    """Collects a finished page range; once all ranges are in, queues the merge or fails the document."""
+    job = split_jobs.get(doc_id)
+    if job is None:
+        return
+    job['pending'] -= 1
+    if error:
+        job['error'] = job['error'] or error
+    else:
+        job['results'].append(result)
+    if job['pending'] > 0:
+        return
+    if job['error']:
+        split_jobs.pop(doc_id)
+        processing_pipeline.mark_document_error(doc_id, job['error'])
+    else:
+        subtask_queue.appendleft(('process_merge', doc_id))
+
+def _is_text_only(task_type: str) -> bool:
+    """Whether a queued document task runs tier 1 only (text into content_index)."""
+    return TIERED_INDEXING and task_type in ('process', 'process_batch')
+
+def _start_document(doc_id, lane, pages, file_type, pool_size, task_type='process') -> int:
+    """
+    Submits one document, or splits it into page ranges on subtask_queue. Returns how
+    many pool tasks were submitted. Tier 1 tasks are never split: extracting text is
+    cheap next to the NLP and embeddings that splitting exists to spread out.
+    """
+    if _is_text_only(task_type):
+        print(f"Manager: Queuing Doc ID {doc_id} for text indexing.")
+        _track_future(executor.submit(processing_pipeline.process_document, doc_id, text_only=True), task_type, doc_id, pages, lane)
+        return 1
+    worker_count = _huge_lane_capacity(pool_size) if lane == 'huge' else pool_size
+    ranges = processing_pipeline.split_document_into_ranges(file_type, pages, worker_count)
+    if ranges:
+        print(f"Manager: Splitting Doc ID {doc_id} into {len(ranges)} page ranges.")
+        split_jobs[doc_id] = {'pending': len(ranges), 'results': [], 'error': None, 'lane': lane}
+        subtask_queue.extend(('process_range', (doc_id, first, last)) for first, last in ranges)
+        return 0
+    print(f"Manager: Queuing Doc ID {doc_id} for {'enrichment' if task_type == 'enrich' else 'processing'}{' (huge lane)' if lane == 'huge' else ''}.")
+    _track_future(executor.submit(processing_pipeline.process_document, doc_id), task_type, doc_id, pages, lane)
+    return 1
+
+def _start_micro_batch(first_doc_id, priority, task_type='process') -> int:
+    """
+    Gathers up to MICRO_BATCH_SIZE tiny documents queued with the same task type at
+    the same priority as first_doc_id into one task. Queued documents that are not
+    tiny go back in place.
+    """
+    candidates = [item_id for _, item_id in task_queue.take_pool_tasks(priority, MICRO_BATCH_SIZE - 1, task_type)]
+    lanes = _classify_documents(candidates) if candidates else {}
+    batch = [first_doc_id] + [doc_id for doc_id in candidates if lanes[doc_id][0] == 'tiny']
+    for doc_id in reversed([doc_id for doc_id in candidates if lanes[doc_id][0] != 'tiny']):
+        task_queue.put((task_type, doc_id), priority=priority, front=True)
+
+    text_only = _is_text_only(task_type)
+    if len(batch) == 1:
+        print(f"Manager: Queuing Doc ID {first_doc_id} for {'enrichment' if task_type == 'enrich' else 'processing'}.")
+        _track_future(executor.submit(processing_pipeline.process_document, first_doc_id, text_only=text_only), task_type, first_doc_id, 1, 'tiny')
+    else:
+        print(f"Manager: Queuing a batch of {len(batch)} small documents (Doc IDs {batch[0]}..{batch[-1]}) for {'enrichment' if task_type == 'enrich' else 'processing'}.")
+        _track_future(executor.submit(processing_pipeline.process_document_batch, batch, text_only=text_only),
+                      f'{task_type}_batch', tuple(batch), len(batch), 'tiny')
+    return 1
+
+def _dispatch_tasks(current_settings):
+    """
+    Starts queued work in priority order. Pool tasks are submitted until the pool holds
+    its current size + SCHEDULER_PREFETCH_DEPTH of them, so a worker that finishes picks up its
+    next document without waiting for the manager; the rest stay in task_queue, where
+    their order and priority still apply. Thread tasks always start immediately.
+
+    Documents are sorted into size lanes as they are dispatched: tiny ones go out in
+    micro-batches, and huge ones (with their page ranges) only ever occupy
+    _huge_lane_capacity() workers, waiting in huge_lane_waiting when the lane is full.
+    The huge lane only applies to full indexing; tier 1 of a huge PDF is one task.
+    While enrichment is paused, queued 'enrich' tasks at PRIORITY_ENRICH stay queued.
+    While WRITER_QUEUE_MAX_DOCS computed documents wait on the index writer, no pool
+    task is started (backpressure); workers themselves never wait on the writer.
+    """
+    pool_size = executor.size
+    capacity = 0 if _writer_backlogged() else pool_size + SCHEDULER_PREFETCH_DEPTH
+    huge_capacity = _huge_lane_capacity(pool_size)
+    with active_tasks_lock:
+        in_flight = sum(1 for v in active_tasks.values() if v[0] in PROCESS_TASK_TYPES)
+    huge_in_flight = _lane_in_flight('huge')
+
+    while True:
+        # Subtasks of split documents take free workers first, within their lane's share.
+        held = []
+        while subtask_queue and in_flight < capacity:
+            task_type, item_id = subtask_queue.popleft()
+            doc_id = item_id[0] if task_type == 'process_range' else item_id
+            huge = split_jobs[doc_id]['lane'] == 'huge'
+            if huge and huge_in_flight >= huge_capacity:
+                held.append((task_type, item_id))
+                continue
+            _submit_subtask(task_type, item_id)
+            in_flight += 1
+            huge_in_flight += huge
+        subtask_queue.extendleft(reversed(held))
+
+        # Then huge documents that were waiting for a slot in their lane.
+        if huge_lane_waiting and in_flight < capacity and huge_in_flight < huge_capacity:
+            doc_id, pages = huge_lane_waiting.popleft()
+            # Only PDFs are ever classified as huge.
+            submitted = _start_document(doc_id, 'huge', pages, 'PDF', pool_size)
+            in_flight += submitted
+            huge_in_flight += submitted
+            continue
+
+        next_entry = task_queue.get_next_with_priority(pool_available=in_flight < capacity,
+                                                       hold_from_priority=PRIORITY_ENRICH if enrichment_paused.is_set() else None)
+        if next_entry is None:
+            return
+        priority, (task_type, item_id) = next_entry
+        if task_type in ('process', 'enrich'):
+            lane, pages, file_type = _classify_documents([item_id])[item_id]
+            if lane == 'huge' and _is_text_only(task_type):
+                lane = 'normal'
+            if lane == 'huge' and huge_in_flight >= huge_capacity:
+                print(f"Manager: Doc ID {item_id} is waiting for a free slot in the huge lane.")
+                huge_lane_waiting.append((item_id, pages))
+            elif lane == 'tiny':
+                in_flight += _start_micro_batch(item_id, priority, task_type)
+            else:
+                submitted = _start_document(item_id, lane, pages, file_type, pool_size, task_type)
+                in_flight += submitted
+                if lane == 'huge':
+                    huge_in_flight += submitted
+        elif task_type in ['discover', 'cache']:
+            target_func = {'discover': _discover_documents, 'cache': processing_pipeline.update_browse_cache}.get(task_type)
+            print(f"Manager: Starting lightweight task '{task_type}' in a new thread.")
+            # ('discover', 'verify') asks discovery to re-hash every file instead of trusting the stat cache.
+            kwargs = {'full_verify': True} if task_type == 'discover' and item_id == 'verify' else {}
+            thread = threading.Thread(target=_run_thread_task, args=(target_func, kwargs))
+            with active_tasks_lock:
+                active_tasks[thread] = (task_type, item_id)
+            thread.start()
+
+def _reap_finished_tasks():
+    """Collects finished futures and threads, logging results and advancing split documents."""
+    with active_tasks_lock:
+        done_tasks = [task for task in active_tasks if (isinstance(task, threading.Thread) and not task.is_alive()) or (not isinstance(task, threading.Thread) and task.done())]
+
+    for task in done_tasks:
+        with active_tasks_lock:
+            task_info = active_tasks.pop(task, None)
+        task_page_estimates.pop(task, None)
+        task_lanes.pop(task, None)
+        if task_info is None:
+            continue
+        if not isinstance(task, threading.Thread):
+            try:
+                result = task.result() 
+                if task_info[0] in ('process_batch', 'enrich_batch'):
+                    print(f"Manager: Batch of {result['documents']} documents completed ({result['queued']} handed to writer, "
+                          f"{result['written']} written, {result['failed']} failed).")
+                else:
+                    print(f"Manager: Process task '{task_info[0]}' for item '{task_info[1]}' completed successfully.")
+                if task_info[0] in ('process', 'enrich'):
+                    unbatched_doc_ids.discard(task_info[1])
+                if task_info[0] == 'process_range':
+                    _record_range_result(task_info[1][0], result=result)
+            except Exception as e:
+                print(f"!!! MANAGER DETECTED A WORKER FAILURE for task '{task_info[0]}' on item '{task_info[1]}': {type(e).__name__} !!!")
+                if not isinstance(e, (BrokenProcessPool, WorkerLost, TaskTimeout)):
+                    print(traceback.format_exc())
+                with writer_lock:
+                    handed_off = task_info[1] in writer_pending
+                if isinstance(e, (WorkerLost, TaskTimeout)) and task_info[0] in ('process', 'enrich', 'process_merge') and not handed_off:
+                    # The worker died or was killed mid-task, so nothing recorded the failure on the document.
+                    # If its payload already reached the writer, the writer decides how the document ends up.
+                    reason = f"Timeout: {e}" if isinstance(e, TaskTimeout) else f"Worker Error: {e}"
+                    processing_pipeline.mark_document_error(task_info[1], reason)
+                if task_info[0] in ('process_batch', 'enrich_batch'):
+                    # One document can sink a whole batch (a crash or a timeout), so each is retried on its own.
+                    print(f"Manager: Retrying the {len(task_info[1])} documents of the failed batch one at a time.")
+                    unbatched_doc_ids.update(task_info[1])
+                    for doc_id in reversed(task_info[1]):
+                        task_queue.put((task_info[0][:-len('_batch')], doc_id), front=True)
+                if task_info[0] == 'process_range':
+                    _record_range_result(task_info[1][0], error=f"Page range {task_info[1][1]}-{task_info[1][2]} failed: {type(e).__name__}: {e}")
+        else:
+            print(f"Manager: Thread task '{task_info[0]}' completed.")
+
 def manager_thread_loop():
-    """The main loop for the background task manager thread."""
-    global executor, active_tasks
+    """
+    The main loop for the background task manager thread. It blocks on manager_wakeup
+    (set by task_queue.put, future completion callbacks and finished thread tasks)
+    rather than polling; the idle timeout only bounds how late a settings change or a
+    writer report is noticed.
+    """
+    global executor, active_tasks, worker_start_method
     print("--- Task Manager Thread Started ---")
     current_settings = get_system_settings()
+    if current_settings['enrichment_paused']:
+        enrichment_paused.set()
+    start_document_watcher()
+    _queue_pending_enrichment()
+    _queue_stale_embeddings()
 
     # --- FIX: Check shutdown_event instead of while True ---
     while not shutdown_event.is_set():
         try:
+            manager_wakeup.clear()
+
             if restart_executor_event.is_set() and not active_tasks:
                 print("--- Restarting Process Pool Executor... ---")
                 if executor:
@@ -109,82 +764,47 @@ def manager_thread_loop():
                 restart_executor_event.clear()
                 current_settings = get_system_settings()
 
+            # The writer and the shared queues always use 'spawn'; only the worker pool may use the forkserver.
+            ctx = multiprocessing.get_context('spawn')
+            if not shutdown_event.is_set():
+                ensure_writer_process(ctx)
+                ensure_embedding_broker(ctx)
+
             if executor is None and not shutdown_event.is_set():
-                print(f"Manager: Creating new ProcessPoolExecutor with {current_settings['max_workers']} workers. GPU: {current_settings['use_gpu']}")
-                initializer_func = functools.partial(init_worker, use_gpu=current_settings['use_gpu'])
+                worker_ctx = get_worker_context(current_settings['use_gpu'])
+                worker_start_method = worker_ctx.get_start_method()
+                pool_size = _initial_pool_size(current_settings['max_workers'])
+                print(f"Manager: Creating new worker pool with {pool_size} workers via '{worker_start_method}'. GPU: {current_settings['use_gpu']}")
+                initializer_func = functools.partial(init_worker, use_gpu=current_settings['use_gpu'],
+                                                     report_queue=worker_report_queue, start_method=worker_start_method)
                 
-                # --- START OF FIX: Force 'spawn' context ---
-                ctx = multiprocessing.get_context('spawn')
-                executor = ProcessPoolExecutor(
-                    max_workers=current_settings['max_workers'],
+                executor = WorkerPool(
+                    max_workers=pool_size,
                     initializer=initializer_func,
-                    mp_context=ctx
+                    mp_context=worker_ctx,
+                    max_tasks_per_worker=WORKER_MAX_TASKS,
+                    max_rss_mb=WORKER_MAX_RSS_MB,
+                    on_output=_accept_payload
                 )
-                # --- END OF FIX ---
+                pool_sizing.update(checked_at=time.monotonic(), throttled=False)
                 
                 with active_tasks_lock:
                     active_tasks.clear()
+                task_page_estimates.clear()
+                task_lanes.clear()
 
-            with active_tasks_lock:
-                active_process_count = sum(1 for v in active_tasks.values() if v[0] == 'process')
-
-            try:
-                task_type, item_id = task_queue.get_nowait()
-                if task_type == 'process':
-                    if active_process_count < current_settings['max_workers']:
-                        print(f"Manager: Queuing Doc ID {item_id} for processing.")
-                        future = executor.submit(processing_pipeline.process_document, item_id)
-                        with active_tasks_lock:
-                            active_tasks[future] = (task_type, item_id)
-                    else:
-                        task_queue.put((task_type, item_id)) 
-                elif task_type in ['discover', 'cache']:
-                    target_func = {'discover': processing_pipeline.discover_and_register_documents, 'cache': processing_pipeline.update_browse_cache}.get(task_type)
-                    if target_func:
-                        print(f"Manager: Starting lightweight task '{task_type}' in a new thread.")
-                        thread = threading.Thread(target=target_func)
-                        with active_tasks_lock:
-                            active_tasks[thread] = (task_type, item_id)
-                        thread.start()
-            except queue.Empty:
-                pass
+            _reap_finished_tasks()
+            _enforce_task_deadlines()
+            _update_pool_sizing(current_settings['max_workers'])
+            # A pending restart drains the pool first: nothing new is dispatched until it has happened.
+            if not restart_executor_event.is_set():
+                _dispatch_tasks(current_settings)
+            _drain_writer_results()
+            _drain_worker_reports()
 
-            with active_tasks_lock:
-                if not active_tasks:
-                    # Break sleep into smaller chunks to stay responsive to shutdown events
-                    for _ in range(10):
-                        if shutdown_event.is_set(): break
-                        time.sleep(0.1)
-                    continue
-                done_tasks = [task for task in active_tasks if (isinstance(task, threading.Thread) and not task.is_alive()) or (not isinstance(task, threading.Thread) and task.done())]
-
-            finished_tasks_info = []
-            for task in done_tasks:
-                with active_tasks_lock:
-                    if task in active_tasks:
-                        task_info = active_tasks.pop(task)
-                        finished_tasks_info.append(task_info)
-                if not isinstance(task, threading.Thread):
-                    try:
-                        task.result() 
-                        print(f"Manager: Process task '{task_info[0]}' for item '{task_info[1]}' completed successfully.")
-                    except Exception as e:
-                        print(f"!!! MANAGER DETECTED A WORKER FAILURE for task '{task_info[0]}' on item '{task_info[1]}': {type(e).__name__} !!!")
-                        if not isinstance(e, BrokenProcessPool):
-                            print(traceback.format_exc())
-                else:
-                    print(f"Manager: Thread task '{task_info[0]}' completed.")
+            # browse_cache is updated incrementally as each document is written, so no rebuild is queued here.
 
-            if any(info[0] == 'process' for info in finished_tasks_info):
-                with active_tasks_lock:
-                    is_cache_task_pending = any(v[0] == 'cache' for v in active_tasks.values()) or any(item[0] == 'cache' for item in list(task_queue.queue))
-                if not is_cache_task_pending:
-                    print("Manager: Document processing finished. Automatically queueing browse cache update.")
-                    task_queue.put(('cache', None))
-
-            for _ in range(10):
-                if shutdown_event.is_set(): break
-                time.sleep(0.1)
+            manager_wakeup.wait(timeout=MANAGER_IDLE_WAIT_SECONDS)
             
         except (BrokenProcessPool, Exception) as e:
             if shutdown_event.is_set():
@@ -192,13 +812,26 @@ def manager_thread_loop():
             print(f"!!! MANAGER THREAD ENCOUNTERED AN ERROR: {e} !!!")
 
             with active_tasks_lock:
-                tasks_to_requeue = [info for future, info in active_tasks.items() if isinstance(future, object) and not future.done()]
+                tasks_to_requeue = [info for task, info in active_tasks.items() if not isinstance(task, threading.Thread) and not task.done()]
+                # A split document is restarted as a whole: its staged ranges are discarded.
+                split_doc_ids = list(split_jobs)
+                split_jobs.clear()
+                subtask_queue.clear()
+                tasks_to_requeue = [info for info in tasks_to_requeue if info[0] not in ('process_range', 'process_merge')]
+                tasks_to_requeue += [(FULL_INDEX_TASK, doc_id) for doc_id in split_doc_ids]
+                # Micro-batches go back as their individual documents, followed by huge documents still waiting for their lane.
+                tasks_to_requeue = [item for task_type, item_id in tasks_to_requeue
+                                    for item in ([(task_type[:-len('_batch')], doc_id) for doc_id in item_id] if task_type.endswith('_batch') else [(task_type, item_id)])]
+                tasks_to_requeue += [(FULL_INDEX_TASK, doc_id) for doc_id, _ in huge_lane_waiting]
+                huge_lane_waiting.clear()
                 if tasks_to_requeue:
                     print("Manager: Re-queueing tasks that were active during the crash.")
                     for task_type, item_id in reversed(tasks_to_requeue):
                         print(f"Manager: Re-queueing item {item_id} for processing.")
-                        task_queue.queue.appendleft((task_type, item_id))
+                        task_queue.put((task_type, item_id), priority=PRIORITY_INTERACTIVE, front=True)
                 active_tasks.clear()
+                task_page_estimates.clear()
+                task_lanes.clear()
             
             if executor:
                 executor.shutdown(wait=False, cancel_futures=True)
@@ -4,6 +4,7 @@ from flask import jsonify, request, g
 
 from . import api_bp
 from ...database import get_db
+from ... import embedding_cache, embedding_broker, background
 from ..auth import admin_required, login_required
 
 # ===================================================================
@@ -193,4 +194,90 @@ def accept_contribution_comment():
         return jsonify({'success': True, 'message': 'Comment accepted.'})
     except sqlite3.Error as e:
         db.rollback()
-        return jsonify({'success': False, 'message': f'Database error: {e}'}), 500
\ No newline at end of file
+        return jsonify({'success': False, 'message': f'Database error: {e}'}), 500
+# ===================================================================
+# --- Indexing Telemetry Endpoints (Admin) ---
+# ===================================================================
+
+def _percentile_query(db, column: str, fraction: float):
+    """Returns the value at the given fraction of an ordered stats column."""
+    count = db.execute(f"SELECT COUNT({column}) FROM document_index_stats").fetchone()[0]
+    if not count:
+        return None
+    offset = min(count - 1, int(count * fraction))
+    row = db.execute(
+        f"SELECT {column} FROM document_index_stats WHERE {column} IS NOT NULL ORDER BY {column} LIMIT 1 OFFSET ?",
+        (offset,)
+    ).fetchone()
+    return row[0] if row else None
+
+@api_bp.route('/admin/indexing-stats', methods=['GET'])
+@admin_required
+def get_indexing_stats():
+    """Reports per-document indexing timings, including how long each write held the SQLite lock."""
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    db = get_db()
+    try:
+        totals = db.execute("""
+            SELECT COUNT(*) as documents, AVG(write_lock_ms) as avg_write_lock_ms, MAX(write_lock_ms) as max_write_lock_ms,
+                   AVG(lock_wait_ms) as avg_lock_wait_ms, AVG(compute_ms) as avg_compute_ms, AVG(embed_ms) as avg_embed_ms,
+                   MAX(peak_rss_mb) as max_peak_rss_mb
+            FROM document_index_stats
+        """).fetchone()
+        recent = db.execute("""
+            SELECT s.*, d.relative_path
+            FROM document_index_stats s
+            JOIN documents d ON s.doc_id = d.id
+            ORDER BY s.updated_at DESC LIMIT ?
+        """, (limit,)).fetchall()
+        summary = dict(totals)
+        summary['p50_write_lock_ms'] = _percentile_query(db, 'write_lock_ms', 0.50)
+        summary['p95_write_lock_ms'] = _percentile_query(db, 'write_lock_ms', 0.95)
+    except sqlite3.OperationalError as e:
+        return jsonify({'success': False, 'message': f'Indexing stats are unavailable: {e}'}), 500
+
+    return jsonify({'success': True, 'summary': summary, 'recent': [dict(row) for row in recent]})
+
+@api_bp.route('/admin/embedding-cache', methods=['GET'])
+@admin_required
+def get_embedding_cache_stats():
+    """Reports the size of the embedding cache and its hit/miss counters per model."""
+    try:
+        stats = embedding_cache.get_cache_stats()
+    except sqlite3.Error as e:
+        return jsonify({'success': False, 'message': f'Embedding cache is unavailable: {e}'}), 500
+    return jsonify({'success': True, **stats})
+
+@api_bp.route('/admin/embedding-cache', methods=['DELETE'])
+@admin_required
+def clear_embedding_cache():
+    """Empties the embedding cache, optionally for a single model only."""
+    model = request.args.get('model') or None
+    try:
+        embedding_cache.clear_cache(model)
+    except sqlite3.Error as e:
+        return jsonify({'success': False, 'message': f'Could not clear the embedding cache: {e}'}), 500
+    return jsonify({'success': True, 'message': f"Embedding cache cleared{f' for {model}' if model else ''}."})
+
+@api_bp.route('/admin/worker-stats', methods=['GET'])
+@admin_required
+def get_worker_stats():
+    """Reports worker startup costs, the live pool (tasks and memory per worker, recycling counts) and adaptive sizing."""
+    workers = list(background.worker_startup_stats)
+    summary = {'start_method': background.worker_start_method, 'workers': len(workers)}
+    for key in ('startup_seconds', 'init_seconds', 'rss_mb', 'pss_mb', 'private_mb'):
+        values = [w[key] for w in workers if w.get(key) is not None]
+        summary[f'avg_{key}'] = round(sum(values) / len(values), 2) if values else None
+    pool = background.executor.snapshot() if background.executor is not None else None
+    sizing = {k: v for k, v in background.pool_sizing.items() if k != 'checked_at'}
+    return jsonify({'success': True, 'summary': summary, 'pool': pool, 'sizing': sizing, 'recent': workers[::-1]})
+
+@api_bp.route('/admin/embedding-broker', methods=['GET'])
+@admin_required
+def get_embedding_broker_stats():
+    """Reports the embedding broker's queue depth, throughput and batching."""
+    try:
+        stats = embedding_broker.broker_stats()
+    except embedding_broker.BrokerUnavailable as e:
+        return jsonify({'success': False, 'running': False, 'message': f'Embedding broker is not running: {e}'}), 503
+    return jsonify({'success': True, 'running': True, 'broker': stats})
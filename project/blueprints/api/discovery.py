@@ -5,15 +5,14 @@ import uuid
 import re 
 from collections import defaultdict
 import heapq
-import ollama
-import struct
 
 from flask import jsonify, request, g, abort
 
 from . import api_bp
 from .helpers import get_base_document_query_fields, escape_like
 from ...database import get_db
-from ...config import ENTITY_LABELS_TO_DISPLAY, BASE_DIR, EMBEDDING_MODEL
+from ...config import ENTITY_LABELS_TO_DISPLAY, BASE_DIR
+from ...embeddings import embed_query, warn_if_mixed_models
 from ..auth import login_required
 from ...utils import _create_manual_snippet, _create_entity_snippet
 from ...assistant_core import _internal_fts_search, read_specific_pages
@@ -21,11 +20,6 @@ from ...assistant_core import _internal_fts_search, read_specific_pages
 # === THE FIX: Use relative import to ensure we grab the true global CSRF instance ===
 from ... import csrf
 
-# --- Helper for Vector Serialization ---
-def serialize_f32(vector: list[float]) -> bytes:
-    """Serializes a list of floats into a compact byte format for sqlite-vec."""
-    return struct.pack("%sf" % len(vector), *vector)
-
 # ===================================================================
 # --- Optimized Entity Discovery Endpoints ---
 # ===================================================================
@@ -161,8 +155,8 @@ def api_global_search():
     # 2. Run Semantic Search via sqlite-vec if mode is 'hybrid'
     if mode == 'hybrid':
         try:
-            q_embed_res = ollama.embeddings(model=EMBEDDING_MODEL, prompt=query)
-            query_blob = serialize_f32(q_embed_res['embedding'])
+            query_blob = embed_query(query)
+            warn_if_mixed_models(db)
             
             top_k_heap = []
             search_targets = [
@@ -465,8 +459,8 @@ def api_advanced_search():
 
     # --- 2. SEMANTIC (VECTOR) SEARCH PHASE ---
     try:
-        q_embed_res = ollama.embeddings(model=EMBEDDING_MODEL, prompt=query)
-        query_blob = serialize_f32(q_embed_res['embedding'])
+        query_blob = embed_query(query)
+        warn_if_mixed_models(db)
         
         top_k_heap = []
         search_targets = [
@@ -105,7 +105,8 @@ def fetch_dashboard_data(user_id, page=1, per_page=25, sort_key='relative_path',
         'selected_types': type_filters if type_filters is not None else all_types,
         'selected_statuses': status_filters,
         'queue_size': state_data['queue_size'],
-        'task_states': state_data['task_states']
+        'task_states': state_data['task_states'],
+        'tier_progress': state_data['tier_progress']
     }
 
 # ==============================================================================
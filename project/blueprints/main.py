@@ -14,7 +14,8 @@ from flask import (
 )
 
 from ..database import get_db
-from ..background import task_queue
+from ..background import task_queue, huge_lane_waiting, set_enrichment_paused, FULL_INDEX_TASK
+from ..scheduler import PRIORITY_INTERACTIVE, PRIORITY_BULK
 from ..utils import _get_dashboard_state, _truncate_long_snippet, _create_entity_snippet
 from ..config import DOCUMENTS_DIR, ENTITY_LABELS_TO_DISPLAY, resolve_document_path
 from .auth import login_required, admin_required, SecureForm
@@ -59,8 +60,10 @@ def dashboard():
 @main_bp.route('/dashboard/discover')
 @login_required
 def dashboard_discover():
-    task_queue.put(('discover', None))
-    flash("Discovery task queued. It will start shortly.", "info")
+    # ?verify=1 re-hashes every file instead of skipping those whose size, mtime and inode are unchanged.
+    full_verify = request.args.get('verify') == '1'
+    task_queue.put(('discover', 'verify' if full_verify else None))
+    flash("Full verification scan queued. Every file will be re-hashed." if full_verify else "Discovery task queued. It will start shortly.", "info")
     return redirect(url_for('main.dashboard'))
 
 @main_bp.route('/dashboard/process/all_new')
@@ -75,7 +78,7 @@ def dashboard_process_all_new():
         db.commit()
 
         for doc_id in doc_ids:
-            task_queue.put(('process', doc_id))
+            task_queue.put(('process', doc_id), priority=PRIORITY_BULK)
         flash(f"Queued {len(doc_ids)} documents for processing.", "success")
         
     return redirect(url_for('main.dashboard', sort_key='status', sort_dir='asc'))
@@ -84,19 +87,36 @@ def dashboard_process_all_new():
 @login_required
 def dashboard_process_single(doc_id):
     db = get_db()
+    # A manual re-process is a full rebuild: dropping the page hashes disables the incremental path.
+    db.execute("DELETE FROM document_page_hashes WHERE doc_id = ?", (doc_id,))
     db.execute("UPDATE documents SET status = 'Queued', status_message = 'Pending assignment' WHERE id = ?", (doc_id,))
     db.commit()
     
-    task_queue.put(('process', doc_id))
+    # Jumps ahead of any bulk processing that is already queued, and indexes both tiers in one pass.
+    task_queue.put((FULL_INDEX_TASK, doc_id), priority=PRIORITY_INTERACTIVE)
     flash(f"Queued document ID {doc_id} for re-processing.", "info")
     
     return redirect(url_for('main.dashboard', sort_key='status', sort_dir='asc'))
 
+@main_bp.route('/dashboard/enrichment/<action>')
+@login_required
+def dashboard_enrichment(action):
+    if action not in ('pause', 'resume'):
+        abort(404)
+    paused = action == 'pause'
+    db = get_db()
+    db.execute("INSERT INTO app_settings (key, value) VALUES ('enrichment_paused', ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+               ('true' if paused else 'false',))
+    db.commit()
+    set_enrichment_paused(paused)
+    flash("Enrichment paused. Documents stay keyword-searchable; entities and embeddings resume later." if paused else "Enrichment resumed.", "info")
+    return redirect(url_for('main.dashboard'))
+
 @main_bp.route('/dashboard/update_cache')
 @login_required
 def dashboard_update_cache():
     task_queue.put(('cache', None))
-    flash("Browse cache update task queued. It will start shortly.", "info")
+    flash("Browse cache verification queued. Any drifted counts will be repaired.", "info")
     return redirect(url_for('main.dashboard'))
 
 @main_bp.route('/dashboard/reset_database', methods=['POST'])
@@ -113,6 +133,7 @@ def dashboard_reset_database():
             while not task_queue.empty():
                 try: task_queue.get_nowait()
                 except queue.Empty: break
+            huge_lane_waiting.clear()
             db_path.unlink()
         flash("System has been completely reset. Please create a new admin account.", "success")
         return redirect(url_for('auth.setup'))
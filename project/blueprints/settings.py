@@ -14,6 +14,7 @@ from werkzeug.security import generate_password_hash
 from werkzeug.utils import secure_filename
 
 from ..database import get_db
+from .. import browse_cache
 from ..background import restart_executor_event, get_system_settings
 from .auth import admin_required, login_required, SecureForm
 from ..export_import import export_knowledge_package, import_knowledge_package
@@ -367,10 +368,13 @@ def hard_delete_document(doc_id):
         db = get_db()
         try:
             db.execute("BEGIN TRANSACTION;")
+            status = db.execute("SELECT status FROM documents WHERE id = ?", (doc_id,)).fetchone()
+            if status and status['status'] != 'Missing':
+                browse_cache.remove_documents(db, [doc_id])
             db.execute("DELETE FROM content_index WHERE doc_id = ?", (doc_id,))
             db.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
             
-            db.execute("DELETE FROM entities WHERE id NOT IN (SELECT DISTINCT entity_id FROM entity_appearances)")
+            db.execute("DELETE FROM entities WHERE id NOT IN (SELECT entity_id FROM entity_appearances UNION SELECT entity_id FROM staged_entity_appearances)")
             db.execute("DELETE FROM tags WHERE id NOT IN (SELECT DISTINCT tag_id FROM document_tags)")
             
             db.commit()
@@ -393,7 +397,7 @@ def empty_recycle_bin():
                 placeholders = ','.join('?' for _ in missing_ids)
                 db.execute(f"DELETE FROM content_index WHERE doc_id IN ({placeholders})", missing_ids)
                 db.execute("DELETE FROM documents WHERE status = 'Missing'")
-                db.execute("DELETE FROM entities WHERE id NOT IN (SELECT DISTINCT entity_id FROM entity_appearances)")
+                db.execute("DELETE FROM entities WHERE id NOT IN (SELECT entity_id FROM entity_appearances UNION SELECT entity_id FROM staged_entity_appearances)")
                 db.execute("DELETE FROM tags WHERE id NOT IN (SELECT DISTINCT tag_id FROM document_tags)")
             db.commit()
             flash(f"Emptied {len(missing_ids)} documents from the Recycle Bin.", "success")
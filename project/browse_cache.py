@@ -0,0 +1,61 @@
+# --- File: ./project/browse_cache.py ---
+"""
+Incremental maintenance of the browse_cache table.
+
+browse_cache holds, for every entity, the number of documents outside the Recycle
+Bin that mention it and the number of page appearances in those documents.
+Rather than re-aggregating all of entity_appearances after every batch, each change
+to one document's contribution (indexed, re-indexed, trashed, restored, deleted) is
+applied as a delta to just that document's entities, inside the same transaction
+as the change itself. processing_pipeline.update_browse_cache() remains as the full
+recomputation and is now used to verify (and repair) the incremental counts.
+"""
+
+
+def document_contributions(cursor, doc_ids) -> dict:
+    """Returns {entity_id: (document_count, appearance_count)} contributed by the given documents."""
+    doc_ids = list(doc_ids)
+    contributions = {}
+    for i in range(0, len(doc_ids), 500):
+        chunk = doc_ids[i:i + 500]
+        rows = cursor.execute(f"""
+            SELECT entity_id, COUNT(DISTINCT doc_id), COUNT(*) FROM entity_appearances
+            WHERE doc_id IN ({','.join('?' * len(chunk))}) GROUP BY entity_id
+        """, chunk).fetchall()
+        # Chunks partition the documents, so per-chunk counts simply add up.
+        for entity_id, doc_count, appearance_count in rows:
+            prev_docs, prev_appearances = contributions.get(entity_id, (0, 0))
+            contributions[entity_id] = (prev_docs + doc_count, prev_appearances + appearance_count)
+    return contributions
+
+def apply_delta(cursor, before: dict, after: dict) -> int:
+    """
+    Adjusts browse_cache by (after - before), where both are document_contributions()
+    results. Entities left without documents are removed. Returns how many entities changed.
+    """
+    deltas = []
+    for entity_id in before.keys() | after.keys():
+        before_docs, before_appearances = before.get(entity_id, (0, 0))
+        after_docs, after_appearances = after.get(entity_id, (0, 0))
+        if (before_docs, before_appearances) != (after_docs, after_appearances):
+            deltas.append((after_docs - before_docs, after_appearances - before_appearances, entity_id))
+    if not deltas:
+        return 0
+
+    cursor.executemany("""
+        INSERT INTO browse_cache (entity_id, entity_text, entity_label, document_count, appearance_count)
+        SELECT id, text, label, ?, ? FROM entities WHERE id = ?
+        ON CONFLICT(entity_id) DO UPDATE SET
+            document_count = document_count + excluded.document_count,
+            appearance_count = appearance_count + excluded.appearance_count
+    """, deltas)
+    cursor.executemany("DELETE FROM browse_cache WHERE entity_id = ? AND document_count <= 0", [(entity_id,) for _, _, entity_id in deltas])
+    return len(deltas)
+
+def add_documents(cursor, doc_ids) -> int:
+    """Counts the given documents (e.g. restored from the Recycle Bin) in browse_cache."""
+    return apply_delta(cursor, {}, document_contributions(cursor, doc_ids))
+
+def remove_documents(cursor, doc_ids) -> int:
+    """Stops counting the given documents (trashed or about to be deleted). Call before their appearances are removed."""
+    return apply_delta(cursor, document_contributions(cursor, doc_ids), {})
@@ -2,6 +2,7 @@
 import os
 import sys
 import secrets
+import hashlib
 from pathlib import Path
 
 # --- Base Directory ---
@@ -107,4 +108,210 @@ SECRET_KEY = get_or_create_secret_key()
 REASONING_MODEL = "gemma3:12b"
 
 # The model for generating embeddings for semantic search.
-EMBEDDING_MODEL = "embeddinggemma:latest"
\ No newline at end of file
+EMBEDDING_MODEL = "embeddinggemma:latest"
+
+# Number of chunks sent to the embedding model in a single multi-input request.
+# Larger batches mean fewer HTTP round trips per document during indexing.
+EMBEDDING_BATCH_SIZE = 64
+
+# Number of pages handed to spaCy's nlp.pipe() at once during NLP analysis.
+NLP_BATCH_SIZE = 32
+
+
+# --- Embedding Cache ---
+# Vectors are cached by (the backend's model_id, sha256 of chunk text) so unchanged or
+# repeated chunks are never re-embedded. Off by default; it keeps a second SQLite file,
+# EMBEDDING_CACHE_FILE, next to the database. Set EMBEDDING_CACHE_ENABLED to True to use it.
+EMBEDDING_CACHE_ENABLED = False
+EMBEDDING_CACHE_FILE = INSTANCE_DIR / "embedding_cache.db"
+# Least-recently-used vectors are evicted once the cache holds more than this many
+# entries (a 768-dim float32 vector is ~3 KB, so 500,000 entries is ~1.5 GB).
+EMBEDDING_CACHE_MAX_ENTRIES = 500_000
+
+# --- Large Document Streaming ---
+# PDFs with more pages than this are processed in windows of STREAMING_WINDOW_PAGES
+# pages, with each window's results spilled to STAGING_DIR, so worker memory stays
+# bounded regardless of page count. The writer commits the windows to staging tables one
+# at a time and then swaps them in with one short transaction, so the document still
+# flips to 'Indexed' atomically without holding the write lock for the whole replay.
+STREAMING_PAGE_THRESHOLD = 1000
+STREAMING_WINDOW_PAGES = 200
+STAGING_DIR = INSTANCE_DIR / "index_staging"
+
+# --- Intra-Document Parallelism ---
+# When more than one worker is configured, PDFs with more pages than this are split
+# into page ranges that are processed on all workers at once and merged into a
+# single commit. Ranges are never smaller than PARALLEL_MIN_RANGE_PAGES pages.
+PARALLEL_SPLIT_PAGE_THRESHOLD = 500
+PARALLEL_MIN_RANGE_PAGES = 100
+
+# --- Index Writer ---
+# Workers hand finished documents to a single writer process, which commits up to
+# WRITER_BATCH_MAX_DOCS documents per transaction, waiting at most
+# WRITER_BATCH_MAX_WAIT_SECONDS to fill a batch. While WRITER_QUEUE_MAX_DOCS documents
+# are waiting, no new document is dispatched until the writer catches up (backpressure).
+WRITER_BATCH_MAX_DOCS = 16
+WRITER_BATCH_MAX_WAIT_SECONDS = 0.5
+WRITER_QUEUE_MAX_DOCS = 8
+
+# --- Discovery ---
+# Content hashes are cached per file together with (size, mtime_ns, inode), so a
+# rescan only reads files whose metadata changed. Every DISCOVERY_FULL_VERIFY_DAYS
+# days (0 disables) the next scan ignores the cache and re-hashes everything, to
+# catch edits that preserved the file's size and mtime.
+FILE_STATE_CACHE_FILE = INSTANCE_DIR / "file_state_cache.db"
+DISCOVERY_FULL_VERIFY_DAYS = 30
+# Threads used to stat and hash files during discovery. Hashing is mostly I/O-bound
+# (and releases the GIL), so this can exceed the CPU count, especially for network mounts.
+DISCOVERY_HASH_WORKERS = 8
+
+# --- Watch Mode (Linux only) ---
+# When enabled, the background manager watches DOCUMENTS_DIR and every .rlink target
+# with inotify and registers, re-queues or trashes only the files that changed.
+# Bursts of events are batched until they have been quiet for WATCH_DEBOUNCE_SECONDS
+# (but never held longer than WATCH_MAX_DELAY_SECONDS). A full discovery still runs
+# every WATCH_RECONCILE_INTERVAL_SECONDS to catch anything the watcher missed.
+DOCUMENT_WATCH_ENABLED = False
+WATCH_DEBOUNCE_SECONDS = 2.0
+WATCH_MAX_DELAY_SECONDS = 10.0
+WATCH_RECONCILE_INTERVAL_SECONDS = 6 * 3600
+
+# --- Task Scheduler ---
+# Documents submitted to the worker pool beyond max_workers, so workers never idle
+# between documents. Anything further stays in the priority queue, where a single
+# re-process requested from the dashboard can still overtake it.
+SCHEDULER_PREFETCH_DEPTH = 2
+# The manager sleeps until there is work; this only bounds how quickly it notices
+# settings changes (worker count, GPU) and index writer reports.
+MANAGER_IDLE_WAIT_SECONDS = 1.0
+
+# --- Worker Processes ---
+# 'spawn' (the default) starts every worker from scratch. 'forkserver' loads the spaCy
+# model once in an extra server process and forks workers from it, so pool (re)starts
+# take seconds and workers share the model's memory copy-on-write. 'spawn' is used
+# anyway where forkserver is unavailable (Windows) or when GPU mode is on, since CUDA
+# state must not be inherited across a fork.
+WORKER_START_METHOD = "spawn"
+
+# --- Worker Recycling & Memory ---
+# A worker is replaced by a fresh one after this many tasks, or as soon as its RSS
+# after a task is above WORKER_MAX_RSS_MB (0 disables either limit). spaCy and
+# PyMuPDF do not give fragmented memory back, so long-lived workers only grow.
+WORKER_MAX_TASKS = 500
+WORKER_MAX_RSS_MB = 3072
+# 'fixed' (the default) always runs max_workers workers. 'adaptive' treats max_workers
+# as a ceiling: the pool only grows while the system has room for another worker's
+# measured footprint on top of MEMORY_RESERVE_MB, shrinks when it does not, and
+# holds back new documents entirely while available memory is below the reserve.
+WORKER_POOL_SIZING = "fixed"
+# Memory kept free for the OS, the web app, the index writer and Ollama.
+MEMORY_RESERVE_MB = 4096
+# Assumed per-worker footprint until workers have reported real measurements.
+WORKER_MEMORY_ESTIMATE_MB = 1500
+# How often adaptive sizing re-reads available memory. The pool grows by at most
+# one worker per interval, so a new worker's memory is visible before the next step.
+POOL_SIZING_INTERVAL_SECONDS = 5.0
+
+# --- Task Watchdog ---
+# Wall-clock budget for one document (or page range) on a worker: the base plus
+# TASK_TIMEOUT_PER_PAGE_SECONDS for every page, capped at TASK_TIMEOUT_MAX_SECONDS.
+# The page count comes from the previous index until the worker has opened the
+# file and reported it. A task over budget has its worker killed and replaced,
+# and the document is marked 'Error'. Set the base to 0 to disable the watchdog.
+TASK_TIMEOUT_BASE_SECONDS = 300
+TASK_TIMEOUT_PER_PAGE_SECONDS = 3.0
+TASK_TIMEOUT_MAX_SECONDS = 6 * 3600
+
+# --- Size Lanes ---
+# Small documents are processed MICRO_BATCH_SIZE at a time in one worker task, with
+# one connection, one status commit and one write transaction for the whole batch;
+# for single-page HTML and EML files that overhead costs more than the indexing itself.
+MICRO_BATCH_SIZE = 32
+MICRO_BATCH_MAX_BYTES = 64 * 1024
+MICRO_BATCH_FILE_TYPES = ('HTML', 'EML', 'TXT', 'SRT')
+# PDFs with at least HUGE_DOC_MIN_PAGES pages (as recorded at discovery or by their last index) or
+# HUGE_DOC_MIN_BYTES on disk go to the huge lane. Its tasks (whole documents and
+# page ranges alike) never occupy more than HUGE_LANE_MAX_TASKS workers, and
+# always leave at least one worker free when the pool has more than one, so a
+# few 5,000-page PDFs cannot hold up everything queued behind them.
+HUGE_DOC_MIN_PAGES = 1000
+HUGE_DOC_MIN_BYTES = 100 * 1024 * 1024
+HUGE_LANE_MAX_TASKS = 2
+
+# --- Tiered Indexing ---
+# Tier 1 only extracts text and writes content_index, so a document is keyword-
+# searchable ('Searchable') minutes after discovery. Tier 2 ("enrichment": entities,
+# relationships and embeddings) is queued behind all other work at PRIORITY_ENRICH
+# and can be paused from the dashboard. Off by default: documents are indexed in one
+# pass and go straight from 'Queued' to 'Indexed', as they always have.
+TIERED_INDEXING = False
+
+# --- Embedding Broker ---
+# One local process batches embedding requests from pool workers, the curator and
+# web searches into EMBEDDING_BROKER_MAX_BATCH-text calls to the backend. A batch
+# goes out when full or when its oldest request has waited EMBEDDING_BROKER_MAX_DELAY_MS.
+# EMBEDDING_BROKER_CONCURRENCY batches may be in flight at once (match OLLAMA_NUM_PARALLEL).
+# When the broker cannot be reached, callers embed directly and retry the broker
+# after EMBEDDING_BROKER_RETRY_SECONDS. Off by default: every caller embeds directly,
+# as it always has.
+EMBEDDING_BROKER_ENABLED = False
+# A Unix socket path (keep it under ~100 characters), or on Windows a named pipe
+# whose name is derived from this install's instance folder.
+if sys.platform == "win32":
+    EMBEDDING_BROKER_ADDRESS = rf"\\.\pipe\redleaf-embedding-broker-{hashlib.sha256(str(INSTANCE_DIR).encode()).hexdigest()[:12]}"
+else:
+    EMBEDDING_BROKER_ADDRESS = str(INSTANCE_DIR / "embedding_broker.sock")
+EMBEDDING_BROKER_MAX_BATCH = 128
+EMBEDDING_BROKER_MAX_DELAY_MS = 15
+EMBEDDING_BROKER_CONCURRENCY = 2
+EMBEDDING_BROKER_TIMEOUT_SECONDS = 600
+EMBEDDING_BROKER_RETRY_SECONDS = 30
+
+# --- Embedding Traffic Governor ---
+# The broker serves 'interactive' requests (search queries, assistant steps) before
+# any 'background' indexing batch, and sends them as soon as they arrive (after
+# EMBEDDING_INTERACTIVE_MAX_DELAY_MS). While interactive embeddings or assistant
+# chat calls are in flight, and for GOVERNOR_COOLDOWN_MS afterwards, no new
+# background batch is started. One background batch is let through after
+# GOVERNOR_MAX_HOLD_SECONDS of continuous throttling so indexing never starves.
+EMBEDDING_INTERACTIVE_MAX_DELAY_MS = 0
+GOVERNOR_COOLDOWN_MS = 500
+GOVERNOR_MAX_HOLD_SECONDS = 10
+
+# --- Embedding Backend ---
+# "ollama" sends EMBEDDING_MODEL requests to the Ollama server. "sentence-transformers"
+# runs LOCAL_EMBEDDING_MODEL in-process on the CPU (pip install sentence-transformers),
+# with no server or HTTP round trips. The default is EmbeddingGemma, the model behind
+# Ollama's embeddinggemma, so its vectors fit vec_embedding_chunks (EMBEDDING_DIMENSIONS).
+# The app_settings key 'embedding_backend' overrides EMBEDDING_BACKEND; each process
+# reads it once, so restart the app after changing it. Switching backends
+# re-embeds documents on their next index, because the page hashes and the embedding
+# cache are keyed by the backend's model.
+EMBEDDING_BACKEND = "ollama"
+EMBEDDING_DIMENSIONS = 768
+LOCAL_EMBEDDING_MODEL = "google/embeddinggemma-300m"
+# Texts per encode() call, and torch threads for the local model (0 = library default).
+LOCAL_EMBEDDING_BATCH_SIZE = 32
+LOCAL_EMBEDDING_THREADS = 0
+
+# --- Offline Stand-ins (benchmarks and CI) ---
+# EMBEDDING_BACKEND = "fake" makes deterministic pseudo-embeddings from hashed
+# words, so texts that share words land near each other and search still ranks
+# sensibly, with no model or server. Its cost is simulated: each call sleeps
+# FAKE_EMBEDDING_LATENCY_MS plus FAKE_EMBEDDING_PER_TEXT_MS per text, calls larger
+# than FAKE_EMBEDDING_MAX_BATCH are served as several sequential batches (0 = no
+# limit), and at most FAKE_EMBEDDING_PARALLEL calls per process run at once, the
+# rest queue like requests beyond OLLAMA_NUM_PARALLEL do (0 = no limit).
+FAKE_EMBEDDING_LATENCY_MS = 0
+FAKE_EMBEDDING_PER_TEXT_MS = 0
+FAKE_EMBEDDING_MAX_BATCH = 0
+FAKE_EMBEDDING_PARALLEL = 0
+# LLM_BACKEND = "canned" answers every chat call with a deterministic reply derived
+# from the prompt instead of asking Ollama. JSON-mode replies carry the keys the
+# assistants read (action, query, selected_ids, ...), so their loops run end to end.
+# The first token arrives after CANNED_LLM_LATENCY_MS, the rest at
+# CANNED_LLM_TOKENS_PER_SECOND (0 = instantly); text replies are CANNED_LLM_REPLY_WORDS long.
+LLM_BACKEND = "ollama"
+CANNED_LLM_LATENCY_MS = 0
+CANNED_LLM_TOKENS_PER_SECOND = 0
+CANNED_LLM_REPLY_WORDS = 60
@@ -0,0 +1,250 @@
+# --- File: ./project/embedding_backends.py ---
+"""
+Embedding backends.
+
+Everything that needs vectors goes through embeddings.embed_texts(), which calls the
+process's backend (get_backend()) for each batch. A backend turns a list of texts
+into a list of EMBEDDING_DIMENSIONS-long vectors, raising if the batch fails (the
+caller bisects failed batches). Three are built in:
+
+  ollama                 The Ollama server, over HTTP (the default).
+  sentence-transformers  An in-process CPU model; needs `pip install sentence-transformers`.
+  fake                   Deterministic pseudo-embeddings from hashed words, with simulated
+                         latency; for benchmarks and CI runs without a model.
+
+`model_id` identifies the vector space a backend produces. The embedding cache and
+the per-page content hashes are keyed by it, so vectors from different models are
+never mixed.
+"""
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from .config import (
+    EMBEDDING_BACKEND, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, DATABASE_FILE,
+    LOCAL_EMBEDDING_MODEL, LOCAL_EMBEDDING_BATCH_SIZE, LOCAL_EMBEDDING_THREADS,
+    FAKE_EMBEDDING_LATENCY_MS, FAKE_EMBEDDING_PER_TEXT_MS, FAKE_EMBEDDING_MAX_BATCH, FAKE_EMBEDDING_PARALLEL
+)
+
+
+class EmbeddingBackend:
+    """Interface for embedding backends."""
+    name = None
+    model_id = None
+
+    def embed(self, texts: list) -> list:
+        """Returns one vector (a list or numpy array of floats) per text, in order."""
+        raise NotImplementedError
+
+
+# model_id recorded for vectors from the single-prompt ollama.embeddings() API that
+# documents were indexed with before backends existed. Those vectors are not
+# normalized, unlike ollama.embed()'s, so they are a different vector space.
+LEGACY_OLLAMA_MODEL_ID = EMBEDDING_MODEL
+
+
+class OllamaBackend(EmbeddingBackend):
+    name = "ollama"
+    # Not LEGACY_OLLAMA_MODEL_ID: ollama.embed() normalizes its vectors, so older ones must be re-embedded.
+    model_id = f"ollama-embed:{EMBEDDING_MODEL}"
+
+    def __init__(self, model: str = EMBEDDING_MODEL):
+        import ollama
+        self._client = ollama
+        self.model = model
+        self.model_id = f"ollama-embed:{model}"
+
+    def embed(self, texts: list) -> list:
+        response = self._client.embed(model=self.model, input=texts)
+        return response['embeddings']
+
+
+class _CombiningEncoder:
+    """
+    Serialises access to a model that is not safe to call from several threads, while
+    batching across them: the thread that gets the model encodes every request queued
+    by other threads in the same call, so N threads sending small batches cost one
+    large encode instead of N small ones queued behind a lock.
+    """
+
+    def __init__(self, encode):
+        self._encode = encode
+        self._model_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending = []
+        self.calls = 0
+
+    def embed(self, texts: list) -> list:
+        slot = {'texts': texts, 'done': False, 'result': None, 'error': None}
+        with self._pending_lock:
+            self._pending.append(slot)
+        with self._model_lock:
+            if not slot['done']:
+                with self._pending_lock:
+                    slots, self._pending = self._pending, []
+                self._run(slots)
+        if slot['error'] is not None:
+            raise slot['error']
+        return slot['result']
+
+    def _run(self, slots: list):
+        self.calls += 1
+        try:
+            vectors = self._encode([text for slot in slots for text in slot['texts']])
+        except Exception as e:
+            for slot in slots:
+                slot['error'], slot['done'] = e, True
+            return
+        offset = 0
+        for slot in slots:
+            slot['result'] = list(vectors[offset:offset + len(slot['texts'])])
+            slot['done'] = True
+            offset += len(slot['texts'])
+
+
+class SentenceTransformersBackend(EmbeddingBackend):
+    name = "sentence-transformers"
+    model_id = f"sentence-transformers:{LOCAL_EMBEDDING_MODEL}"
+
+    def __init__(self, model: str = LOCAL_EMBEDDING_MODEL, batch_size: int = LOCAL_EMBEDDING_BATCH_SIZE,
+                 threads: int = LOCAL_EMBEDDING_THREADS):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise RuntimeError("The 'sentence-transformers' embedding backend needs `pip install sentence-transformers`.") from e
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        self.model = model
+        self.model_id = f"sentence-transformers:{model}"
+        self.batch_size = batch_size
+        self._model = SentenceTransformer(model, device="cpu")
+        dimensions = self._model.get_sentence_embedding_dimension()
+        if dimensions != EMBEDDING_DIMENSIONS:
+            raise ValueError(f"Local embedding model '{model}' produces {dimensions}-dim vectors; the index expects {EMBEDDING_DIMENSIONS}.")
+        self._encoder = _CombiningEncoder(self._encode)
+
+    def _encode(self, texts: list):
+        # Normalised like Ollama's /api/embed, so cosine distances are comparable.
+        return self._model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True,
+                                  normalize_embeddings=True, show_progress_bar=False)
+
+    def embed(self, texts: list) -> list:
+        return self._encoder.embed(texts)
+
+
+class FakeBackend(EmbeddingBackend):
+    """
+    Feature hashing: every word adds a few signed unit components at positions taken
+    from its hash, so the same text always gets the same vector on any machine, and
+    texts sharing words are close in cosine distance. The sleeps stand in for the
+    model's cost; see FAKE_EMBEDDING_* in config.py.
+    """
+    name = "fake"
+    model_id = f"fake:{EMBEDDING_DIMENSIONS}"
+    _WORD_RE = re.compile(r"\w+")
+    _COMPONENTS_PER_WORD = 4
+
+    def __init__(self, latency_ms: float = FAKE_EMBEDDING_LATENCY_MS, per_text_ms: float = FAKE_EMBEDDING_PER_TEXT_MS,
+                 max_batch: int = FAKE_EMBEDDING_MAX_BATCH, parallel: int = FAKE_EMBEDDING_PARALLEL):
+        self.latency_ms = latency_ms
+        self.per_text_ms = per_text_ms
+        self.max_batch = max_batch
+        self._slots = threading.BoundedSemaphore(parallel) if parallel else None
+        self.calls = 0
+
+    def _vector(self, text: str) -> np.ndarray:
+        vector = np.zeros(EMBEDDING_DIMENSIONS, dtype=np.float32)
+        # Text without words (numbers count as words) still gets a stable, non-zero vector.
+        for word in self._WORD_RE.findall(text.lower()) or [text]:
+            digest = hashlib.blake2b(word.encode('utf-8'), digest_size=4 * self._COMPONENTS_PER_WORD).digest()
+            for i in range(0, len(digest), 4):
+                value = int.from_bytes(digest[i:i + 4], 'little')
+                vector[value % EMBEDDING_DIMENSIONS] += 1.0 if value & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            vector[0] = norm = 1.0
+        return vector / norm
+
+    def _serve(self, texts: list) -> list:
+        delay_ms = self.latency_ms + self.per_text_ms * len(texts)
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000)
+        self.calls += 1
+        return [self._vector(text) for text in texts]
+
+    def embed(self, texts: list) -> list:
+        if self._slots is not None:
+            self._slots.acquire()
+        try:
+            step = self.max_batch or max(1, len(texts))
+            vectors = []
+            for start in range(0, len(texts), step):
+                vectors.extend(self._serve(texts[start:start + step]))
+            return vectors
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+
+BACKENDS = {backend.name: backend for backend in (OllamaBackend, SentenceTransformersBackend, FakeBackend)}
+
+_backend = None
+_backend_name = None
+_backend_lock = threading.Lock()
+
+def configured_backend_name() -> str:
+    """
+    The app_settings 'embedding_backend' value if it names a known backend, otherwise
+    EMBEDDING_BACKEND. Read once per process.
+    """
+    global _backend_name
+    if _backend_name is None:
+        _backend_name = _read_backend_setting()
+    return _backend_name
+
+def _read_backend_setting() -> str:
+    try:
+        conn = sqlite3.connect(f"file:{DATABASE_FILE}?mode=ro", uri=True)
+        try:
+            row = conn.execute("SELECT value FROM app_settings WHERE key = 'embedding_backend'").fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        row = None
+    return row[0] if row and row[0] in BACKENDS else EMBEDDING_BACKEND
+
+def use_backend(name: str, **options) -> EmbeddingBackend:
+    """
+    Replaces the configured backend for the rest of this process with `name`, created
+    with `options` (e.g. the fake backend's latency), and returns it. Meant for
+    benchmarks and tests; an embedding broker that is already running keeps its own.
+    """
+    global _backend, _backend_name
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{name}'. Choose from: {', '.join(BACKENDS)}.")
+    with _backend_lock:
+        _backend, _backend_name = BACKENDS[name](**options), name
+    return _backend
+
+def create_backend(name: str) -> EmbeddingBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{name}'. Choose from: {', '.join(BACKENDS)}.")
+    return BACKENDS[name]()
+
+def get_backend() -> EmbeddingBackend:
+    """The embedding backend of this process, created on first use."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend(configured_backend_name())
+    return _backend
+
+def embedding_model_id() -> str:
+    """model_id of the configured backend, without loading it (workers that embed through the broker never do)."""
+    return BACKENDS[configured_backend_name()].model_id
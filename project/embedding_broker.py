@@ -0,0 +1,509 @@
+# --- File: ./project/embedding_broker.py ---
+"""
+The local embedding broker.
+
+Pool workers, the curator's embedding workers and web searches would otherwise
+each call the embedding backend on their own, so Ollama sees a storm of small
+requests and never runs at full batch efficiency. The broker is one process that
+listens on a local socket (EMBEDDING_BROKER_ADDRESS), accepts single and bulk
+requests from any process, and coalesces them into batches of up to
+EMBEDDING_BROKER_MAX_BATCH texts. A batch is sent as soon as it is full, or once
+the oldest queued request has waited EMBEDDING_BROKER_MAX_DELAY_MS, so a lone
+search query is never held back for long.
+
+It is also the traffic governor: interactive requests (search queries, assistant
+steps) are served before background indexing batches, and while they or an
+assistant's chat call are in flight no new background batch is started, so a
+query does not queue behind thousands of indexing calls on the same Ollama.
+
+The background manager starts the broker; the curator pipeline starts its own
+only when none is running. Clients fall back to calling the backend directly
+whenever the broker cannot be reached, so it is never a single point of failure.
+The address is a Unix socket, or a named pipe on Windows.
+"""
+import collections
+import contextlib
+import itertools
+import os
+import sys
+import threading
+import time
+import uuid
+from multiprocessing.connection import Listener, Client, AuthenticationError
+
+from .config import (
+    SECRET_KEY, EMBEDDING_BROKER_ENABLED, EMBEDDING_BROKER_ADDRESS, EMBEDDING_BROKER_MAX_BATCH, EMBEDDING_BROKER_MAX_DELAY_MS,
+    EMBEDDING_BROKER_CONCURRENCY, EMBEDDING_BROKER_TIMEOUT_SECONDS, EMBEDDING_BROKER_RETRY_SECONDS,
+    EMBEDDING_INTERACTIVE_MAX_DELAY_MS, GOVERNOR_COOLDOWN_MS, GOVERNOR_MAX_HOLD_SECONDS
+)
+
+_AUTHKEY = SECRET_KEY.encode('utf-8')
+_FAMILY = 'AF_PIPE' if sys.platform == 'win32' else 'AF_UNIX'
+# Errors that mean the broker cannot be reached. ValueError is what multiprocessing
+# raises for an address family this platform does not support.
+_CONNECT_ERRORS = (OSError, EOFError, AuthenticationError, ValueError)
+# Window over which throughput and queue-wait percentiles are reported.
+_STATS_WINDOW_SECONDS = 60.0
+# Traffic classes, in the order they are served. 'chat' is only measured: chat calls
+# go straight to the backend, but hold back background batches while they run.
+PRIORITY_CLASSES = ('interactive', 'background')
+
+
+class BrokerUnavailable(Exception):
+    """The broker could not be reached or stopped answering; the caller should embed directly."""
+
+
+class _Request:
+    __slots__ = ('conn', 'texts', 'results', 'taken', 'remaining', 'arrived_at')
+
+    def __init__(self, conn, texts):
+        self.conn = conn
+        self.texts = texts
+        self.results = [None] * len(texts)
+        self.taken = 0
+        self.remaining = len(texts)
+        self.arrived_at = time.monotonic()
+
+
+class Broker:
+    """
+    Coalesces queued requests into backend batches. `embed_batch(texts)` must return
+    a list aligned with `texts` holding a float32 blob, or None for a text that could
+    not be embedded. Within a class requests are served in arrival order, and a bulk
+    request larger than one batch is spread over as many batches as it needs.
+
+    Interactive requests always go first and never wait for a batcher thread: one
+    more thread runs than background batches may occupy. Background batches are also
+    held back while interactive work is in flight (see _background_held_until).
+    """
+
+    def __init__(self, embed_batch, max_batch: int = EMBEDDING_BROKER_MAX_BATCH,
+                 max_delay_ms: float = EMBEDDING_BROKER_MAX_DELAY_MS, concurrency: int = EMBEDDING_BROKER_CONCURRENCY,
+                 interactive_delay_ms: float = EMBEDDING_INTERACTIVE_MAX_DELAY_MS, cooldown_ms: float = GOVERNOR_COOLDOWN_MS,
+                 max_hold_seconds: float = GOVERNOR_MAX_HOLD_SECONDS):
+        self._embed_batch = embed_batch
+        self.max_batch = max(1, max_batch)
+        self.max_delay = {'interactive': max(0.0, interactive_delay_ms / 1000), 'background': max(0.0, max_delay_ms / 1000)}
+        self.concurrency = max(1, concurrency)
+        self.cooldown = max(0.0, cooldown_ms / 1000)
+        self.max_hold = max_hold_seconds
+        self._pending = {cls: collections.deque() for cls in PRIORITY_CLASSES}
+        self._queued_texts = {cls: 0 for cls in PRIORITY_CLASSES}
+        self._in_flight = {cls: 0 for cls in PRIORITY_CLASSES}
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._batch_ids = itertools.count(1)
+        self._background_batches = set()
+        # Governor state: open chat sessions, end of the post-interactive cooldown, start of the current hold.
+        self._sessions = 0
+        self._cooldown_until = 0.0
+        self._held_since = None
+        # [started_at, {background batch ids still running}] for chat calls waiting on the backend.
+        self._chat_waits = []
+        self.started_at = time.monotonic()
+        self.stats = {'requests': 0, 'texts': 0, 'batches': 0, 'failed_texts': 0, 'backend_seconds': 0.0,
+                      'chat_sessions': 0, 'hold_overrides': 0}
+        # (finished_at, batch_size) and, per class, (recorded_at, queue_wait_seconds) over the last _STATS_WINDOW_SECONDS.
+        self._recent_batches = collections.deque()
+        self._recent_waits = {cls: collections.deque() for cls in PRIORITY_CLASSES + ('chat',)}
+
+    @property
+    def thread_count(self) -> int:
+        return self.concurrency + 1
+
+    def submit(self, conn, texts: list, priority: str = 'background'):
+        """Queues a request; its reply is sent on `conn` once every text has been embedded."""
+        request = _Request(conn, texts)
+        priority = priority if priority in PRIORITY_CLASSES else 'background'
+        with self._cond:
+            self.stats['requests'] += 1
+            if not texts:
+                self._reply(request)
+                return
+            self._pending[priority].append(request)
+            self._queued_texts[priority] += len(texts)
+            self._cond.notify_all()
+
+    def begin_session(self):
+        """An interactive chat call started: background batches are held until it ends."""
+        with self._cond:
+            self._sessions += 1
+            self.stats['chat_sessions'] += 1
+            now = time.monotonic()
+            if self._background_batches:
+                # Its queueing delay is how long the backend stays busy with background batches already sent.
+                self._chat_waits.append([now, set(self._background_batches)])
+            else:
+                self._recent_waits['chat'].append((now, 0.0))
+
+    def end_session(self):
+        with self._cond:
+            self._sessions = max(0, self._sessions - 1)
+            self._cooldown_until = time.monotonic() + self.cooldown
+            self._cond.notify_all()
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+
+    def _background_held_until(self, now: float):
+        """
+        The governor. Returns None if a background batch may start now, otherwise when
+        to check again. Background is held while chat sessions are open or interactive
+        requests are queued or running, and for the cooldown after the last one ended.
+        """
+        interactive = self._sessions or self._pending['interactive'] or self._in_flight['interactive']
+        if not interactive and now >= self._cooldown_until:
+            self._held_since = None
+            return None
+        if self._held_since is None:
+            self._held_since = now
+        release_at = self._held_since + self.max_hold
+        if now >= release_at:
+            # Starvation guard: one background batch goes through, then the hold starts over.
+            self._held_since = now
+            self.stats['hold_overrides'] += 1
+            return None
+        return release_at if interactive else min(self._cooldown_until, release_at)
+
+    def _select(self, now: float):
+        """Returns (class to batch now or None, time to check again or None to wait for a notification)."""
+        wake_times = []
+        for cls in PRIORITY_CLASSES:
+            pending = self._pending[cls]
+            if not pending:
+                if cls == 'background':
+                    self._held_since = None  # Nothing is being held back.
+                continue
+            if cls == 'background':
+                if self._in_flight['background'] >= self.concurrency:
+                    continue
+                held_until = self._background_held_until(now)
+                if held_until is not None:
+                    wake_times.append(held_until)
+                    continue
+            due_at = pending[0].arrived_at + self.max_delay[cls]
+            if self._queued_texts[cls] >= self.max_batch or now >= due_at:
+                return cls, None
+            wake_times.append(due_at)
+        return None, (min(wake_times) if wake_times else None)
+
+    def _next_batch(self):
+        """Blocks until a batch is due. Returns (batch_id, class, [(request, start, count)]), or None when stopping."""
+        with self._cond:
+            while True:
+                if self._stopping:
+                    return None
+                now = time.monotonic()
+                cls, wake_at = self._select(now)
+                if cls is not None:
+                    break
+                self._cond.wait(None if wake_at is None else max(0.0, wake_at - now))
+
+            pending, batch, room = self._pending[cls], [], self.max_batch
+            while pending and room:
+                request = pending[0]
+                if request.taken == 0:
+                    self._recent_waits[cls].append((now, now - request.arrived_at))
+                count = min(room, len(request.texts) - request.taken)
+                batch.append((request, request.taken, count))
+                request.taken += count
+                room -= count
+                self._queued_texts[cls] -= count
+                if request.taken == len(request.texts):
+                    pending.popleft()
+            batch_id = next(self._batch_ids)
+            self._in_flight[cls] += 1
+            if cls == 'background':
+                self._background_batches.add(batch_id)
+            return batch_id, cls, batch
+
+    def _run_batch(self, batch_id: int, cls: str, batch: list):
+        texts = [text for request, start, count in batch for text in request.texts[start:start + count]]
+        backend_start = time.perf_counter()
+        try:
+            results = self._embed_batch(texts)
+        except Exception as e:
+            print(f"[WARN] Embedding broker: a batch of {len(texts)} texts failed: {type(e).__name__}: {e}")
+            results = [None] * len(texts)
+        backend_seconds = time.perf_counter() - backend_start
+
+        finished = []
+        with self._cond:
+            offset = 0
+            for request, start, count in batch:
+                request.results[start:start + count] = results[offset:offset + count]
+                offset += count
+                request.remaining -= count
+                if request.remaining == 0:
+                    finished.append(request)
+            now = time.monotonic()
+            self._in_flight[cls] -= 1
+            if cls == 'interactive':
+                self._cooldown_until = now + self.cooldown
+            else:
+                self._background_batches.discard(batch_id)
+                for wait in list(self._chat_waits):
+                    wait[1].discard(batch_id)
+                    if not wait[1]:
+                        self._chat_waits.remove(wait)
+                        self._recent_waits['chat'].append((now, now - wait[0]))
+            self.stats['batches'] += 1
+            self.stats['texts'] += len(texts)
+            self.stats['failed_texts'] += sum(1 for blob in results if blob is None)
+            self.stats['backend_seconds'] += backend_seconds
+            self._recent_batches.append((now, len(texts)))
+            self._cond.notify_all()
+        for request in finished:
+            self._reply(request)
+
+    def _reply(self, request: _Request):
+        try:
+            request.conn.send(('ok', request.results))
+        except (OSError, EOFError):
+            pass  # The client went away; nothing is waiting for this reply.
+
+    def run(self):
+        """Batcher loop; thread_count of these keep the backend busy while replies go out."""
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._run_batch(*batch)
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            now = time.monotonic()
+            recents = [self._recent_batches, *self._recent_waits.values()]
+            for recent in recents:
+                while recent and now - recent[0][0] > _STATS_WINDOW_SECONDS:
+                    recent.popleft()
+            window = min(_STATS_WINDOW_SECONDS, max(now - self.started_at, 1e-6))
+            recent_texts = sum(size for _, size in self._recent_batches)
+            queue_wait_ms = {}
+            for cls, recent in self._recent_waits.items():
+                waits_ms = sorted(wait * 1000 for _, wait in recent)
+                queue_wait_ms[cls] = {
+                    'count': len(waits_ms),
+                    'avg': round(sum(waits_ms) / len(waits_ms), 1) if waits_ms else None,
+                    'p95': round(waits_ms[int(0.95 * (len(waits_ms) - 1))], 1) if waits_ms else None,
+                    'max': round(waits_ms[-1], 1) if waits_ms else None,
+                }
+            totals = dict(self.stats)
+            return {
+                'pid': os.getpid(),
+                'uptime_seconds': round(now - self.started_at, 1),
+                'max_batch': self.max_batch,
+                'max_delay_ms': {cls: delay * 1000 for cls, delay in self.max_delay.items()},
+                'queue_depth': {cls: {'requests': len(self._pending[cls]), 'texts': self._queued_texts[cls]} for cls in PRIORITY_CLASSES},
+                'batches_in_flight': dict(self._in_flight),
+                'governor': {
+                    'chat_sessions_open': self._sessions,
+                    'background_held': self._held_since is not None,
+                    'held_for_seconds': round(now - self._held_since, 1) if self._held_since is not None else 0.0,
+                },
+                'throughput_texts_per_second': round(recent_texts / window, 2),
+                'avg_batch_size': round(recent_texts / len(self._recent_batches), 1) if self._recent_batches else None,
+                'queue_wait_ms': queue_wait_ms,
+                'totals': {**totals, 'backend_seconds': round(totals['backend_seconds'], 1)},
+            }
+
+
+# --- Broker process ---
+
+def _serve_connection(broker: Broker, conn):
+    """
+    Reads requests from one client until it disconnects. Clients send one request at
+    a time. Chat sessions a client leaves open are closed when it disconnects.
+    """
+    sessions = 0
+    try:
+        while True:
+            message = conn.recv()
+            if message[0] == 'embed':
+                broker.submit(conn, list(message[1]), message[2] if len(message) > 2 else 'background')
+            elif message[0] == 'session':
+                if message[1]:
+                    broker.begin_session()
+                    sessions += 1
+                elif sessions:
+                    broker.end_session()
+                    sessions -= 1
+                conn.send(('ok', None))
+            elif message[0] == 'stats':
+                conn.send(('ok', broker.snapshot()))
+            else:
+                conn.send(('error', f"Unknown request '{message[0]}'."))
+    except (EOFError, OSError):
+        pass
+    finally:
+        for _ in range(sessions):
+            broker.end_session()
+        conn.close()
+
+def _backend_embed_batch(texts: list) -> list:
+    from .embeddings import _embed_batch_with_fallback
+    results = [None] * len(texts)
+    _embed_batch_with_fallback(texts, results, 0)
+    return results
+
+def broker_main(address: str = EMBEDDING_BROKER_ADDRESS, backend_name: str = None):
+    """Entry point of the broker process. `backend_name` overrides the configured embedding backend."""
+    if backend_name:
+        from .embedding_backends import use_backend
+        use_backend(backend_name)
+    if _FAMILY == 'AF_UNIX' and os.path.exists(address):
+        os.unlink(address)  # A stale socket left by a broker that did not exit cleanly.
+    listener = Listener(address, family=_FAMILY, authkey=_AUTHKEY)
+    broker = Broker(_backend_embed_batch)
+    print(f"--- Embedding broker {os.getpid()} listening on {address} (batches of up to {broker.max_batch}, "
+          f"{broker.max_delay['background'] * 1000:.0f} ms background / {broker.max_delay['interactive'] * 1000:.0f} ms interactive deadline) ---")
+    for _ in range(broker.thread_count):
+        threading.Thread(target=broker.run, daemon=True).start()
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+            except AuthenticationError:
+                continue
+            threading.Thread(target=_serve_connection, args=(broker, conn), daemon=True).start()
+    finally:
+        broker.stop()
+        listener.close()
+
+
+# --- Client side ---
+
+_local = threading.local()
+_unavailable_until = 0.0
+
+def _drop_connection():
+    conn = getattr(_local, 'conn', None)
+    _local.conn = None
+    if conn is not None:
+        try: conn.close()
+        except Exception: pass
+
+def _call(message, timeout: float = EMBEDDING_BROKER_TIMEOUT_SECONDS):
+    """Sends one request on this thread's connection and waits for the reply."""
+    global _unavailable_until
+    if time.monotonic() < _unavailable_until:
+        raise BrokerUnavailable("Embedding broker was unreachable recently.")
+    try:
+        conn = getattr(_local, 'conn', None)
+        if conn is None:
+            conn = _local.conn = Client(EMBEDDING_BROKER_ADDRESS, family=_FAMILY, authkey=_AUTHKEY)
+        conn.send(message)
+        if not conn.poll(timeout):
+            raise TimeoutError(f"No reply within {timeout:.0f}s.")
+        status, value = conn.recv()
+    except _CONNECT_ERRORS as e:
+        # TimeoutError is an OSError. The connection may now be out of step, so it is never reused.
+        _drop_connection()
+        _unavailable_until = time.monotonic() + EMBEDDING_BROKER_RETRY_SECONDS
+        raise BrokerUnavailable(f"{type(e).__name__}: {e}") from e
+    if status != 'ok':
+        raise RuntimeError(value)
+    return value
+
+def embed_via_broker(texts: list, priority: str = 'background') -> list:
+    """
+    Embeds `texts` through the broker at `priority` ('interactive' or 'background').
+    Returns float32 blobs aligned with `texts`, None where embedding failed.
+    """
+    return _call(('embed', list(texts), priority))
+
+@contextlib.contextmanager
+def interactive_session():
+    """
+    Wraps an interactive chat call to the backend: background embedding batches are
+    held back while it runs, and its queueing delay is measured. Does nothing when
+    the broker is disabled or not running.
+    """
+    if not EMBEDDING_BROKER_ENABLED:
+        # No broker to hold back, so do not pay for a connection attempt on every chat call.
+        yield
+        return
+    try:
+        _call(('session', True), timeout=5.0)
+        opened = True
+    except BrokerUnavailable:
+        opened = False
+    try:
+        yield
+    finally:
+        if opened:
+            try:
+                _call(('session', False), timeout=5.0)
+            except BrokerUnavailable:
+                pass
+
+def broker_stats() -> dict:
+    """Queue depth, throughput and batch statistics of the running broker."""
+    return _call(('stats',), timeout=5.0)
+
+def is_broker_running(address: str = EMBEDDING_BROKER_ADDRESS) -> bool:
+    try:
+        conn = Client(address, family=_FAMILY, authkey=_AUTHKEY)
+    except _CONNECT_ERRORS:
+        return False
+    conn.close()
+    return True
+
+def start_broker(ctx, wait_seconds: float = 10.0, address: str = EMBEDDING_BROKER_ADDRESS, backend_name: str = None):
+    """
+    Starts a broker process from the multiprocessing context `ctx` and waits until it
+    accepts connections. Returns the process, or None if it exited or never started
+    listening (it is then stopped, and callers keep embedding directly).
+    """
+    global _unavailable_until
+    process = ctx.Process(target=broker_main, args=(address, backend_name), daemon=True)
+    process.start()
+    deadline = time.monotonic() + wait_seconds
+    while time.monotonic() < deadline and process.is_alive():
+        if is_broker_running(address):
+            if address == EMBEDDING_BROKER_ADDRESS:
+                _unavailable_until = 0.0
+            return process
+        time.sleep(0.05)
+    if process.is_alive():
+        process.terminate()
+        print(f"[WARN] Embedding broker {process.pid} did not start listening within {wait_seconds:.0f}s; stopped it.")
+    else:
+        print(f"[WARN] Embedding broker {process.pid} exited with code {process.exitcode} during startup.")
+    process.join(timeout=5)
+    return None
+
+def scratch_address(directory: str) -> str:
+    """A private broker address for a test run: a socket in `directory`, or a unique pipe name on Windows."""
+    if _FAMILY == 'AF_PIPE':
+        return rf"\\.\pipe\redleaf-embedding-broker-{uuid.uuid4().hex[:12]}"
+    return os.path.join(directory, "broker.sock")
+
+def smoke_test(ctx, address: str, backend_name: str = None) -> dict:
+    """
+    Starts a broker on `address`, sends it one interactive and one background request
+    and checks the replies. Returns the broker's stats; raises RuntimeError on failure.
+    """
+    process = start_broker(ctx, address=address, backend_name=backend_name)
+    if process is None:
+        raise RuntimeError("The embedding broker did not start.")
+    try:
+        conn = Client(address, family=_FAMILY, authkey=_AUTHKEY)
+        try:
+            for priority, texts in (('interactive', ["smoke test query"]), ('background', ["first chunk", "second chunk"])):
+                conn.send(('embed', texts, priority))
+                if not conn.poll(30):
+                    raise RuntimeError(f"No reply to a {priority} request within 30s.")
+                status, blobs = conn.recv()
+                if status != 'ok' or len(blobs) != len(texts) or any(blob is None for blob in blobs):
+                    raise RuntimeError(f"Bad reply to a {priority} request: {status} {blobs!r:.200}")
+            conn.send(('stats',))
+            status, stats = conn.recv()
+        finally:
+            conn.close()
+        return stats
+    finally:
+        process.terminate()
+        process.join(timeout=5)
@@ -0,0 +1,216 @@
+# --- File: ./project/embedding_cache.py ---
+"""
+Content-addressed cache of embedding vectors.
+
+Vectors are keyed by (embedding model, sha256 of the chunk text), so an unchanged
+page of a modified document, or a boilerplate footer repeated across thousands of
+emails, is only ever sent to the embedding model once. The cache lives in its own
+SQLite file so that worker lookups never contend with the main database's write lock.
+
+Lookups are read-only: last-used times and hit/miss counters are buffered in the
+process and written in batches (on the next store(), or once enough have piled
+up), and the size limit is checked every _EVICT_CHECK_EVERY inserts rather than on
+each one. Both are approximate by design; a killed worker loses its buffered usage.
+"""
+import atexit
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from .config import EMBEDDING_CACHE_FILE, EMBEDDING_CACHE_MAX_ENTRIES
+
+# SQLite limits the number of bound parameters per statement; stay well below it.
+_LOOKUP_CHUNK = 500
+# When the cache overflows, trim it to this fraction of the limit so eviction
+# runs once per burst of inserts rather than on every insert.
+_EVICT_TO_FRACTION = 0.9
+# Inserts (per process) between checks of the cache size against the limit.
+_EVICT_CHECK_EVERY = 2_000
+# Buffered last-used refreshes are written once this many have piled up, or this old.
+_FLUSH_EVERY = 5_000
+_FLUSH_SECONDS = 60
+
+# Cache files whose schema this process has already created, keyed with the pid so a forked child re-checks.
+_initialized = set()
+_usage_lock = threading.Lock()
+_pending_touches = {}
+_pending_stats = {}
+_last_flush = time.monotonic()
+_inserted_since_check = 0
+
+
+def text_hash(text: str) -> str:
+    """Returns the sha256 hex digest used as the content address of a chunk."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def _connect():
+    conn = sqlite3.connect(EMBEDDING_CACHE_FILE, timeout=30)
+    conn.execute("PRAGMA synchronous = NORMAL;")
+    key = (os.getpid(), str(EMBEDDING_CACHE_FILE))
+    if key not in _initialized:
+        _create_schema(conn)
+        _initialized.add(key)
+    return conn
+
+def _create_schema(conn):
+    conn.execute("PRAGMA journal_mode = WAL;")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS embedding_cache (
+            model TEXT NOT NULL,
+            text_hash TEXT NOT NULL,
+            embedding BLOB NOT NULL,
+            last_used_at INTEGER NOT NULL,
+            PRIMARY KEY (model, text_hash)
+        ) WITHOUT ROWID;
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_embedding_cache_last_used ON embedding_cache(last_used_at);")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS embedding_cache_stats (
+            model TEXT PRIMARY KEY,
+            hits INTEGER NOT NULL DEFAULT 0,
+            misses INTEGER NOT NULL DEFAULT 0
+        );
+    """)
+    conn.commit()
+
+def _take_pending_usage() -> tuple[dict, dict]:
+    global _pending_touches, _pending_stats, _last_flush
+    with _usage_lock:
+        touches, stats = _pending_touches, _pending_stats
+        _pending_touches, _pending_stats = {}, {}
+        _last_flush = time.monotonic()
+    return touches, stats
+
+def _write_usage(conn, touches: dict, stats: dict):
+    """Writes buffered usage inside the caller's transaction."""
+    if touches:
+        conn.executemany(
+            "UPDATE embedding_cache SET last_used_at = MAX(last_used_at, ?) WHERE model = ? AND text_hash = ?",
+            [(used_at, model, h) for (model, h), used_at in touches.items()]
+        )
+    if stats:
+        conn.executemany("""
+            INSERT INTO embedding_cache_stats (model, hits, misses) VALUES (?, ?, ?)
+            ON CONFLICT(model) DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses
+        """, [(model, hits, misses) for model, (hits, misses) in stats.items()])
+
+def flush_usage():
+    """Writes this process's buffered last-used times and hit/miss counters to the cache."""
+    touches, stats = _take_pending_usage()
+    if not touches and not stats:
+        return
+    conn = _connect()
+    try:
+        with conn:
+            _write_usage(conn, touches, stats)
+    finally:
+        conn.close()
+
+atexit.register(flush_usage)
+
+def lookup(hashes: list, model: str) -> dict:
+    """
+    Returns {text_hash: embedding_blob} for every hash already in the cache.
+    Their last-used time and the hit/miss counts are buffered, not written here.
+    """
+    unique_hashes = list(dict.fromkeys(hashes))
+    found = {}
+    if not unique_hashes:
+        return found
+    conn = _connect()
+    try:
+        for start in range(0, len(unique_hashes), _LOOKUP_CHUNK):
+            chunk = unique_hashes[start:start + _LOOKUP_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            rows = conn.execute(
+                f"SELECT text_hash, embedding FROM embedding_cache WHERE model = ? AND text_hash IN ({placeholders})",
+                [model, *chunk]
+            ).fetchall()
+            found.update(rows)
+    finally:
+        conn.close()
+
+    now = int(time.time())
+    with _usage_lock:
+        for h in found:
+            _pending_touches[(model, h)] = now
+        hits, misses = _pending_stats.get(model, (0, 0))
+        _pending_stats[model] = (hits + len(found), misses + len(unique_hashes) - len(found))
+        due = len(_pending_touches) >= _FLUSH_EVERY or time.monotonic() - _last_flush >= _FLUSH_SECONDS
+    if due:
+        flush_usage()
+    return found
+
+def store(entries: list, model: str, max_entries: int = None):
+    """
+    Inserts (text_hash, embedding_blob) pairs, writing any buffered usage in the same
+    transaction, and evicts least-recently-used rows once the cache is past the size
+    limit (checked every _EVICT_CHECK_EVERY inserts).
+    """
+    global _inserted_since_check
+    if not entries:
+        return
+    max_entries = max_entries or EMBEDDING_CACHE_MAX_ENTRIES
+    now = int(time.time())
+    touches, stats = _take_pending_usage()
+    with _usage_lock:
+        _inserted_since_check += len(entries)
+        check_size = _inserted_since_check >= _EVICT_CHECK_EVERY
+        if check_size:
+            _inserted_since_check = 0
+    conn = _connect()
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (model, text_hash, embedding, last_used_at) VALUES (?, ?, ?, ?)",
+                [(model, h, blob, now) for h, blob in entries]
+            )
+            _write_usage(conn, touches, stats)
+            total = conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0] if check_size else 0
+            if total > max_entries:
+                excess = total - int(max_entries * _EVICT_TO_FRACTION)
+                conn.execute("""
+                    DELETE FROM embedding_cache WHERE (model, text_hash) IN (
+                        SELECT model, text_hash FROM embedding_cache ORDER BY last_used_at ASC LIMIT ?
+                    )
+                """, (excess,))
+    finally:
+        conn.close()
+
+def get_cache_stats() -> dict:
+    """Summarises cache size and hit/miss counters per embedding model."""
+    flush_usage()
+    conn = _connect()
+    try:
+        entries = dict(conn.execute("SELECT model, COUNT(*) FROM embedding_cache GROUP BY model").fetchall())
+        counters = conn.execute("SELECT model, hits, misses FROM embedding_cache_stats").fetchall()
+    finally:
+        conn.close()
+
+    models = {}
+    for model, hits, misses in counters:
+        lookups = hits + misses
+        models[model] = {
+            'entries': entries.get(model, 0), 'hits': hits, 'misses': misses,
+            'hit_rate': round(hits / lookups, 4) if lookups else None,
+        }
+    for model, count in entries.items():
+        models.setdefault(model, {'entries': count, 'hits': 0, 'misses': 0, 'hit_rate': None})
+    return {'max_entries': EMBEDDING_CACHE_MAX_ENTRIES, 'total_entries': sum(entries.values()), 'models': models}
+
+def clear_cache(model: str = None):
+    """Removes cached vectors (for one model, or all of them) and resets the matching counters."""
+    flush_usage()
+    conn = _connect()
+    try:
+        with conn:
+            if model:
+                conn.execute("DELETE FROM embedding_cache WHERE model = ?", (model,))
+                conn.execute("DELETE FROM embedding_cache_stats WHERE model = ?", (model,))
+            else:
+                conn.execute("DELETE FROM embedding_cache")
+                conn.execute("DELETE FROM embedding_cache_stats")
+    finally:
+        conn.close()
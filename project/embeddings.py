@@ -0,0 +1,131 @@
+# --- File: ./project/embeddings.py ---
+import time
+
+import numpy as np
+
+from .config import EMBEDDING_BATCH_SIZE, EMBEDDING_CACHE_ENABLED, EMBEDDING_BROKER_ENABLED
+from . import embedding_cache, embedding_broker
+from .embedding_backends import get_backend, embedding_model_id
+
+def _embed_batch(texts: list) -> list:
+    """Sends one multi-input request to the embedding backend and returns the raw vectors."""
+    vectors = get_backend().embed(texts)
+    if len(vectors) != len(texts):
+        raise ValueError(f"Embedding backend returned {len(vectors)} vectors for {len(texts)} inputs.")
+    return vectors
+
+def _embed_batch_with_fallback(texts: list, results: list, offset: int) -> int:
+    """
+    Embeds a batch, bisecting it on failure so that a single bad chunk only
+    costs itself instead of the whole batch. Returns the number of failures.
+    """
+    try:
+        vectors = _embed_batch(texts)
+    except Exception as e:
+        if len(texts) == 1:
+            print(f"WORKER WARNING: Could not generate embedding for chunk '{texts[0][:50]}...'. Error: {e}")
+            return 1
+        middle = len(texts) // 2
+        return (_embed_batch_with_fallback(texts[:middle], results, offset) +
+                _embed_batch_with_fallback(texts[middle:], results, offset + middle))
+
+    for i, vector in enumerate(vectors):
+        results[offset + i] = np.array(vector, dtype=np.float32).tobytes()
+    return 0
+
+def _embed_uncached(texts: list, batch_size: int, priority: str = 'background') -> list:
+    """
+    Embeds through the embedding broker, which batches across every caller, when it
+    is running; otherwise calls the backend directly in batches of `batch_size`.
+    """
+    if EMBEDDING_BROKER_ENABLED and texts:
+        try:
+            results = embedding_broker.embed_via_broker(texts, priority)
+        except embedding_broker.BrokerUnavailable as e:
+            print(f"WORKER WARNING: Embedding broker unavailable, embedding directly. Error: {e}")
+        else:
+            failures = sum(1 for blob in results if blob is None)
+            if failures:
+                print(f"WORKER WARNING: {failures} of {len(texts)} chunks could not be embedded.")
+            return results
+
+    results = [None] * len(texts)
+    failures = 0
+    for start in range(0, len(texts), batch_size):
+        failures += _embed_batch_with_fallback(texts[start:start + batch_size], results, start)
+    if failures:
+        print(f"WORKER WARNING: {failures} of {len(texts)} chunks could not be embedded.")
+    return results
+
+def embed_texts(texts: list, batch_size: int = None, use_cache: bool = None, priority: str = 'background') -> list:
+    """
+    Generates embeddings for a list of texts in batches of `batch_size`.
+    Returns a list aligned with `texts` holding float32 blobs ready for
+    sqlite-vec, with None in place of any chunk that could not be embedded.
+
+    Texts already in the embedding cache (and duplicates within `texts`) are
+    not sent to the model; newly generated vectors are added to the cache.
+    `priority` is the broker traffic class: 'background' for indexing, 'interactive'
+    for anything a user is waiting on.
+    """
+    batch_size = max(1, batch_size or EMBEDDING_BATCH_SIZE)
+    use_cache = EMBEDDING_CACHE_ENABLED if use_cache is None else use_cache
+    if not use_cache:
+        return _embed_uncached(texts, batch_size, priority)
+
+    model_id = embedding_model_id()
+    hashes = [embedding_cache.text_hash(text) for text in texts]
+    try:
+        known = embedding_cache.lookup(hashes, model=model_id)
+    except Exception as e:
+        print(f"WORKER WARNING: Embedding cache lookup failed, embedding without it. Error: {e}")
+        return _embed_uncached(texts, batch_size, priority)
+
+    # Each distinct missing text is embedded once, however often it repeats.
+    pending = {}
+    for text, text_hash in zip(texts, hashes):
+        if text_hash not in known and text_hash not in pending:
+            pending[text_hash] = text
+    if pending:
+        new_blobs = _embed_uncached(list(pending.values()), batch_size, priority)
+        fresh = [(text_hash, blob) for text_hash, blob in zip(pending, new_blobs) if blob is not None]
+        known.update(fresh)
+        try:
+            embedding_cache.store(fresh, model=model_id)
+        except Exception as e:
+            print(f"WORKER WARNING: Could not write {len(fresh)} embeddings to the cache. Error: {e}")
+
+    return [known.get(text_hash) for text_hash in hashes]
+
+_MIXED_MODEL_CHECK_SECONDS = 60
+_stale_vector_docs = 0
+_mixed_model_checked_at = None
+
+def warn_if_mixed_models(db):
+    """
+    Logs a warning for semantic searches while some documents still hold vectors from
+    another embedding model than the configured one (until the re-embedding the task
+    manager queues for them finishes), since their distances are not comparable.
+    Only logs when the number of such documents changes. The count scans documents,
+    so it is taken at most once every _MIXED_MODEL_CHECK_SECONDS, not on every search.
+    """
+    global _stale_vector_docs, _mixed_model_checked_at
+    now = time.monotonic()
+    if _mixed_model_checked_at is not None and now - _mixed_model_checked_at < _MIXED_MODEL_CHECK_SECONDS:
+        return
+    _mixed_model_checked_at = now
+    count = db.execute("SELECT COUNT(*) FROM documents WHERE embedding_model != ? AND status != 'Missing'", (embedding_model_id(),)).fetchone()[0]
+    if count and count != _stale_vector_docs:
+        print(f"[WARN] {count} documents still have vectors from another embedding model than '{embedding_model_id()}'. "
+              f"Semantic search ranks them unreliably until they are re-embedded.")
+    _stale_vector_docs = count
+
+def embed_query(query: str) -> bytes:
+    """
+    Embeds a search query (bypassing the cache) at interactive priority and returns it
+    as a float32 blob for sqlite-vec. Raises ValueError if the backend could not embed it.
+    """
+    blob = embed_texts([query], use_cache=False, priority='interactive')[0]
+    if blob is None:
+        raise ValueError("The embedding backend could not embed the query.")
+    return blob
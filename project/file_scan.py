@@ -0,0 +1,204 @@
+# --- File: ./project/file_scan.py ---
+"""
+File discovery helpers shared by the web pipeline and the curator CLI.
+
+Hashing every byte of a large archive on each scan is what made discovery slow,
+so content hashes are cached per absolute path together with the file's size,
+mtime_ns and inode. A file is only read again when one of those changes, or
+during a full verify (on request, or automatically every DISCOVERY_FULL_VERIFY_DAYS).
+The cache lives in its own SQLite file because it describes files on disk, not
+either pipeline's database.
+
+Files that do need reading are stat'ed and hashed on a bounded thread pool:
+hashlib releases the GIL while digesting, and on network-mounted .rlink trees
+most of the time is spent waiting on I/O anyway.
+"""
+import hashlib
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+
+from .config import FILE_STATE_CACHE_FILE, DISCOVERY_FULL_VERIFY_DAYS, DISCOVERY_HASH_WORKERS
+
+# Matched against the lower-cased extension, so no per-file pattern matching is needed.
+SUPPORTED_EXTENSIONS = frozenset({'.pdf', '.txt', '.html', '.srt', '.eml'})
+
+HASH_READ_SIZE = 1024 * 1024
+# documents.file_hash values carry this prefix. Unprefixed values are legacy md5
+# digests, which discovery migrates in place when the file's content is unchanged.
+HASH_PREFIX = "blake2b:"
+
+
+def is_legacy_hash(file_hash: str) -> bool:
+    return not file_hash.startswith(HASH_PREFIX)
+
+def _hash_contents(file_path, with_legacy_md5: bool = False):
+    """Returns (blake2b hash, md5 hex digest or None), reading the file once into a reused buffer."""
+    hasher = hashlib.blake2b(digest_size=16)
+    legacy = hashlib.md5() if with_legacy_md5 else None
+    buf = bytearray(HASH_READ_SIZE)
+    view = memoryview(buf)
+    with open(file_path, 'rb', buffering=0) as f:
+        while n := f.readinto(buf):
+            hasher.update(view[:n])
+            if legacy: legacy.update(view[:n])
+    return HASH_PREFIX + hasher.hexdigest(), (legacy.hexdigest() if legacy else None)
+
+def hash_file(file_path) -> str:
+    """Returns the content hash stored in documents.file_hash."""
+    return _hash_contents(file_path)[0]
+
+def gather_files(base_dir: Path, target_dir: Path, extensions=SUPPORTED_EXTENSIONS, virtual_prefix: str = "") -> list:
+    """
+    Returns [(file_path, relative_path)] for files under target_dir with one of the given
+    (lower-case, dotted) extensions. Files in an external directory reached through an
+    .rlink alias are mapped under the alias name as a virtual prefix.
+    """
+    files = []
+    try:
+        # Use os.walk instead of rglob to gracefully bypass Windows PermissionErrors
+        for root, dirs, filenames in os.walk(target_dir):
+            for filename in filenames:
+                if os.path.splitext(filename)[1].lower() not in extensions:
+                    continue
+                file_path = Path(root) / filename
+                try:
+                    if virtual_prefix:
+                        rel_path_str = f"{virtual_prefix}/{file_path.relative_to(target_dir).as_posix()}"
+                    else:
+                        rel_path_str = file_path.relative_to(base_dir).as_posix()
+                    files.append((file_path, rel_path_str))
+                except ValueError:
+                    continue # Skip if relative_to fails
+    except Exception as e:
+        print(f"[WARN] Error scanning directory {target_dir}: {e}")
+    return files
+
+def gather_document_files(documents_dir: Path, extensions=SUPPORTED_EXTENSIONS) -> list:
+    """Gathers supported files from documents_dir and every directory it links to with an .rlink file."""
+    all_files = gather_files(documents_dir, documents_dir, extensions)
+    for rlink_file in documents_dir.glob('*.rlink'):
+        if rlink_file.is_file():
+            try:
+                target_dir = Path(rlink_file.read_text(encoding='utf-8').strip()).resolve() # Ensure path is normalized
+                if target_dir.exists() and target_dir.is_dir():
+                    print(f"  [INFO] Following alias '{rlink_file.name}' to: {target_dir}")
+                    all_files.extend(gather_files(documents_dir, target_dir, extensions, virtual_prefix=rlink_file.name))
+                else:
+                    print(f"  [WARN] Alias target does not exist or is not a directory: {target_dir}")
+            except Exception as e:
+                print(f"  [WARN] Failed to read alias file {rlink_file}: {e}")
+    return all_files
+
+def _connect():
+    conn = sqlite3.connect(FILE_STATE_CACHE_FILE, timeout=30)
+    conn.execute("PRAGMA journal_mode = WAL;")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS file_state (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            inode INTEGER NOT NULL,
+            file_hash TEXT NOT NULL
+        ) WITHOUT ROWID;
+    """)
+    conn.execute("CREATE TABLE IF NOT EXISTS file_state_meta (key TEXT PRIMARY KEY, value TEXT);")
+    # A new cache is empty, so its first scan hashes everything anyway; start the verify clock there.
+    conn.execute("INSERT OR IGNORE INTO file_state_meta (key, value) VALUES ('last_full_verify', ?)", (str(time.time()),))
+    conn.commit()
+    return conn
+
+def _full_verify_due(conn) -> bool:
+    if not DISCOVERY_FULL_VERIFY_DAYS:
+        return False
+    row = conn.execute("SELECT value FROM file_state_meta WHERE key = 'last_full_verify'").fetchone()
+    return time.time() - float(row[0]) > DISCOVERY_FULL_VERIFY_DAYS * 86400
+
+def _load_cached_states(conn, paths=None) -> dict:
+    """Returns {path: (size, mtime_ns, inode, file_hash)} for the given paths, or for the whole cache if paths is None."""
+    query = "SELECT path, size, mtime_ns, inode, file_hash FROM file_state"
+    if paths is None:
+        return {row[0]: row[1:] for row in conn.execute(query)}
+    cached = {}
+    for i in range(0, len(paths), 500):
+        chunk = paths[i:i + 500]
+        cached.update((row[0], row[1:]) for row in conn.execute(f"{query} WHERE path IN ({','.join('?' * len(chunk))})", chunk))
+    return cached
+
+def _check_file(file_path, cached_state, with_legacy_md5):
+    """Runs on the hashing pool. Returns (file_path, stat_result, file_hash, legacy_md5, was_hashed, error)."""
+    try:
+        st = file_path.stat()
+        # Cached hashes from before the blake2b switch are treated as misses.
+        if (not with_legacy_md5 and cached_state and cached_state[:3] == (st.st_size, st.st_mtime_ns, st.st_ino)
+                and not is_legacy_hash(cached_state[3])):
+            return file_path, st, cached_state[3], None, False, None
+        file_hash, legacy_md5 = _hash_contents(file_path, with_legacy_md5)
+        return file_path, st, file_hash, legacy_md5, True, None
+    except OSError as e:
+        return file_path, None, None, None, False, e
+
+def _run_bounded(func, arg_tuples, workers):
+    """Like executor.map, but yields in completion order and never holds more than workers * 4 pending futures."""
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="discovery-hash") as pool:
+        pending = set()
+        for args in arg_tuples:
+            if len(pending) >= workers * 4:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done: yield future.result()
+            pending.add(pool.submit(func, *args))
+        for future in pending:
+            yield future.result()
+
+def scan_file_hashes(file_paths: list, full_verify: bool = False, legacy_md5_paths=frozenset(), workers: int = DISCOVERY_HASH_WORKERS, partial: bool = False):
+    """
+    Returns ({file_path: (stat_result, file_hash, legacy_md5)}, report) for the given paths.
+    Files whose (size, mtime_ns, inode) match the cache reuse the cached hash;
+    everything else is read and hashed on a pool of `workers` threads. Paths in
+    `legacy_md5_paths` are always read and also get their old md5 digest, so callers
+    can migrate stored md5 hashes; for every other path legacy_md5 is None.
+    `report` counts hashed, skipped and unreadable files and says whether this was
+    a full verify. Unreadable files are left out of the result.
+
+    `partial` marks a scan of a few paths rather than the whole tree (watch mode):
+    it never turns into the periodic full verify and never prunes the cache.
+    """
+    conn = _connect()
+    try:
+        if not full_verify and not partial and _full_verify_due(conn):
+            print("  [INFO] Periodic full verify is due: every file will be re-hashed.")
+            full_verify = True
+        cached = {} if full_verify else _load_cached_states(conn, [str(file_path) for file_path in file_paths] if partial else None)
+
+        results, updates = {}, []
+        report = {'hashed': 0, 'skipped': 0, 'errors': 0, 'full_verify': full_verify}
+        tasks = ((file_path, cached.get(str(file_path)), file_path in legacy_md5_paths) for file_path in file_paths)
+        for file_path, st, file_hash, legacy_md5, was_hashed, error in _run_bounded(_check_file, tasks, max(1, workers)):
+            if error:
+                print(f"  [WARN] Could not read {file_path}: {error}")
+                report['errors'] += 1
+                continue
+            results[file_path] = (st, file_hash, legacy_md5)
+            if was_hashed:
+                updates.append((str(file_path), st.st_size, st.st_mtime_ns, st.st_ino, file_hash))
+                report['hashed'] += 1
+            else:
+                report['skipped'] += 1
+
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO file_state (path, size, mtime_ns, inode, file_hash) VALUES (?, ?, ?, ?, ?)", updates)
+            if full_verify and not partial:
+                # A full verify saw every file, so anything else in the cache is gone from disk.
+                seen = {str(file_path) for file_path in results}
+                stale = [(path,) for (path,) in conn.execute("SELECT path FROM file_state") if path not in seen]
+                conn.executemany("DELETE FROM file_state WHERE path = ?", stale)
+                conn.execute("INSERT OR REPLACE INTO file_state_meta (key, value) VALUES ('last_full_verify', ?)", (str(time.time()),))
+        return results, report
+    finally:
+        conn.close()
+
+def format_scan_report(report: dict) -> str:
+    mode = "full verify" if report['full_verify'] else "stat-cache"
+    return f"Hashed {report['hashed']}, skipped {report['skipped']} unchanged, {report['errors']} unreadable ({mode})."
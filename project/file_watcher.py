@@ -0,0 +1,290 @@
+# --- File: ./project/file_watcher.py ---
+"""
+Optional live watch mode for DOCUMENTS_DIR and every .rlink target (Linux only).
+
+The watcher subscribes to inotify events (through ctypes, so no extra dependency)
+for every directory in the tree, collects the affected paths, and once a burst of
+events has been quiet for WATCH_DEBOUNCE_SECONDS hands them to a callback that
+registers, re-queues or soft-deletes just those documents. Anything inotify cannot
+tell us about reliably (queue overflow, a changed .rlink file, directories beyond
+the kernel's watch limit) falls back to the regular full discovery, which also
+runs every WATCH_RECONCILE_INTERVAL_SECONDS as a reconciliation pass.
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+
+from .file_scan import SUPPORTED_EXTENSIONS
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def is_supported() -> bool:
+    return sys.platform.startswith("linux") and ctypes.util.find_library("c") is not None
+
+
+class Inotify:
+    """Minimal ctypes wrapper around the inotify syscalls."""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def add_watch(self, path, mask=WATCH_MASK) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(str(path)), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), str(path))
+        return wd
+
+    def rm_watch(self, wd: int):
+        if self._libc.inotify_rm_watch(self.fd, wd) < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def read_events(self, timeout: float) -> list:
+        """Returns [(wd, mask, cookie, name)] for the events available within `timeout` seconds."""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            pos = 0
+            while pos < len(data):
+                wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, pos)
+                pos += _EVENT_HEADER.size
+                name = os.fsdecode(data[pos:pos + length].rstrip(b"\0"))
+                pos += length
+                events.append((wd, mask, cookie, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class DocumentWatcher:
+    """
+    Watches the document tree on a daemon thread.
+
+    on_changes(changed_files, removed_prefixes) receives the debounced batch:
+    [(file_path, relative_path)] for every supported file that was written,
+    created, moved or deleted, plus the relative paths of removed directories.
+    on_rescan() is called whenever a full discovery is needed instead.
+    """
+
+    def __init__(self, documents_dir: Path, on_changes, on_rescan, debounce: float, max_delay: float, reconcile_interval: float):
+        self.documents_dir = Path(documents_dir)
+        self.on_changes = on_changes
+        self.on_rescan = on_rescan
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.reconcile_interval = reconcile_interval
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._inotify = None
+        self._watches = {}  # wd -> (directory, root_dir, virtual_prefix)
+        self._watch_limit_hit = False
+        self._changed = {}  # file_path -> relative_path
+        self._removed_prefixes = set()
+        self._rebuild_reason = None  # set when the watched trees themselves changed
+        self._first_event_at = None
+        self._last_event_at = None
+
+    # --- Lifecycle ---
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="document-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        print(f"--- Document Watcher started for {self.documents_dir} ---")
+        try:
+            self._inotify = Inotify()
+            self._rebuild_watches()
+            last_reconcile = time.monotonic()
+            while not self._stop_event.is_set():
+                for wd, mask, cookie, name in self._inotify.read_events(timeout=0.5):
+                    self._handle_event(wd, mask, name)
+                now = time.monotonic()
+                if self._first_event_at is not None:
+                    if now - self._last_event_at >= self.debounce or now - self._first_event_at >= self.max_delay:
+                        self._flush()
+                if self.reconcile_interval and now - last_reconcile >= self.reconcile_interval:
+                    print("--- Document Watcher: periodic reconciliation scan ---")
+                    self.on_rescan()
+                    last_reconcile = now
+        except Exception as e:
+            print(f"!!! Document Watcher stopped after an error: {e}. Use 'Discover Docs' to pick up changes. !!!")
+        finally:
+            if self._inotify is not None:
+                self._inotify.close()
+            print("--- Document Watcher stopped ---")
+
+    # --- Watches ---
+    def _rebuild_watches(self):
+        """(Re)creates watches for DOCUMENTS_DIR and every .rlink target."""
+        if self._watches:
+            self._inotify.close()
+            self._inotify = Inotify()
+            self._watches.clear()
+        self._watch_limit_hit = False
+        self._watch_tree(self.documents_dir, self.documents_dir, "")
+        for rlink_file in self.documents_dir.glob('*.rlink'):
+            try:
+                target_dir = Path(rlink_file.read_text(encoding='utf-8').strip()).resolve()
+            except OSError:
+                continue
+            if target_dir.is_dir():
+                self._watch_tree(target_dir, target_dir, rlink_file.name)
+        print(f"  [INFO] Document Watcher is watching {len(self._watches)} directories.")
+
+    def _watch_tree(self, directory: Path, root_dir: Path, virtual_prefix: str):
+        for current, dirs, _ in os.walk(directory):
+            if not self._add_watch(Path(current), root_dir, virtual_prefix):
+                return
+
+    def _add_watch(self, directory: Path, root_dir: Path, virtual_prefix: str) -> bool:
+        if self._watch_limit_hit:
+            return False
+        try:
+            wd = self._inotify.add_watch(directory)
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                self._watch_limit_hit = True
+                print(f"  [WARN] inotify watch limit reached at {len(self._watches)} directories (raise fs.inotify.max_user_watches). "
+                      "Unwatched directories are only picked up by the periodic reconciliation scan.")
+                return False
+            print(f"  [WARN] Could not watch {directory}: {e}")
+            return True
+        self._watches[wd] = (directory, root_dir, virtual_prefix)
+        return True
+
+    def _drop_watches(self, directory: Path):
+        """
+        Removes the watches on `directory` and everything below it. A moved directory keeps its watches,
+        so without this they would go on reporting events under the path it was moved away from.
+        """
+        for wd, (watched, _, _) in list(self._watches.items()):
+            if watched == directory or directory in watched.parents:
+                del self._watches[wd]
+                try:
+                    self._inotify.rm_watch(wd)
+                except OSError:
+                    pass # Already gone together with the directory
+
+    def _relative_path(self, path: Path, root_dir: Path, virtual_prefix: str) -> str:
+        rel = path.relative_to(root_dir).as_posix()
+        return f"{virtual_prefix}/{rel}" if virtual_prefix else rel
+
+    # --- Events ---
+    def _mark(self):
+        now = time.monotonic()
+        if self._first_event_at is None:
+            self._first_event_at = now
+        self._last_event_at = now
+
+    def _handle_event(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            print("  [WARN] Document Watcher: inotify queue overflowed, falling back to a full discovery.")
+            self.on_rescan()
+            return
+        if mask & IN_IGNORED:
+            self._watches.pop(wd, None)
+            return
+        watch = self._watches.get(wd)
+        if watch is None:
+            return
+        if mask & IN_MOVE_SELF:
+            # Moves of subdirectories are handled through their parent's IN_MOVED_FROM/IN_MOVED_TO;
+            # only a watched root moving (DOCUMENTS_DIR or an .rlink target) needs the watches rebuilt.
+            directory, root_dir, _ = watch
+            if directory == root_dir:
+                self._rebuild_reason = f"{directory} was moved"
+                self._mark()
+            return
+        if not name:
+            return
+        if mask & IN_CREATE and not mask & IN_ISDIR:
+            # The file may still be half written; IN_CLOSE_WRITE (or IN_MOVED_TO) follows once it is
+            # complete. Files that only ever raise IN_CREATE (links) are left to the reconciliation pass.
+            return
+        directory, root_dir, virtual_prefix = watch
+        path = directory / name
+
+        if directory == self.documents_dir and name.lower().endswith('.rlink'):
+            # An alias was added, edited or removed: the set of watched trees changes.
+            self._rebuild_reason = "an .rlink alias changed"
+            self._mark()
+            return
+
+        rel_path_str = self._relative_path(path, root_dir, virtual_prefix)
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                # Files can arrive inside a directory before its watch exists, so pick them up directly.
+                # A directory moved within the tree had its old watches dropped by the IN_MOVED_FROM
+                # that precedes this event, so it is watched again under its new path.
+                self._watch_tree(path, root_dir, virtual_prefix)
+                for current, dirs, filenames in os.walk(path):
+                    for filename in filenames:
+                        if os.path.splitext(filename)[1].lower() in SUPPORTED_EXTENSIONS:
+                            file_path = Path(current) / filename
+                            self._changed[file_path] = self._relative_path(file_path, root_dir, virtual_prefix)
+                self._mark()
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                if mask & IN_MOVED_FROM:
+                    self._drop_watches(path)
+                self._removed_prefixes.add(rel_path_str)
+                self._mark()
+            return
+
+        if os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS:
+            self._changed[path] = rel_path_str
+            self._mark()
+
+    def _flush(self):
+        changed, removed = list(self._changed.items()), sorted(self._removed_prefixes)
+        self._changed, self._removed_prefixes = {}, set()
+        self._first_event_at = self._last_event_at = None
+        if self._rebuild_reason:
+            print(f"  [INFO] Document Watcher: {self._rebuild_reason}, rebuilding watches and rescanning.")
+            self._rebuild_reason = None
+            self._rebuild_watches()
+            self.on_rescan() # The full discovery covers any files changed in the same burst
+            return
+        try:
+            self.on_changes(changed, removed)
+        except Exception as e:
+            print(f"!!! Document Watcher failed to apply {len(changed)} changes: {e}. Falling back to a full discovery. !!!")
+            self.on_rescan()
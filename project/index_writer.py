@@ -0,0 +1,71 @@
+# --- File: ./project/index_writer.py ---
+"""
+The single-writer ingestion process.
+
+Worker processes only compute: they send finished document payloads, pickled,
+to the task manager over their own pool pipe, and the manager puts them on the
+write queue as (doc_id, payload bytes). Workers never touch the queue, so the
+timeout watchdog can kill one without corrupting it. This process is the only one
+that writes indexing results to SQLite. It drains the queue into batches and
+commits each batch in one transaction, so workers never contend for the write
+lock with each other (or with web requests more than once per batch). The manager
+stops dispatching documents while WRITER_QUEUE_MAX_DOCS of them wait on the writer.
+"""
+import os
+import pickle
+import queue
+import time
+
+from .config import WRITER_BATCH_MAX_DOCS, WRITER_BATCH_MAX_WAIT_SECONDS
+
+# Sentinel put on the write queue to ask the writer to exit after draining.
+STOP = None
+
+
+def _collect_batch(write_queue, first_item, max_docs, max_wait):
+    """Gathers up to max_docs payloads, waiting at most max_wait seconds after the first one."""
+    batch, stop_requested = [first_item], False
+    deadline = time.monotonic() + max_wait
+    while len(batch) < max_docs:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            item = write_queue.get(timeout=remaining)
+        except queue.Empty:
+            break
+        if item is STOP:
+            stop_requested = True
+            break
+        batch.append(item)
+    return batch, stop_requested
+
+def writer_main(write_queue, done_queue, max_docs=WRITER_BATCH_MAX_DOCS, max_wait=WRITER_BATCH_MAX_WAIT_SECONDS):
+    """Entry point of the writer process. Reports (doc_id, status, message) for every document on done_queue."""
+    # Imported here so the parent process does not need the pipeline just to start the writer.
+    import processing_pipeline
+
+    print(f"--- Index Writer {os.getpid()} started (batches of up to {max_docs} documents) ---")
+    conn = processing_pipeline.get_db_conn()
+    try:
+        while True:
+            item = write_queue.get()
+            if item is STOP:
+                break
+            batch, stop_requested = _collect_batch(write_queue, item, max_docs, max_wait)
+            if len(batch) == max_docs:
+                print(f"--- Index Writer {os.getpid()}: full batch of {max_docs}, new documents may be waiting on the writer ---")
+            payloads = []
+            for doc_id, data in batch:
+                try:
+                    payloads.append(pickle.loads(data))
+                except Exception as e:
+                    processing_pipeline.mark_document_error(doc_id, f"Writer Error: unreadable payload: {type(e).__name__}: {e}")
+                    done_queue.put((doc_id, 'Error', f"Unreadable payload: {e}"))
+            for result in (processing_pipeline.write_document_batch(conn, payloads) if payloads else []):
+                done_queue.put(result)
+            if stop_requested:
+                break
+    finally:
+        conn.close()
+        print(f"--- Index Writer {os.getpid()} stopped ---")
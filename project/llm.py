@@ -0,0 +1,95 @@
+# --- File: ./project/llm.py ---
+"""
+Chat calls to the reasoning model.
+
+chat() takes the same arguments as ollama.chat() and returns the same shapes (a
+response dict, or an iterator of chunk dicts with stream=True), so callers read
+response['message']['content'] either way. LLM_BACKEND picks who answers:
+
+  ollama  The Ollama server (the default).
+  canned  A deterministic local responder with simulated latency, for benchmarks and
+          CI runs without a model. Replies are derived from a hash of the prompt.
+"""
+import hashlib
+import json
+import random
+import re
+import time
+
+from .config import LLM_BACKEND, CANNED_LLM_LATENCY_MS, CANNED_LLM_TOKENS_PER_SECOND, CANNED_LLM_REPLY_WORDS
+
+LLM_BACKENDS = ('ollama', 'canned')
+
+_backend_name = LLM_BACKEND
+
+def use_backend(name: str):
+    """Overrides LLM_BACKEND for the rest of this process, e.g. so a benchmark can run on canned replies."""
+    global _backend_name
+    if name not in LLM_BACKENDS:
+        raise ValueError(f"Unknown LLM backend '{name}'. Choose from: {', '.join(LLM_BACKENDS)}.")
+    _backend_name = name
+
+def is_canned() -> bool:
+    return _backend_name == 'canned'
+
+def chat(model: str, messages: list, format: str = "", stream: bool = False):
+    if is_canned():
+        return _canned_chat(model, messages, format, stream)
+    import ollama
+    return ollama.chat(model=model, messages=messages, format=format, stream=stream)
+
+def show(model: str):
+    """Checks that the model is available; the canned responder always is."""
+    if is_canned():
+        return {}
+    import ollama
+    return ollama.show(model)
+
+# --- Canned responder ---
+_PROMPT_WORD_RE = re.compile(r"[A-Za-z]{4,}")
+
+def _prompt_rng(messages: list) -> tuple:
+    """A random generator seeded by the prompt, and the words of its last message to draw replies from."""
+    prompt = "\n".join(f"{m.get('role', '')}:{m.get('content', '')}" for m in messages)
+    seed = int.from_bytes(hashlib.sha256(prompt.encode('utf-8')).digest()[:8], 'little')
+    words = list(dict.fromkeys(_PROMPT_WORD_RE.findall(messages[-1].get('content', '') if messages else '')))
+    return random.Random(seed), words or ["document"]
+
+def _canned_json(rng: random.Random, words: list) -> str:
+    """One object carrying every key the assistants' JSON prompts ask for, so any of them can parse it."""
+    query = " ".join(rng.sample(words, min(3, len(words))))
+    return json.dumps({
+        "action": "search",
+        "thought": f"Looking for more on {query}.",
+        "comment": "Checking the archive.",
+        "query": query,
+        "search": query,
+        "intent": "Research",
+        "selected_ids": [0, 1, 2],
+    })
+
+def _canned_text(rng: random.Random, words: list) -> str:
+    return "Canned reply: " + " ".join(rng.choice(words) for _ in range(CANNED_LLM_REPLY_WORDS)) + "."
+
+def _canned_tokens(content: str) -> list:
+    """Splits a reply into word-sized stream chunks that concatenate back to it."""
+    return re.findall(r"\S+\s*|\s+", content) or [content]
+
+def _canned_chat(model: str, messages: list, format: str, stream: bool):
+    rng, words = _prompt_rng(messages)
+    content = _canned_json(rng, words) if format == "json" else _canned_text(rng, words)
+    token_delay = 1 / CANNED_LLM_TOKENS_PER_SECOND if CANNED_LLM_TOKENS_PER_SECOND > 0 else 0
+    if CANNED_LLM_LATENCY_MS > 0:
+        time.sleep(CANNED_LLM_LATENCY_MS / 1000)
+    if not stream:
+        if token_delay:
+            time.sleep(token_delay * len(_canned_tokens(content)))
+        return {'model': model, 'message': {'role': 'assistant', 'content': content}, 'done': True}
+
+    def chunks():
+        for token in _canned_tokens(content):
+            if token_delay:
+                time.sleep(token_delay)
+            yield {'model': model, 'message': {'role': 'assistant', 'content': token}, 'done': False}
+        yield {'model': model, 'message': {'role': 'assistant', 'content': ''}, 'done': True}
+    return chunks()
@@ -0,0 +1,113 @@
+# --- File: ./project/memory.py ---
+"""
+Best-effort process memory readings used for indexing telemetry.
+
+On Linux the numbers come straight from /proc/self/status, which also lets us
+reset the peak (VmHWM) between documents so each document reports its own peak.
+Elsewhere we fall back to psutil if it is installed, then to the `resource`
+module (lifetime peak only), and return None if nothing is available.
+"""
+import os
+import sys
+import time
+
+_PROC_STATUS = "/proc/self/status"
+_PROC_SMAPS_ROLLUP = "/proc/self/smaps_rollup"
+
+
+def _read_proc_status_kb(field: str):
+    try:
+        with open(_PROC_STATUS) as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def current_rss_mb():
+    """Resident set size of this process in MB, or None if it cannot be determined."""
+    kb = _read_proc_status_kb("VmRSS")
+    if kb is not None:
+        return kb / 1024
+    try:
+        import psutil
+        return psutil.Process(os.getpid()).memory_info().rss / (1024 * 1024)
+    except Exception:
+        return None
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (since the last reset_peak_rss(), where supported)."""
+    kb = _read_proc_status_kb("VmHWM")
+    if kb is not None:
+        return kb / 1024
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux/BSD.
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except Exception:
+        return None
+
+def reset_peak_rss() -> bool:
+    """Resets the peak RSS counter (Linux only). Returns False where peaks can only be measured per process lifetime."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def memory_breakdown_mb() -> dict:
+    """
+    RSS plus, where /proc/self/smaps_rollup exists, PSS (shared pages divided among the processes
+    sharing them) and private memory. For workers forked from a preloaded parent, the gap between
+    RSS and private memory is what copy-on-write sharing saves. Unavailable values are None.
+    """
+    breakdown = {"rss_mb": current_rss_mb(), "pss_mb": None, "private_mb": None}
+    try:
+        fields = {}
+        with open(_PROC_SMAPS_ROLLUP) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[1].isdigit():
+                    fields[parts[0].rstrip(":")] = int(parts[1])
+        if "Pss" in fields:
+            breakdown["pss_mb"] = fields["Pss"] / 1024
+        if "Private_Clean" in fields and "Private_Dirty" in fields:
+            breakdown["private_mb"] = (fields["Private_Clean"] + fields["Private_Dirty"]) / 1024
+    except OSError:
+        pass
+    return breakdown
+
+def process_age_seconds():
+    """Seconds since this process was created (forked or spawned), or None if it cannot be determined."""
+    try:
+        with open("/proc/self/stat") as f:
+            # The command name may contain spaces, so fields are counted from the closing parenthesis.
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+        return time.time() - psutil.Process(os.getpid()).create_time()
+    except Exception:
+        return None
+
+def system_available_mb():
+    """Memory the system can hand out without swapping (MemAvailable), in MB, or None if it cannot be determined."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+        return psutil.virtual_memory().available / (1024 * 1024)
+    except Exception:
+        return None
@@ -0,0 +1,88 @@
+# --- File: ./project/nlp_utils.py ---
+"""
+NLP helpers shared by the web processing pipeline and the DuckDB curator pipeline.
+They operate on spaCy spans (anything with text, label_, start_char and end_char),
+so both pipelines derive relationships from text in exactly the same way, plus the
+offset-to-cue mapping used when a transcript is analyzed as one continuous text.
+"""
+
+from bisect import bisect_right
+
+# Two entities in the same sentence are related when the text between them
+# is shorter than this many characters.
+RELATIONSHIP_WINDOW_CHARS = 75
+
+
+def extract_relationships(ents, text: str, window: int = RELATIONSHIP_WINDOW_CHARS):
+    """
+    Yields (subject, object, phrase, start_char) for every pair of entities whose
+    gap is non-empty and shorter than `window` characters. Subject and object are
+    (text, label) tuples, with the subject being the earlier entity; `phrase` is the
+    whitespace-normalised text between them and `start_char` is the subject's offset.
+
+    Entities are sorted by offset and scanned with two pointers: the right pointer
+    only ever advances, so the cost is linear in the number of entities plus the
+    number of pairs emitted, instead of examining every pairwise combination.
+    """
+    ents = sorted(set(ents), key=lambda e: (e.start_char, e.end_char))
+    count = len(ents)
+    if count < 2:
+        return
+
+    right = 0
+    for left, ent1 in enumerate(ents):
+        right = max(right, left + 1)
+        # spaCy entities never overlap, so start offsets grow with end offsets and the
+        # window's right edge can only move forward as the left edge does.
+        while right < count and ents[right].start_char - ent1.end_char < window:
+            right += 1
+        subj_text = ent1.text.strip()
+        if not subj_text:
+            continue
+        for ent2 in ents[left + 1:right]:
+            start, end = ent1.end_char, ent2.start_char
+            if end <= start:
+                continue
+            phrase = ' '.join(text[start:end].strip().split())
+            obj_text = ent2.text.strip()
+            if phrase and obj_text:
+                yield (subj_text, ent1.label_), (obj_text, ent2.label_), phrase, ent1.start_char
+
+
+class CueOffsetMap:
+    """
+    Maps character offsets in a text built by concatenating segments (e.g. SRT cues)
+    back to the segment they fall in. Segment starts are kept in a sorted array, so
+    each lookup is a single bisect instead of a scan over every segment.
+    """
+
+    def __init__(self, boundaries: list, keys: list):
+        # boundaries: [(start, end), ...] in ascending order; keys: the value returned for each segment.
+        self.starts = [start for start, _ in boundaries]
+        self.ends = [end for _, end in boundaries]
+        self.keys = list(keys)
+
+    @classmethod
+    def from_segments(cls, segments: list, keys: list, separator: str = " "):
+        """Builds the map for `separator.join(segments)`."""
+        boundaries, pos = [], 0
+        for segment in segments:
+            boundaries.append((pos, pos + len(segment)))
+            pos += len(segment) + len(separator)
+        return cls(boundaries, keys)
+
+    def lookup(self, offset: int):
+        """Returns the key of the segment containing `offset`, or None if it falls on a separator or outside the text."""
+        i = bisect_right(self.starts, offset) - 1
+        if i >= 0 and offset < self.ends[i]:
+            return self.keys[i]
+        return None
+
+
+def join_cues(cues: list) -> tuple:
+    """
+    Joins parsed SRT cues into one dialogue string and returns it with a
+    CueOffsetMap that converts character offsets into cue sequence numbers.
+    """
+    dialogues = [cue['dialogue'] for cue in cues]
+    return " ".join(dialogues), CueOffsetMap.from_segments(dialogues, [cue['sequence'] for cue in cues])
@@ -0,0 +1,107 @@
+# --- File: ./project/scheduler.py ---
+"""
+The background manager's task queue.
+
+A priority queue with the same put/get_nowait/qsize/empty interface the rest of
+the app already uses on task_queue. Lower priority numbers run first and tasks of
+equal priority keep their submission order, so a user re-processing one document
+jumps ahead of a bulk "Process All" without reordering the bulk work itself.
+
+Tasks that need a worker process and lightweight thread tasks (discovery, cache
+verification) are kept in separate lanes, so a full pool holds back only the
+former: a discovery queued behind 20,000 documents still starts immediately.
+
+Enrichment (tier 2 of tiered indexing) is queued at PRIORITY_ENRICH, behind
+everything else, and can be held back as a whole while it is paused.
+
+Every put() sets a wakeup event, which is what the manager blocks on instead of
+polling; future completion callbacks and finished threads set the same event.
+"""
+import heapq
+import itertools
+import queue
+import threading
+
+PRIORITY_INTERACTIVE = 0  # A user asked for this specific item and is waiting for it.
+PRIORITY_NORMAL = 10      # Discovery, cache verification, watcher updates.
+PRIORITY_BULK = 20        # Large batches such as "Process All 'New'".
+PRIORITY_ENRICH = 30      # Tier 2 enrichment of documents that are already searchable.
+
+# Queued task types that are dispatched to the process pool (and so wait for a free slot).
+POOL_TASK_TYPES = ('process', 'enrich')
+
+
+class TaskQueue:
+    def __init__(self, wakeup: threading.Event):
+        self._pool_lane = []
+        self._thread_lane = []
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+        self._front_sequence = itertools.count(-1, -1)
+        self.wakeup = wakeup
+
+    def put(self, item, priority: int = PRIORITY_NORMAL, front: bool = False):
+        """Queues a (task_type, item_id) tuple. `front` places it ahead of everything else at the same priority."""
+        sequence = next(self._front_sequence) if front else next(self._sequence)
+        lane = self._pool_lane if item[0] in POOL_TASK_TYPES else self._thread_lane
+        with self._lock:
+            heapq.heappush(lane, (priority, sequence, item))
+        self.wakeup.set()
+
+    def get_next(self, pool_available: bool = True):
+        """
+        Pops the highest-priority task that can start now, or returns None. Pool
+        tasks are only considered when `pool_available` is True.
+        """
+        entry = self.get_next_with_priority(pool_available)
+        return entry[1] if entry else None
+
+    def get_next_with_priority(self, pool_available: bool = True, hold_from_priority: int = None):
+        """
+        Like get_next(), but returns (priority, item) so related items can be taken
+        alongside it. Pool tasks at `hold_from_priority` or lower (numerically higher)
+        stay queued, which is how paused enrichment is held back.
+        """
+        with self._lock:
+            pool_open = pool_available and self._pool_lane and (hold_from_priority is None or self._pool_lane[0][0] < hold_from_priority)
+            lanes = [lane for lane in (self._thread_lane, self._pool_lane if pool_open else None) if lane]
+            if not lanes:
+                return None
+            priority, _, item = heapq.heappop(min(lanes, key=lambda lane: lane[0]))
+            return priority, item
+
+    def take_pool_tasks(self, priority: int, limit: int, task_type: str = None) -> list:
+        """
+        Pops up to `limit` pool tasks queued at exactly `priority` (and of `task_type`,
+        if given), in dispatch order. Used to build micro-batches.
+        """
+        taken = []
+        with self._lock:
+            while (self._pool_lane and len(taken) < limit and self._pool_lane[0][0] == priority
+                   and (task_type is None or self._pool_lane[0][2][0] == task_type)):
+                taken.append(heapq.heappop(self._pool_lane)[2])
+        return taken
+
+    def get_nowait(self):
+        item = self.get_next()
+        if item is None:
+            raise queue.Empty
+        return item
+
+    def qsize(self) -> int:
+        with self._lock:
+            return len(self._pool_lane) + len(self._thread_lane)
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
+
+    def clear(self):
+        with self._lock:
+            self._pool_lane.clear()
+            self._thread_lane.clear()
+
+    @property
+    def queue(self) -> list:
+        """Snapshot of the queued items in dispatch order."""
+        with self._lock:
+            return [item for _, _, item in sorted(self._pool_lane + self._thread_lane)]
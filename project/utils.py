@@ -9,7 +9,8 @@ from markupsafe import Markup
 from flask import current_app, g
 
 # Import from our own package to avoid circular dependencies
-from .background import task_queue, active_tasks, active_tasks_lock
+from .background import task_queue, active_tasks, active_tasks_lock, split_jobs, huge_lane_waiting, PROCESS_TASK_TYPES, ENRICH_TASK_TYPES, enrichment_paused
+from .config import TIERED_INDEXING
 
 # ===================================================================
 # TEMPLATE FILTERS
@@ -84,7 +85,10 @@ def _get_dashboard_state(db):
     task_states = {'discover': 'standard', 'process': 'standard', 'cache': 'standard'}
 
     is_discover_active = any(t[0] == 'discover' for t in active_task_list) or 'discover' in queued_task_types
-    is_process_active = any(t[0] == 'process' for t in active_task_list) or 'process' in queued_task_types
+    # With tiered indexing, split and huge-lane documents are enrichment, which runs for hours and does not block "Process".
+    enrichment_types = ENRICH_TASK_TYPES + (('process_range', 'process_merge') if TIERED_INDEXING else ())
+    is_process_active = (any(t[0] in PROCESS_TASK_TYPES and t[0] not in enrichment_types for t in active_task_list) or 'process' in queued_task_types
+                         or (not TIERED_INDEXING and (bool(split_jobs) or bool(huge_lane_waiting))))
     is_cache_active = any(t[0] == 'cache' for t in active_task_list) or 'cache' in queued_task_types
 
     # Determine the primary action button
@@ -96,9 +100,8 @@ def _get_dashboard_state(db):
         primary_action = 'cache'
     elif 'New' in statuses:
         primary_action = 'process'
-    elif 'Indexed' in statuses:
-        primary_action = 'cache'
     else:
+        # browse_cache is kept current as documents are indexed; verifying it is never the next step.
         primary_action = 'discover'
 
     task_states[primary_action] = 'primary'
@@ -108,9 +111,19 @@ def _get_dashboard_state(db):
     if is_process_active: task_states['process'] = 'disabled'
     if is_cache_active: task_states['cache'] = 'disabled'
 
+    # Tier 1 (searchable) and tier 2 (enriched) progress over all documents still on disk.
+    tier_progress = {
+        'total': sum(1 for status in statuses if status != 'Missing'),
+        'searchable': sum(1 for status in statuses if status in ('Searchable', 'Indexed')),
+        'enriched': statuses.count('Indexed'),
+        'tiered': TIERED_INDEXING,
+        'enrichment_paused': enrichment_paused.is_set()
+    }
+
     return {
-        'queue_size': task_queue.qsize(),
-        'task_states': task_states
+        'queue_size': task_queue.qsize() + len(huge_lane_waiting),
+        'task_states': task_states,
+        'tier_progress': tier_progress
     }
 
 def _create_entity_snippet(page_content, entity_text, context=150):
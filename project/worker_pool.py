@@ -0,0 +1,410 @@
+# --- File: ./project/worker_pool.py ---
+"""
+The indexing worker pool.
+
+A replacement for ProcessPoolExecutor with the same submit()/shutdown()
+interface, in which every worker is a process with its own pipe. Because the
+pool always knows which worker is running which task, it can:
+
+* recycle one worker once it has run `max_tasks_per_worker` tasks or its RSS
+  has grown past `max_rss_mb` (spaCy and PyMuPDF fragment the heap over
+  thousands of documents), replacing it without touching the others;
+* grow and shrink at runtime, which adaptive pool sizing relies on;
+* survive losing a worker (a crash, the OOM killer): only that worker's task
+  fails, with WorkerLost, where ProcessPoolExecutor would break every task in
+  the pool with BrokenProcessPool;
+* kill the one worker stuck on a task (kill_task) and start a replacement,
+  which the manager's per-document timeout watchdog relies on;
+* carry task outputs (send_task_output) to the parent over the worker's own
+  pipe. A worker that shares an mp.Queue with other processes cannot be killed
+  safely: dying mid-put leaves the queue's lock held or a message half-written.
+
+BrokenProcessPool is still raised when a worker fails to initialize, since
+every replacement would fail the same way.
+"""
+import collections
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import connection
+
+from .memory import memory_breakdown_mb, peak_rss_mb
+
+
+class WorkerLost(Exception):
+    """The worker process running a task exited before returning its result."""
+
+class TaskTimeout(Exception):
+    """The task ran past its time budget and its worker was killed."""
+
+# The pipe to the pool, set in worker processes only.
+_task_conn = None
+# Whether the pool was given an on_output callback, set in worker processes only.
+_outputs_accepted = False
+
+def report_task_pages(pages: int):
+    """
+    Called from a task once it knows how many pages it is working on, so the pool
+    can scale the task's time budget. Does nothing outside a pool worker.
+    """
+    if _task_conn is not None:
+        _task_conn.send(('pages', pages))
+
+def task_outputs_accepted() -> bool:
+    """Whether this process is a pool worker whose pool takes send_task_output()."""
+    return _task_conn is not None and _outputs_accepted
+
+def send_task_output(key, data: bytes):
+    """
+    Sends `data` from the running task to the pool's on_output callback, tagged with
+    `key`. It goes over this worker's own pipe, which nothing else writes to, so the
+    worker can be killed at any point without harming other processes.
+    """
+    _task_conn.send(('output', key))
+    _task_conn.send_bytes(data)
+
+
+def _worker_main(conn, initializer, max_tasks, max_rss_mb, outputs_accepted=False):
+    """Runs in the worker process: initializes, then executes tasks sent over `conn` until told to stop or recycled."""
+    global _task_conn, _outputs_accepted
+    if initializer is not None:
+        try:
+            initializer()
+        except BaseException:
+            traceback.print_exc()
+            raise SystemExit(1)
+    conn.send(('ready',))
+    _task_conn = conn
+    _outputs_accepted = outputs_accepted
+
+    tasks_done = 0
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        func, args, kwargs = task
+        try:
+            ok, value = True, func(*args, **kwargs)
+        except BaseException as e:
+            ok, value = False, e
+        tasks_done += 1
+
+        memory = memory_breakdown_mb()
+        memory['peak_rss_mb'] = peak_rss_mb()
+        recycle_reason = None  # (stats key, message)
+        if max_tasks and tasks_done >= max_tasks:
+            recycle_reason = ('recycled_tasks', f"reached {tasks_done} tasks")
+        elif max_rss_mb and memory['rss_mb'] is not None and memory['rss_mb'] > max_rss_mb:
+            recycle_reason = ('recycled_memory', f"RSS {memory['rss_mb']:.0f} MB is above {max_rss_mb} MB")
+        try:
+            conn.send(('done', ok, value, memory, recycle_reason))
+        except Exception as e:
+            # The result or exception could not be pickled.
+            conn.send(('done', False, RuntimeError(f"Task result could not be returned: {type(e).__name__}: {e}"), memory, recycle_reason))
+        if recycle_reason:
+            return
+
+
+class _Worker:
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.pid = process.pid
+        self.ready = False
+        self.retiring = False
+        self.future = None
+        self.task_started_at = None
+        self.task_pages = None
+        self.tasks_done = 0
+        self.memory = {}
+
+
+class WorkerPool:
+    def __init__(self, max_workers, initializer=None, mp_context=None, max_tasks_per_worker=0, max_rss_mb=0, on_output=None):
+        """
+        `on_output(future, key, data)` is called on the pool thread for every
+        send_task_output() of a task, before that task's future completes. Output
+        sent by a task that has already been killed is dropped.
+        """
+        self._ctx = mp_context
+        self._initializer = initializer
+        self._on_output = on_output
+        self._outputs = []
+        self._max_tasks = max_tasks_per_worker
+        self._max_rss_mb = max_rss_mb
+        self._size = max(1, max_workers)
+        self._workers = []
+        self._pending = collections.deque()  # (future, func, args, kwargs)
+        self._lock = threading.Lock()
+        self._shutdown = False
+        self._broken = None
+        self.paused = False
+        self.stats = {'started': 0, 'recycled_tasks': 0, 'recycled_memory': 0, 'lost': 0, 'timed_out': 0}
+        # Recent per-task worker footprints in MB, see _footprint_mb().
+        self.recent_footprints_mb = collections.deque(maxlen=50)
+        self._wakeup_reader, self._wakeup_writer = mp_context.Pipe(duplex=False)
+        self._wakeup_sent = False
+        self._thread = threading.Thread(target=self._run, name="worker-pool", daemon=True)
+        self._thread.start()
+
+    # --- Executor interface ---
+    def submit(self, func, *args, **kwargs) -> Future:
+        future = Future()
+        with self._lock:
+            if self._broken:
+                raise BrokenProcessPool(self._broken)
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new tasks after shutdown")
+            self._pending.append((future, func, args, kwargs))
+            self._wakeup()
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        """
+        Stops the workers once they finish their current task. Queued tasks never start:
+        they are cancelled once the last worker has exited, or straight away with
+        cancel_futures. Unlike concurrent.futures, the queue is not drained first.
+        """
+        with self._lock:
+            self._shutdown = True
+            cancelled = list(self._pending) if cancel_futures else []
+            if cancel_futures:
+                self._pending.clear()
+            self._wakeup()
+        for future, *_ in cancelled:
+            future.cancel()
+        if wait:
+            self._thread.join()
+
+    # --- Sizing ---
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def resize(self, size: int):
+        """Sets the number of workers. Surplus workers are stopped when idle, or as soon as their current task ends."""
+        with self._lock:
+            self._size = max(1, size)
+            self._wakeup()
+
+    def set_paused(self, paused: bool):
+        """While paused, queued tasks are held back; tasks already running are unaffected."""
+        with self._lock:
+            self.paused = paused
+            if not paused:
+                self._wakeup()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            workers = [{
+                'pid': w.pid, 'busy': w.future is not None, 'ready': w.ready, 'retiring': w.retiring,
+                'tasks_done': w.tasks_done, **{k: round(v, 1) if v is not None else None for k, v in w.memory.items()}
+            } for w in self._workers]
+            return {'size': self._size, 'live_workers': len(workers), 'queued': len(self._pending),
+                    'paused': self.paused, **self.stats, 'workers': workers}
+
+    def running_tasks(self) -> list:
+        """Returns [(future, started_at, pages)] for every running task; started_at is a time.monotonic() value."""
+        with self._lock:
+            return [(w.future, w.task_started_at, w.task_pages) for w in self._workers if w.future is not None]
+
+    def kill_task(self, future, exception: Exception) -> bool:
+        """
+        Kills the worker running `future` and fails the future with `exception`. A
+        replacement worker is started; nothing else in the pool is affected.
+        Returns False if the task is no longer running.
+        """
+        with self._lock:
+            worker = next((w for w in self._workers if w.future is future), None)
+            if worker is None:
+                return False
+            worker.future = worker.task_started_at = worker.task_pages = None
+            worker.retiring = True
+            worker.process.kill()
+            self.stats['timed_out'] += 1
+            self._wakeup()
+        future.set_exception(exception)
+        return True
+
+    @property
+    def live_workers(self) -> int:
+        with self._lock:
+            return sum(1 for w in self._workers if not w.retiring)
+
+    # --- Pool thread ---
+    def _wakeup(self):
+        """Interrupts the pool thread's wait. Called with the lock held; one byte is enough until it has been read."""
+        if not self._wakeup_sent:
+            self._wakeup_sent = True
+            self._wakeup_writer.send(None)
+
+    def _start_worker(self):
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(target=_worker_main, args=(child_conn, self._initializer, self._max_tasks, self._max_rss_mb,
+                                                               self._on_output is not None), daemon=True)
+        process.start()
+        child_conn.close()
+        self._workers.append(_Worker(process, parent_conn))
+        self.stats['started'] += 1
+
+    def _maintain(self) -> list:
+        """Starts, stops and feeds workers. Called with the lock held; returns futures to cancel."""
+        active = [w for w in self._workers if not w.retiring]
+        if not self._shutdown and not self._broken:
+            for _ in range(self._size - len(active)):
+                self._start_worker()
+        # Stop surplus workers, idle ones first.
+        surplus = len(active) - (0 if self._shutdown else self._size)
+        for w in sorted(active, key=lambda w: w.future is not None):
+            if surplus <= 0:
+                break
+            w.retiring = True
+            surplus -= 1
+            if w.future is None and w.ready:
+                self._stop_worker(w)
+
+        orphaned = []
+        if not self.paused:
+            for w in self._workers:
+                if not self._pending:
+                    break
+                if w.ready and not w.retiring and w.future is None:
+                    future, func, args, kwargs = self._pending.popleft()
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    w.future, w.task_started_at, w.task_pages = future, time.monotonic(), None
+                    try:
+                        w.conn.send((func, args, kwargs))
+                    except Exception as e:
+                        w.future = None
+                        future.set_exception(e)
+        if self._shutdown and not self._workers:
+            orphaned, self._pending = list(self._pending), collections.deque()
+        return orphaned
+
+    def _stop_worker(self, w):
+        try:
+            w.conn.send(None)
+        except OSError:
+            pass
+
+    def _handle_message(self, w, message) -> list:
+        """Returns (future, ok, value) completions to deliver once the lock is released."""
+        if message[0] == 'ready':
+            w.ready = True
+            if w.retiring:
+                self._stop_worker(w)
+            return []
+        if message[0] == 'pages':
+            w.task_pages = message[1]
+            return []
+        if message[0] == 'output':
+            data = w.conn.recv_bytes()
+            if w.future is not None:
+                self._outputs.append((w.future, message[1], data))
+            return []
+        _, ok, value, memory, recycle_reason = message
+        future, w.future, w.task_started_at, w.task_pages = w.future, None, None, None
+        w.tasks_done += 1
+        w.memory = memory
+        footprint = _footprint_mb(memory)
+        if footprint is not None:
+            self.recent_footprints_mb.append(footprint)
+        if recycle_reason:
+            w.retiring = True
+            self.stats[recycle_reason[0]] += 1
+            print(f"Worker pool: recycling worker {w.pid} ({recycle_reason[1]}).")
+        elif w.retiring:
+            self._stop_worker(w)
+        return [(future, ok, value)] if future is not None else []
+
+    def _handle_exit(self, w) -> list:
+        completions = []
+        # A worker that is recycled sends its last result and exits straight away: read it first.
+        try:
+            while w.conn.poll():
+                completions += self._handle_message(w, w.conn.recv())
+        except (EOFError, OSError):
+            pass
+        w.process.join()
+        w.conn.close()
+        self._workers.remove(w)
+        if w.future is not None:
+            self.stats['lost'] += 1
+            print(f"!!! Worker pool: worker {w.pid} exited with code {w.process.exitcode} while running a task. !!!")
+            completions.append((w.future, False, WorkerLost(f"Worker process {w.pid} exited unexpectedly (exit code {w.process.exitcode}).")))
+        elif not w.ready and not self._shutdown and not self._broken:
+            self._broken = f"A worker process failed to initialize (exit code {w.process.exitcode})."
+            print(f"!!! Worker pool: {self._broken} !!!")
+            for future, *_ in self._pending:
+                completions.append((future, False, BrokenProcessPool(self._broken)))
+            self._pending.clear()
+        return completions
+
+    def _run(self):
+        while True:
+            with self._lock:
+                orphaned = self._maintain()
+                if self._shutdown and not self._workers:
+                    break
+                waitables = {}
+                for w in self._workers:
+                    waitables[w.conn] = w
+                    waitables[w.process.sentinel] = w
+            for future, *_ in orphaned:
+                future.cancel()
+
+            ready = connection.wait(list(waitables) + [self._wakeup_reader], timeout=1.0)
+            completions = []
+            with self._lock:
+                for obj in ready:
+                    if obj is self._wakeup_reader:
+                        while self._wakeup_reader.poll():
+                            self._wakeup_reader.recv()
+                        self._wakeup_sent = False
+                        continue
+                    w = waitables[obj]
+                    if w not in self._workers:
+                        continue
+                    if obj is w.conn:
+                        try:
+                            completions += self._handle_message(w, w.conn.recv())
+                            continue
+                        except (EOFError, OSError):
+                            pass
+                    completions += self._handle_exit(w)
+                outputs, self._outputs = self._outputs, []
+            # Outputs are delivered first: a task's future only completes once its outputs have been taken.
+            for future, key, data in outputs:
+                try:
+                    self._on_output(future, key, data)
+                except Exception:
+                    print("!!! Worker pool: on_output callback failed. !!!")
+                    traceback.print_exc()
+            for future, ok, value in completions:
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+        for future, *_ in orphaned:
+            future.cancel()
+        self._wakeup_reader.close()
+        self._wakeup_writer.close()
+
+
+def _footprint_mb(memory: dict):
+    """
+    What one more worker like this costs: its private memory plus how far it peaked
+    above its current RSS during the task. Pages shared with the forkserver are not
+    counted; where private memory is unknown the peak RSS is used instead.
+    """
+    rss, private, peak = memory.get('rss_mb'), memory.get('private_mb'), memory.get('peak_rss_mb')
+    if private is not None and rss is not None and peak is not None:
+        return private + max(0.0, peak - rss)
+    return peak if peak is not None else rss
@@ -0,0 +1,20 @@
+# --- File: ./project/worker_preload.py ---
+"""
+Imported once by the multiprocessing forkserver when WORKER_START_METHOD is
+'forkserver'. Loading the spaCy model here means every worker forked from the
+server starts with it already in memory, sharing those pages copy-on-write
+instead of each re-importing the stack and loading its own ~1 GB copy.
+"""
+import gc
+
+import processing_pipeline
+
+try:
+    processing_pipeline.load_spacy_model()
+except Exception as e:
+    # An exception here would take down the forkserver; workers load the model themselves instead.
+    print(f"!!! WARNING: Forkserver could not preload the spaCy model, workers will load it individually. Error: {e} !!!")
+
+# Move everything loaded so far out of the garbage collector's view, so collections in the
+# workers do not touch (and thereby un-share) the model's pages.
+gc.freeze()
@@ -4,10 +4,12 @@ import multiprocessing
 import subprocess
 from pathlib import Path
 import zipfile
+import shutil
 
 from project import create_app
-from project.config import DATABASE_FILE, INSTANCE_DIR
+from project.config import DATABASE_FILE, INSTANCE_DIR, STAGING_DIR
 import storage_setup
+import update_schema
 
 def run_startup_logic():
     multiprocessing.freeze_support()
@@ -63,6 +65,10 @@ def run_startup_logic():
             storage_setup.create_unified_index(db_path)
         else:
             print("--- Performing startup cleanup ---")
+            try:
+                update_schema.upgrade_schema(db_path, verbose=False)
+            except Exception as e:
+                print(f"!!! ERROR while upgrading database schema: {e} !!!")
             conn = None
             try:
                 conn = sqlite3.connect(db_path)
@@ -75,6 +81,8 @@ def run_startup_logic():
                     print("Cleanup complete.")
                 else:
                     print("System state is clean.")
+                # Spilled windows of documents that were mid-index are useless once they are reset.
+                shutil.rmtree(STAGING_DIR, ignore_errors=True)
             except Exception as e:
                 print(f"!!! ERROR during startup cleanup: {e} !!!")
             finally:
@@ -17,6 +17,9 @@ from project.config import REDLEAF_BASE_URL, REASONING_MODEL, EMBEDDING_MODEL
 from project.database import get_db
 from project.prompts import ROUTER_PROMPT
 from project.background import get_system_settings
+from project.embedding_broker import interactive_session
+from project.embedding_backends import configured_backend_name
+from project import llm
 import ollama
 
 # --- Tool Definitions ---
@@ -232,7 +235,8 @@ def summarize_collection(query: str, limit: int = 5) -> str:
             # Quick summarization call (bypassing main agent loop for speed)
             prompt = f"Summarize this document in 3 sentences. Context: {content[:4000]}"
             try:
-                response = ollama.chat(model=REASONING_MODEL, messages=[{'role': 'user', 'content': prompt}])
+                with interactive_session():
+                    response = llm.chat(model=REASONING_MODEL, messages=[{'role': 'user', 'content': prompt}])
                 summary = response['message']['content']
                 master_summary += f"--- Document: {title} (ID: {doc_id}) ---\n{summary}\n\n"
             except:
@@ -288,10 +292,11 @@ def main():
         # 3. Connectivity Check
         print(f"[INFO] Connecting to Ollama...")
         try:
-            ollama.show(selected_model)
+            llm.show(selected_model)
             print(f"[OK]   Reasoning Model '{selected_model}' is reachable.")
-            ollama.show(EMBEDDING_MODEL)
-            print(f"[OK]   Embedding Model '{EMBEDDING_MODEL}' is reachable.")
+            if configured_backend_name() == "ollama":
+                ollama.show(EMBEDDING_MODEL)
+                print(f"[OK]   Embedding Model '{EMBEDDING_MODEL}' is reachable.")
         except Exception as e:
             print(f"[FAIL] Could not connect to Ollama or a model was not found.")
             print(f"       Error: {e}")
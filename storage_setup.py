@@ -367,14 +367,14 @@ def create_unified_index(db_path, is_bake_operation=False):
     cursor.execute("""
         CREATE VIRTUAL TABLE IF NOT EXISTS vec_embedding_chunks USING vec0(
             chunk_id INTEGER PRIMARY KEY,
-            embedding float[768]
+            embedding float[768] distance_metric=cosine
         );
     """)
     
     cursor.execute("""
         CREATE VIRTUAL TABLE IF NOT EXISTS vec_super_embedding_chunks USING vec0(
             chunk_id INTEGER PRIMARY KEY,
-            embedding float[768]
+            embedding float[768] distance_metric=cosine
         );
     """)
     
@@ -433,6 +433,13 @@ def create_unified_index(db_path, is_bake_operation=False):
 
     conn.commit()
     conn.close()
+
+    # === 12. SCHEMA UPGRADES ===
+    # Tables and columns added since this baseline are defined once, as upgrade steps, and
+    # applied here exactly as they are to an existing database on startup.
+    print("Applying schema upgrades...")
+    from update_schema import upgrade_schema  # Imported here: update_schema imports the project package
+    upgrade_schema(db_path, verbose=False)
     print("--- Unified Index setup is complete. ---")
 
 if __name__ == '__main__':
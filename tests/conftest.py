@@ -0,0 +1,32 @@
+# --- File: ./tests/conftest.py ---
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+# Some Python builds ship an sqlite3 that cannot load extensions, which sqlite-vec needs.
+# pysqlite3 is a drop-in replacement for those; it must be swapped in before the app imports sqlite3.
+if not hasattr(sqlite3.Connection, "enable_load_extension"):
+    try:
+        import pysqlite3
+        sys.modules["sqlite3"] = pysqlite3
+    except ImportError:
+        pass
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def index_db(tmp_path, monkeypatch):
+    """A fresh Unified Index that processing_pipeline reads and writes, with staging under tmp_path."""
+    import storage_setup
+    import processing_pipeline
+
+    db_path = tmp_path / "knowledge_base.db"
+    storage_setup.create_unified_index(db_path)
+    monkeypatch.setattr(processing_pipeline, "DATABASE_FILE", db_path)
+    monkeypatch.setattr(processing_pipeline, "STAGING_DIR", tmp_path / "index_staging")
+    conn = processing_pipeline.get_db_conn()
+    yield conn
+    conn.close()
@@ -0,0 +1,45 @@
+# --- File: ./tests/test_browse_cache.py ---
+from project import browse_cache
+
+
+def _cache(conn):
+    return {row[0]: (row[1], row[2]) for row in conn.execute("SELECT entity_id, document_count, appearance_count FROM browse_cache")}
+
+
+def _add_appearances(conn, doc_id, appearances):
+    conn.executemany("INSERT INTO entity_appearances (doc_id, entity_id, page_number) VALUES (?, ?, ?)",
+                     [(doc_id, entity_id, page_number) for entity_id, page_number in appearances])
+
+
+def test_apply_delta_tracks_document_changes(index_db):
+    conn = index_db
+    conn.executemany("INSERT INTO entities (id, text, label) VALUES (?, ?, ?)", [(1, "Ada", "PERSON"), (2, "Acme", "ORG"), (3, "Paris", "GPE")])
+    conn.executemany("INSERT INTO documents (id, relative_path, file_hash, file_type, status) VALUES (?, ?, 'h', 'PDF', 'Indexed')", [(1, "a.pdf"), (2, "b.pdf")])
+
+    _add_appearances(conn, 1, [(1, 1), (1, 2), (2, 1)])
+    _add_appearances(conn, 2, [(1, 1)])
+    assert browse_cache.add_documents(conn, [1, 2]) == 2
+    assert _cache(conn) == {1: (2, 3), 2: (1, 1)}
+
+    # Re-indexing document 1: Acme disappears, Paris appears, Ada keeps one page.
+    before = browse_cache.document_contributions(conn, [1])
+    conn.execute("DELETE FROM entity_appearances WHERE doc_id = 1")
+    _add_appearances(conn, 1, [(1, 1), (3, 4)])
+    assert browse_cache.apply_delta(conn, before, browse_cache.document_contributions(conn, [1])) == 3
+    assert _cache(conn) == {1: (2, 2), 3: (1, 1)}
+
+    # An unchanged document changes nothing.
+    contributions = browse_cache.document_contributions(conn, [2])
+    assert browse_cache.apply_delta(conn, contributions, contributions) == 0
+
+    assert browse_cache.remove_documents(conn, [1, 2]) == 2
+    assert _cache(conn) == {}
+
+
+def test_cache_row_carries_entity_text(index_db):
+    conn = index_db
+    conn.execute("INSERT INTO entities (id, text, label) VALUES (1, 'Ada', 'PERSON')")
+    conn.execute("INSERT INTO documents (id, relative_path, file_hash, file_type, status) VALUES (1, 'a.pdf', 'h', 'PDF', 'Indexed')")
+    _add_appearances(conn, 1, [(1, 1)])
+    browse_cache.add_documents(conn, [1])
+    assert tuple(conn.execute("SELECT entity_text, entity_label FROM browse_cache WHERE entity_id = 1").fetchone()) == ("Ada", "PERSON")
@@ -0,0 +1,35 @@
+# --- File: ./tests/test_embedding_backends.py ---
+import numpy as np
+
+import update_schema
+from project.config import EMBEDDING_DIMENSIONS
+from project.embedding_backends import BACKENDS, LEGACY_OLLAMA_MODEL_ID, FakeBackend
+
+
+def test_every_backend_has_its_own_vector_space():
+    model_ids = [backend.model_id for backend in BACKENDS.values()]
+    assert len(set(model_ids + [LEGACY_OLLAMA_MODEL_ID])) == len(model_ids) + 1
+
+
+def test_fake_backend_is_deterministic_and_normalized():
+    backend = FakeBackend(latency_ms=0, per_text_ms=0, max_batch=2, parallel=0)
+    texts = ["Ada works at Acme", "Ada works at Acme", "", "Paris"]
+    vectors = backend.embed(texts)
+    assert backend.calls == 2
+    assert len(vectors) == len(texts)
+    assert all(vector.shape == (EMBEDDING_DIMENSIONS,) for vector in vectors)
+    assert np.array_equal(vectors[0], vectors[1])
+    assert np.allclose([np.linalg.norm(vector) for vector in vectors], 1.0)
+    # Shared words make texts closer than unrelated ones.
+    similar, unrelated = backend.embed(["Ada works at Acme Corp", "weather in Paris"])
+    assert vectors[0] @ similar > vectors[0] @ unrelated
+
+
+def test_upgrade_marks_previously_embedded_documents_as_legacy(index_db):
+    conn = index_db
+    conn.executemany("INSERT INTO documents (id, relative_path, file_hash, file_type, status) VALUES (?, ?, 'h', 'PDF', 'Indexed')", [(1, "a.pdf"), (2, "b.pdf")])
+    conn.execute("INSERT INTO embedding_chunks (id, doc_id, page_number, chunk_text) VALUES (1, 1, 1, 'text')")
+    conn.commit()
+
+    update_schema.add_document_embedding_model(conn.cursor())
+    assert [tuple(row) for row in conn.execute("SELECT id, embedding_model FROM documents ORDER BY id")] == [(1, LEGACY_OLLAMA_MODEL_ID), (2, None)]
@@ -0,0 +1,35 @@
+# --- File: ./tests/test_incremental_pages.py ---
+from processing_pipeline import _page_hash, _plan_page_updates, _pages_to_replace
+
+
+def test_first_index_rebuilds_every_page():
+    pages = {1: "alpha", 2: "beta"}
+    page_hashes, to_process, changed = _plan_page_updates({}, pages)
+    assert page_hashes == {1: _page_hash("alpha"), 2: _page_hash("beta")}
+    assert to_process == pages
+    assert changed is None
+    assert _pages_to_replace({}, page_hashes, changed) is None
+
+
+def test_only_changed_pages_are_processed():
+    stored = {1: _page_hash("alpha"), 2: _page_hash("beta"), 3: _page_hash("gamma")}
+    page_hashes, to_process, changed = _plan_page_updates(stored, {1: "alpha", 2: "BETA", 3: "gamma"})
+    assert to_process == {2: "BETA"}
+    assert changed == [2]
+    assert page_hashes[2] == _page_hash("BETA")
+    assert _pages_to_replace(stored, page_hashes, changed) == [2]
+
+
+def test_removed_and_added_pages_are_replaced():
+    stored = {1: _page_hash("alpha"), 2: _page_hash("beta"), 3: _page_hash("gamma")}
+    # Page 2 became empty (no text), page 4 is new.
+    page_hashes, to_process, changed = _plan_page_updates(stored, {1: "alpha", 3: "gamma", 4: "delta"})
+    assert to_process == {4: "delta"}
+    assert _pages_to_replace(stored, page_hashes, changed) == [2, 4]
+
+
+def test_unchanged_document_replaces_nothing():
+    stored = {1: _page_hash("alpha")}
+    page_hashes, to_process, changed = _plan_page_updates(stored, {1: "alpha"})
+    assert to_process == {}
+    assert _pages_to_replace(stored, page_hashes, changed) == []
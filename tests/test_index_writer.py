@@ -0,0 +1,132 @@
+# --- File: ./tests/test_index_writer.py ---
+import pickle
+import struct
+
+import pytest
+
+import processing_pipeline
+
+EMBEDDING_DIM = 768
+
+
+def _vector(value):
+    return struct.pack(f'{EMBEDDING_DIM}f', *([value] * EMBEDDING_DIM))
+
+
+def _add_document(conn, doc_id, status='Indexing'):
+    conn.execute("INSERT INTO documents (id, relative_path, file_hash, file_type, status) VALUES (?, ?, 'h', 'PDF', ?)",
+                 (doc_id, f"doc{doc_id}.pdf", status))
+    conn.commit()
+
+
+def _payload(doc_id, pages):
+    return {
+        "doc_id": doc_id,
+        "page_count": len(pages),
+        "duration_seconds": None,
+        "email_metadata": None,
+        "csl_json": None,
+        "page_hashes": {page_num: processing_pipeline._page_hash(text) for page_num, text in pages.items()},
+        "pages_to_replace": None,
+        "content": list(pages.items()),
+        "embeddings": [(doc_id, page_num, text, _vector(page_num)) for page_num, text in pages.items()],
+        "entities": {("Ada", "PERSON")},
+        "appearances": {(("Ada", "PERSON"), page_num) for page_num in pages},
+        "relationships": [],
+        "super_chunks": [],
+        "stats": {"worker_pid": 4242},
+    }
+
+
+def _rows(conn, sql, *params):
+    return [tuple(row) for row in conn.execute(sql, params).fetchall()]
+
+
+def test_failed_document_rolls_back_only_itself(index_db):
+    conn = index_db
+    for doc_id in (1, 2):
+        _add_document(conn, doc_id)
+    processing_pipeline._write_document_payload(conn, _payload(2, {1: "old text"}))
+
+    broken = _payload(2, {1: "new text"})
+    del broken["page_count"]  # Fails after the document's old rows have been deleted inside its savepoint
+    results = processing_pipeline.write_document_batch(conn, [_payload(1, {1: "one", 2: "two"}), broken])
+
+    assert [(doc_id, status) for doc_id, status, _ in results] == [(1, 'Indexed'), (2, 'Error')]
+    assert _rows(conn, "SELECT id, status FROM documents ORDER BY id") == [(1, 'Indexed'), (2, 'Error')]
+    # Document 2 still has the rows of its last successful index.
+    assert _rows(conn, "SELECT page_number, page_content FROM content_index WHERE doc_id = 2") == [(1, "old text")]
+    assert _rows(conn, "SELECT COUNT(*) FROM embedding_chunks WHERE doc_id = 2") == [(1,)]
+    assert _rows(conn, "SELECT page_number FROM content_index WHERE doc_id = 1 ORDER BY page_number") == [(1,), (2,)]
+    assert _rows(conn, "SELECT entity_id, document_count, appearance_count FROM browse_cache") == [(1, 2, 3)]
+    assert _rows(conn, "SELECT doc_id, worker_pid FROM document_index_stats ORDER BY doc_id") == [(1, 4242), (2, 4242)]
+
+
+def test_entity_ids_are_resolved_in_one_pass(index_db):
+    conn = index_db
+    conn.execute("INSERT INTO entities (id, text, label) VALUES (5, 'Ada', 'PERSON')")
+    cursor = conn.cursor()
+    ids = processing_pipeline._resolve_entity_ids(cursor, [("Ada", "PERSON"), ("Ada", "ORG"), ("Acme", "ORG")])
+    assert ids[("Ada", "PERSON")] == 5
+    assert _rows(conn, "SELECT id, text, label FROM entities ORDER BY id") == [(5, "Ada", "PERSON")] + sorted(
+        (entity_id, text, label) for (text, label), entity_id in ids.items() if entity_id != 5)
+    # The staging table is left empty for the next document in the same transaction.
+    assert processing_pipeline._resolve_entity_ids(cursor, [("Acme", "ORG")]) == {("Acme", "ORG"): ids[("Acme", "ORG")]}
+
+
+def _spill_range(doc_id, first_page, last_page, page_count):
+    """Stages pages first_page..last_page the way process_page_range does, without reading a PDF."""
+    staging_dir = processing_pipeline._staging_dir_for(doc_id)
+    staging_dir.mkdir(parents=True, exist_ok=True)
+    pages = {page_num: f"page {page_num}" for page_num in range(first_page, last_page + 1)}
+    part = {
+        "content": list(pages.items()),
+        "embeddings": [(doc_id, page_num, text, _vector(page_num)) for page_num, text in pages.items()],
+        "entities": {("Ada", "PERSON")},
+        "appearances": {(("Ada", "PERSON"), page_num) for page_num in pages},
+        "relationships": [],
+        "super_chunks": [],
+    }
+    spill_path = staging_dir / f"range_{first_page:06d}_{first_page:06d}.pkl"
+    with open(spill_path, 'wb') as f:
+        pickle.dump(part, f)
+    return {
+        "page_hashes": {page_num: processing_pipeline._page_hash(text) for page_num, text in pages.items()},
+        "changed_pages": [],
+        "spill_files": [str(spill_path)],
+        "pages_processed": len(pages),
+        "embed_ms": 1.0,
+        "first_page": first_page,
+        "last_page": last_page,
+        "page_count": page_count,
+        "compute_ms": 2.0,
+        "peak_rss_mb": 100.0 + first_page,
+    }
+
+
+def test_merge_page_ranges_indexes_every_range(index_db):
+    conn = index_db
+    _add_document(conn, 7)
+    # Ranges may finish in any order.
+    ranges = [_spill_range(7, 4, 6, 6), _spill_range(7, 1, 3, 6)]
+
+    assert processing_pipeline.merge_page_ranges(7, ranges) == "SUCCESS"
+    assert _rows(conn, "SELECT status, page_count FROM documents WHERE id = 7") == [('Indexed', 6)]
+    assert _rows(conn, "SELECT page_number FROM content_index WHERE doc_id = 7 ORDER BY page_number") == [(n,) for n in range(1, 7)]
+    assert _rows(conn, "SELECT COUNT(*) FROM embedding_chunks e JOIN vec_embedding_chunks v ON v.chunk_id = e.id WHERE e.doc_id = 7") == [(6,)]
+    assert _rows(conn, "SELECT COUNT(*) FROM document_page_hashes WHERE doc_id = 7") == [(6,)]
+    assert sum(_rows(conn, f"SELECT COUNT(*) FROM {table}")[0][0] for table in processing_pipeline._STAGED_TABLES) == 0
+    assert _rows(conn, "SELECT compute_ms, peak_rss_mb FROM document_index_stats WHERE doc_id = 7") == [(4.0, 104.0)]
+    assert not processing_pipeline._staging_dir_for(7).exists()
+
+
+def test_merge_page_ranges_rejects_a_grown_pdf(index_db):
+    conn = index_db
+    _add_document(conn, 8)
+    ranges = [_spill_range(8, 1, 3, 5)]
+
+    with pytest.raises(ValueError):
+        processing_pipeline.merge_page_ranges(8, ranges)
+    assert _rows(conn, "SELECT status FROM documents WHERE id = 8") == [('Error',)]
+    assert _rows(conn, "SELECT COUNT(*) FROM content_index WHERE doc_id = 8") == [(0,)]
+    assert not processing_pipeline._staging_dir_for(8).exists()
@@ -0,0 +1,56 @@
+# --- File: ./tests/test_nlp_utils.py ---
+import random
+from collections import namedtuple
+from itertools import combinations
+
+from project.nlp_utils import RELATIONSHIP_WINDOW_CHARS, extract_relationships, join_cues
+
+Span = namedtuple("Span", "text label_ start_char end_char")
+
+
+def _pairwise_relationships(ents, text):
+    """The all-pairs scan extract_relationships replaced, kept as the reference."""
+    results = []
+    for ent1, ent2 in combinations(list(dict.fromkeys(ents)), 2):
+        start, end = min(ent1.end_char, ent2.end_char), max(ent1.start_char, ent2.start_char)
+        if end > start and (end - start) < RELATIONSHIP_WINDOW_CHARS:
+            phrase = ' '.join(text[start:end].strip().split())
+            if phrase:
+                subj = (ent1.text.strip(), ent1.label_) if ent1.start_char < ent2.start_char else (ent2.text.strip(), ent2.label_)
+                obj = (ent2.text.strip(), ent2.label_) if ent1.start_char < ent2.start_char else (ent1.text.strip(), ent1.label_)
+                if subj[0] and obj[0]:
+                    results.append((subj, obj, phrase, min(ent1.start_char, ent2.start_char)))
+    return sorted(results)
+
+
+def _random_sentence(rng):
+    """Builds text with non-overlapping entity spans at random gaps, some of them only whitespace."""
+    text, ents = "", []
+    for _ in range(rng.randint(0, 12)):
+        text += rng.choice(["", " ", "  ", " and ", " works with ", " x" * rng.randint(1, 60)])
+        name = rng.choice(["Ada", "Bob", "Acme Corp", " ", "Paris"])
+        ents.append(Span(name, rng.choice(["PERSON", "ORG", "GPE"]), len(text), len(text) + len(name)))
+        text += name
+    # spaCy hands entities over in order, but nothing requires callers to; repeats are also tolerated.
+    rng.shuffle(ents)
+    return text, ents + ents[:2]
+
+
+def test_matches_pairwise_scan():
+    rng = random.Random(7)
+    for _ in range(500):
+        text, ents = _random_sentence(rng)
+        assert sorted(extract_relationships(ents, text)) == _pairwise_relationships(ents, text)
+
+
+def test_window_is_exclusive():
+    text = "Ada" + " " * (RELATIONSHIP_WINDOW_CHARS - 2) + "x Bob"
+    ents = [Span("Ada", "PERSON", 0, 3), Span("Bob", "PERSON", len(text) - 3, len(text))]
+    assert list(extract_relationships(ents, text)) == []
+    assert len(list(extract_relationships(ents, text, window=RELATIONSHIP_WINDOW_CHARS + 1))) == 1
+
+
+def test_join_cues_maps_offsets_to_cues():
+    text, offsets = join_cues([{"sequence": 5, "dialogue": "hello"}, {"sequence": 6, "dialogue": "world"}])
+    assert text == "hello world"
+    assert [offsets.lookup(i) for i in (0, 4, 5, 6, 10, 11)] == [5, 5, None, 6, 6, None]
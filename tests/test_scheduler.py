@@ -0,0 +1,60 @@
+# --- File: ./tests/test_scheduler.py ---
+import threading
+
+from project.scheduler import PRIORITY_BULK, PRIORITY_ENRICH, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, TaskQueue
+
+
+def _drain(task_queue, **kwargs):
+    items = []
+    while (item := task_queue.get_next(**kwargs)) is not None:
+        items.append(item)
+    return items
+
+
+def test_lower_priority_numbers_run_first_in_submission_order():
+    task_queue = TaskQueue(threading.Event())
+    task_queue.put(('process', 1), priority=PRIORITY_BULK)
+    task_queue.put(('process', 2), priority=PRIORITY_BULK)
+    task_queue.put(('enrich', 3), priority=PRIORITY_ENRICH)
+    task_queue.put(('process', 4), priority=PRIORITY_INTERACTIVE)
+    task_queue.put(('process', 5), priority=PRIORITY_BULK)
+    assert _drain(task_queue) == [('process', 4), ('process', 1), ('process', 2), ('process', 5), ('enrich', 3)]
+
+
+def test_front_jumps_ahead_within_its_priority_only():
+    task_queue = TaskQueue(threading.Event())
+    task_queue.put(('process', 1), priority=PRIORITY_INTERACTIVE)
+    task_queue.put(('process', 2), priority=PRIORITY_BULK)
+    task_queue.put(('process', 3), priority=PRIORITY_BULK, front=True)
+    task_queue.put(('process', 4), priority=PRIORITY_BULK, front=True)
+    assert _drain(task_queue) == [('process', 1), ('process', 4), ('process', 3), ('process', 2)]
+
+
+def test_full_pool_holds_back_only_pool_tasks():
+    task_queue = TaskQueue(threading.Event())
+    task_queue.put(('process', 1), priority=PRIORITY_INTERACTIVE)
+    task_queue.put(('discover', None), priority=PRIORITY_NORMAL)
+    assert _drain(task_queue, pool_available=False) == [('discover', None)]
+    assert task_queue.get_next() == ('process', 1)
+
+
+def test_paused_enrichment_stays_queued():
+    task_queue = TaskQueue(threading.Event())
+    task_queue.put(('enrich', 1), priority=PRIORITY_ENRICH)
+    task_queue.put(('process', 2), priority=PRIORITY_BULK)
+    assert task_queue.get_next_with_priority(hold_from_priority=PRIORITY_ENRICH) == (PRIORITY_BULK, ('process', 2))
+    assert task_queue.get_next_with_priority(hold_from_priority=PRIORITY_ENRICH) is None
+    assert task_queue.qsize() == 1
+    assert task_queue.get_next_with_priority() == (PRIORITY_ENRICH, ('enrich', 1))
+
+
+def test_put_sets_wakeup_and_take_pool_tasks_batches_one_priority():
+    wakeup = threading.Event()
+    task_queue = TaskQueue(wakeup)
+    for doc_id in range(1, 5):
+        task_queue.put(('process', doc_id), priority=PRIORITY_BULK)
+    task_queue.put(('process', 9), priority=PRIORITY_ENRICH)
+    assert wakeup.is_set()
+    assert task_queue.take_pool_tasks(PRIORITY_BULK, limit=3) == [('process', 1), ('process', 2), ('process', 3)]
+    assert task_queue.take_pool_tasks(PRIORITY_BULK, limit=3) == [('process', 4)]
+    assert task_queue.queue == [('process', 9)]
@@ -1,40 +1,199 @@
 import sqlite3
+import sqlite_vec
 from project.config import DATABASE_FILE
 
-def add_boosted_relationships_table():
-    """Safely adds the new table to an existing database."""
-    print(f"--- Connecting to your database at: {DATABASE_FILE} ---")
-    
-    try:
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
+# Each upgrade step must be idempotent: it is safe to run this script (or
+# call upgrade_schema() on startup) any number of times.
+
+def add_boosted_relationships_table(cursor):
+    """Adds the user-driven relationship weighting table."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS boosted_relationships (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            source_entity_id INTEGER NOT NULL,
+            target_entity_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(user_id, source_entity_id, target_entity_id),
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY (source_entity_id) REFERENCES entities(id) ON DELETE CASCADE,
+            FOREIGN KEY (target_entity_id) REFERENCES entities(id) ON DELETE CASCADE
+        );
+    """)
+
+def add_document_index_stats_table(cursor):
+    """Adds the per-document indexing telemetry table (timings and write lock hold)."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS document_index_stats (
+            doc_id INTEGER PRIMARY KEY,
+            worker_pid INTEGER,
+            compute_ms REAL,
+            embed_ms REAL,
+            lock_wait_ms REAL,
+            write_lock_ms REAL,
+            chunk_count INTEGER,
+            super_chunk_count INTEGER,
+            pages_reindexed INTEGER,
+            pages_reused INTEGER,
+            peak_rss_mb REAL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (doc_id) REFERENCES documents(id) ON DELETE CASCADE
+        );
+    """)
+
+def _add_missing_columns(cursor, table, columns):
+    cursor.execute(f"PRAGMA table_info({table})")
+    existing_columns = {row[1] for row in cursor.fetchall()}
+    for col_name, col_type in columns:
+        if col_name not in existing_columns:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {col_name} {col_type}")
 
-        print("Checking for and creating the 'boosted_relationships' table...")
-
-        # The "IF NOT EXISTS" makes this script safe to run multiple times.
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS boosted_relationships (
-                id INTEGER PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                source_entity_id INTEGER NOT NULL,
-                target_entity_id INTEGER NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(user_id, source_entity_id, target_entity_id),
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-                FOREIGN KEY (source_entity_id) REFERENCES entities(id) ON DELETE CASCADE,
-                FOREIGN KEY (target_entity_id) REFERENCES entities(id) ON DELETE CASCADE
+def add_incremental_indexing_support(cursor):
+    """Adds per-page content hashes and the reuse counters used by incremental re-indexing."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS document_page_hashes (
+            doc_id INTEGER NOT NULL,
+            page_number INTEGER NOT NULL,
+            content_hash TEXT NOT NULL,
+            PRIMARY KEY (doc_id, page_number),
+            FOREIGN KEY (doc_id) REFERENCES documents(id) ON DELETE CASCADE
+        ) WITHOUT ROWID;
+    """)
+    _add_missing_columns(cursor, "document_index_stats", [("pages_reindexed", "INTEGER"), ("pages_reused", "INTEGER")])
+
+def add_peak_rss_column(cursor):
+    """Records each document's peak worker memory alongside its indexing timings."""
+    _add_missing_columns(cursor, "document_index_stats", [("peak_rss_mb", "REAL")])
+
+VECTOR_TABLES = ("vec_embedding_chunks", "vec_super_embedding_chunks")
+
+def use_cosine_vector_distance(cursor):
+    """
+    Rebuilds vec0 tables declared before distance_metric=cosine. Without it the KNN
+    query ranks candidates by L2, which disagrees with the cosine re-rank for any
+    vector that was stored un-normalized.
+    """
+    for table in VECTOR_TABLES:
+        row = cursor.execute("SELECT sql FROM sqlite_master WHERE name = ?", (table,)).fetchone()
+        if row is None or "distance_metric=cosine" in row[0]:
+            continue
+        print(f"  Rebuilding {table} with the cosine distance metric...")
+        cursor.execute(f"CREATE TEMP TABLE {table}_migration AS SELECT chunk_id, embedding FROM {table}")
+        cursor.execute(f"DROP TABLE {table}")
+        cursor.execute(f"""
+            CREATE VIRTUAL TABLE {table} USING vec0(
+                chunk_id INTEGER PRIMARY KEY,
+                embedding float[768] distance_metric=cosine
             );
         """)
-        
+        cursor.execute(f"INSERT INTO {table} (chunk_id, embedding) SELECT chunk_id, embedding FROM {table}_migration")
+        cursor.execute(f"DROP TABLE {table}_migration")
+
+def add_staged_page_tables(cursor):
+    """Adds the tables a streamed document's windows are committed to before they are promoted in one short swap."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS staged_content (
+            doc_id INTEGER NOT NULL,
+            page_number INTEGER NOT NULL,
+            page_content TEXT NOT NULL,
+            FOREIGN KEY (doc_id) REFERENCES documents(id) ON DELETE CASCADE
+        );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_staged_content_doc_id ON staged_content (doc_id);")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS staged_embedding_chunks (
+            id INTEGER PRIMARY KEY,
+            doc_id INTEGER NOT NULL,
+            page_number INTEGER NOT NULL,
+            chunk_text TEXT NOT NULL,
+            embedding BLOB NOT NULL,
+            FOREIGN KEY (doc_id) REFERENCES documents(id) ON DELETE CASCADE
+        );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_staged_embedding_doc_id ON staged_embedding_chunks (doc_id);")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS staged_entity_appearances (
+            doc_id INTEGER NOT NULL,
+            entity_id INTEGER NOT NULL,
+            page_number INTEGER NOT NULL,
+            FOREIGN KEY (doc_id) REFERENCES documents(id) ON DELETE CASCADE,
+            FOREIGN KEY (entity_id) REFERENCES entities(id) ON DELETE CASCADE,
+            PRIMARY KEY (doc_id, entity_id, page_number)
+        ) WITHOUT ROWID;
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS staged_entity_relationships (
+            id INTEGER PRIMARY KEY,
+            subject_entity_id INTEGER NOT NULL,
+            object_entity_id INTEGER NOT NULL,
+            relationship_phrase TEXT NOT NULL,
+            doc_id INTEGER NOT NULL,
+            page_number INTEGER NOT NULL,
+            FOREIGN KEY (subject_entity_id) REFERENCES entities(id) ON DELETE CASCADE,
+            FOREIGN KEY (object_entity_id) REFERENCES entities(id) ON DELETE CASCADE,
+            FOREIGN KEY (doc_id) REFERENCES documents(id) ON DELETE CASCADE
+        );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_staged_rel_doc_id ON staged_entity_relationships (doc_id);")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS staged_super_embedding_chunks (
+            id INTEGER PRIMARY KEY,
+            doc_id INTEGER NOT NULL,
+            page_number INTEGER NOT NULL,
+            entity_id INTEGER NOT NULL,
+            chunk_text TEXT NOT NULL,
+            embedding BLOB NOT NULL,
+            FOREIGN KEY (doc_id) REFERENCES documents(id) ON DELETE CASCADE,
+            FOREIGN KEY (entity_id) REFERENCES entities(id) ON DELETE CASCADE
+        );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_staged_super_embedding_doc_id ON staged_super_embedding_chunks (doc_id);")
+
+def add_document_embedding_model(cursor):
+    """
+    Records which embedding model produced each document's vectors. Documents indexed
+    before this hold vectors from the legacy ollama.embeddings() API, so the task
+    manager re-embeds them with the configured backend.
+    """
+    from project.embedding_backends import LEGACY_OLLAMA_MODEL_ID
+    _add_missing_columns(cursor, "documents", [("embedding_model", "TEXT")])
+    cursor.execute("""
+        UPDATE documents SET embedding_model = ?
+        WHERE embedding_model IS NULL AND id IN (SELECT DISTINCT doc_id FROM embedding_chunks)
+    """, (LEGACY_OLLAMA_MODEL_ID,))
+
+SCHEMA_UPGRADES = [
+    add_boosted_relationships_table,
+    add_document_index_stats_table,
+    add_incremental_indexing_support,
+    add_peak_rss_column,
+    use_cosine_vector_distance,
+    add_staged_page_tables,
+    add_document_embedding_model,
+]
+
+def upgrade_schema(db_path=DATABASE_FILE, verbose=True):
+    """Applies every upgrade step to an existing database."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        conn.enable_load_extension(True)
+        sqlite_vec.load(conn)
+        conn.enable_load_extension(False)
+        cursor = conn.cursor()
+        for step in SCHEMA_UPGRADES:
+            if verbose:
+                print(f"  Applying schema step: {step.__name__}")
+            step(cursor)
         conn.commit()
+    finally:
         conn.close()
-        
+
+if __name__ == '__main__':
+    print(f"--- Connecting to your database at: {DATABASE_FILE} ---")
+    try:
+        upgrade_schema(DATABASE_FILE)
         print("\n[SUCCESS] Your database schema is now up to date.")
         print("You do not need to run this script again.")
-
     except Exception as e:
         print(f"\n[ERROR] An error occurred: {e}")
         print("Please ensure your DATABASE_FILE path in project/config.py is correct.")
-
-if __name__ == '__main__':
-    add_boosted_relationships_table()
\ No newline at end of file